@@ -8,9 +8,19 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
+import sys
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dashboard.settings')
 
 application = get_asgi_application()
+
+# Delete instance data left in the trash and resume lifecycle jobs left behind when the
+# server stopped. Under gunicorn they're started in each worker by gunicorn.conf.py
+# instead, because with --preload this module is imported in the master process and
+# threads don't survive the fork into the workers.
+from main.startup import start_background_tasks
+
+if "gunicorn" not in sys.modules:
+    start_background_tasks()
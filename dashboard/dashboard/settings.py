@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+from django.core.exceptions import ImproperlyConfigured
 from pathlib import Path
 from dotenv import load_dotenv
 from os import getenv
@@ -19,11 +20,37 @@ load_dotenv(dotenv_path=env_path)
 
 AMSYS_TRAEFIK_URL = getenv("AMSYS_TRAEFIK_URL", "http://localhost:8080/")
 AMSYS_TITLE = getenv("AMSYS_TITLE", "Provisioner")
+# When enabled, instance statuses are read from the database and kept up to date by the
+# "reconcile_statuses" management command instead of querying Docker on page loads.
+AMSYS_STATUS_RECONCILER = getenv("AMSYS_STATUS_RECONCILER", "false").lower() == "true"
+# Maximum number of connections the shared Docker client keeps open to the daemon
+AMSYS_DOCKER_POOL_SIZE = int(getenv("AMSYS_DOCKER_POOL_SIZE", "10"))
+# Number of threads per dashboard process that run instance lifecycle jobs
+AMSYS_JOB_WORKERS = int(getenv("AMSYS_JOB_WORKERS", "2"))
+# Seconds after which a running job is considered abandoned by a crashed process
+AMSYS_JOB_TIMEOUT = int(getenv("AMSYS_JOB_TIMEOUT", "3600"))
+# Seconds a single Docker API request or docker compose command may take
+AMSYS_OPERATION_TIMEOUT = int(getenv("AMSYS_OPERATION_TIMEOUT", "300"))
+# Seconds the Traefik proxy state is cached for
+AMSYS_PROXY_STATE_TTL = int(getenv("AMSYS_PROXY_STATE_TTL", "10"))
+# Seconds the list of existing container names used by the instance API is cached for
+AMSYS_CONTAINER_NAMES_TTL = int(getenv("AMSYS_CONTAINER_NAMES_TTL", "10"))
+AMSYS_API_AUTH_CACHE_SIZE = int(getenv("AMSYS_API_AUTH_CACHE_SIZE", "1024"))
+AMSYS_API_AUTH_CACHE_TTL = float(getenv("AMSYS_API_AUTH_CACHE_TTL", "10"))
+AMSYS_TOPOLOGY_POLL_INTERVAL = float(getenv("AMSYS_TOPOLOGY_POLL_INTERVAL", "2"))
+AMSYS_TOPOLOGY_STREAM_DURATION = float(getenv("AMSYS_TOPOLOGY_STREAM_DURATION", "300"))
+AMSYS_SSH_CERT_CACHE_SIZE = int(getenv("AMSYS_SSH_CERT_CACHE_SIZE", "1024"))
+AMSYS_SSH_CERT_MIN_REMAINING = int(getenv("AMSYS_SSH_CERT_MIN_REMAINING", "60"))
+AMSYS_MAP_CACHE_TTL = int(getenv("AMSYS_MAP_CACHE_TTL", "300"))
+AMSYS_INSTANCES_PER_PAGE = int(getenv("AMSYS_INSTANCES_PER_PAGE", "20"))
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 INSTANCE_TEMPLATE_FILES_DIR = BASE_DIR / "instance_template_files"
+# Template file contents by hash, see main/template_store.py. Reflinks only work when this
+# is on the same file system as the instance directories.
+TEMPLATE_STORE_DIR = Path(getenv("AMSYS_TEMPLATE_STORE_PATH", str(BASE_DIR / "template_store")))
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -94,10 +121,67 @@ WSGI_APPLICATION = 'dashboard.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
+AMSYS_DB_ENGINE = getenv("AMSYS_DB_ENGINE", "sqlite").lower()
+AMSYS_DB_PROFILE = getenv("AMSYS_DB_PROFILE", "development").lower()
+
+# PRAGMAs applied to every new SQLite connection by main.database. WAL lets page reads
+# continue while the status reconciler and job workers write.
+SQLITE_PRODUCTION_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": int(getenv("AMSYS_SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+}
+AMSYS_SQLITE_PRAGMAS = {}
+
+if AMSYS_DB_ENGINE == "sqlite":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': getenv("AMSYS_SQLITE_PATH", str(BASE_DIR / 'db.sqlite3')),
+        }
+    }
+
+    if AMSYS_DB_PROFILE == "production":
+        AMSYS_SQLITE_PRAGMAS = SQLITE_PRODUCTION_PRAGMAS
+        # Seconds a connection waits for a lock before raising "database is locked"
+        DATABASES['default']['OPTIONS'] = { 'timeout': int(getenv("AMSYS_SQLITE_BUSY_TIMEOUT", "20")) }
+elif AMSYS_DB_ENGINE == "postgresql":
+    # Several dashboard nodes can share one PostgreSQL database
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': getenv("AMSYS_DB_NAME", "amsys"),
+            'USER': getenv("AMSYS_DB_USER", "amsys"),
+            'PASSWORD': getenv("AMSYS_DB_PASSWORD", ""),
+            'HOST': getenv("AMSYS_DB_HOST", "localhost"),
+            'PORT': getenv("AMSYS_DB_PORT", "5432"),
+            'OPTIONS': { 'connect_timeout': int(getenv("AMSYS_DB_CONNECT_TIMEOUT", "10")) },
+        }
+    }
+
+    if getenv("AMSYS_DB_PGBOUNCER", "false").lower() == "true":
+        # PgBouncer in transaction pooling mode hands each transaction to any server
+        # connection, so nothing may outlive a transaction. Server-side cursors and
+        # prepared statements are tied to the server connection that created them.
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+        DATABASES['default']['OPTIONS']['prepare_threshold'] = None
+else:
+    raise ImproperlyConfigured(f"Unknown AMSYS_DB_ENGINE {AMSYS_DB_ENGINE}, expected sqlite or postgresql")
+
+if AMSYS_DB_PROFILE == "production":
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(getenv("AMSYS_DB_CONN_MAX_AGE", "60")),
+        'CONN_HEALTH_CHECKS': True,
+    })
+
+# Shared by every dashboard process on the host, so the proxy state and container names
+# that the status reconciler updates from Docker events are seen by the web workers too.
+# The cached values come from the host's Docker daemon, which is why a file cache is used
+# rather than the database that several dashboard nodes may share.
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': getenv("AMSYS_CACHE_PATH", str(BASE_DIR / "cache")),
     }
 }
 
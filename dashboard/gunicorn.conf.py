@@ -0,0 +1,15 @@
+# gunicorn settings for the dashboard, used by start-gunicorn.sh.
+# The ASGI application is served with uvicorn workers so that open topology event
+# streams (api/topology_events/<id>/) wait without occupying a worker each. Under WSGI
+# the event stream endpoint responds with 501.
+wsgi_app = "dashboard.asgi:application"
+worker_class = "uvicorn_worker.UvicornWorker"
+bind = "0.0.0.0:8000"
+
+
+def post_worker_init(worker):
+    # Runs in every worker after the application is loaded, also when it was loaded in the
+    # master process with --preload. See dashboard/wsgi.py.
+    from main.startup import start_background_tasks
+
+    start_background_tasks()
@@ -170,6 +170,13 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'Database/db.sqlite3'),
+        # Seconds to wait for a lock before raising "database is locked"
+        'OPTIONS': { 'timeout': 20 },
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        # WAL journaling should be enabled by the app's code, e.g. in AppConfig.ready(), not
+        # here. The mode is stored in the database file, so running
+        # "PRAGMA journal_mode = WAL" once is enough.
     }
 }
 
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import AppInstanceModel, OrganizationEntity, AppPresetModel, TemplateFileModel, AppConnectionModel, LocationModel
+from .models import AppInstanceModel, OrganizationEntity, AppPresetModel, TemplateFileModel, AppConnectionModel, LocationModel, LifecycleJob, TopologyRevision
 
 admin.site.register(AppInstanceModel)
 admin.site.register(OrganizationEntity)
@@ -7,3 +7,5 @@ admin.site.register(LocationModel)
 admin.site.register(AppPresetModel)
 admin.site.register(TemplateFileModel)
 admin.site.register(AppConnectionModel)
+admin.site.register(LifecycleJob)
+admin.site.register(TopologyRevision)
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.http import HttpResponseNotAllowed, HttpResponseForbidden
+from functools import wraps
+from .models import AppInstanceModel
+from .caching import LRUCache
+
+import hashlib
+import hmac
+
+# Instance ID -> SHA-256 digest of the instance's API token. Saves and deletes only
+# invalidate the cache of the process that made them, so entries also expire for changed
+# tokens and deleted instances to stop authenticating in other processes.
+token_digest_cache = LRUCache(settings.AMSYS_API_AUTH_CACHE_SIZE, ttl=settings.AMSYS_API_AUTH_CACHE_TTL)
+
+def get_token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+def get_instance_token_digest(instance_id: int):
+    digest = token_digest_cache.get(instance_id)
+
+    if digest is None:
+        token = AppInstanceModel.objects.filter(pk=instance_id).values_list("api_token", flat=True).first()
+
+        if token is None:
+            return None
+
+        digest = get_token_digest(token)
+        token_digest_cache.set(instance_id, digest)
+
+    return digest
+
+def is_valid_api_token(instance_id, request_api_token) -> bool:
+    if not request_api_token:
+        return False
+
+    try:
+        instance_id = int(instance_id)
+    except ValueError:
+        return False
+
+    digest = get_instance_token_digest(instance_id)
+
+    if digest is None:
+        return False
+
+    # Compare digests in constant time so the token can't be guessed from response times
+    return hmac.compare_digest(digest, get_token_digest(request_api_token))
+
+def instance_api_view(method):
+    # Decorator for the instance Web API. Checks the request method and that the
+    # X-API-Token header matches the token of the instance whose ID is in the URL.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, id, *args, **kwargs):
+            if (request.method != method):
+                return HttpResponseNotAllowed([method])
+
+            if not is_valid_api_token(id, request.headers.get("X-API-Token")):
+                return HttpResponseForbidden()
+
+            return view(request, id, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+@receiver(post_save, sender=AppInstanceModel)
+@receiver(post_delete, sender=AppInstanceModel)
+def invalidate_token_digest(sender, instance, **kwargs):
+    token_digest_cache.delete(instance.pk)
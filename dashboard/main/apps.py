@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        # Connects the signal receivers that invalidate cached API token digests and
+        # template file syncs, bump the topology revision and configure database connections
+        from . import api_auth, topology, database, template_files
@@ -0,0 +1,46 @@
+from django.db import transaction
+from .models import AppInstanceModel, AppStatusEnum, JobActionEnum
+from .jobs import enqueue_jobs, get_active_jobs
+
+BULK_ACTIONS = {
+    "pause": JobActionEnum.PAUSE,
+    "stop": JobActionEnum.STOP,
+    "start": JobActionEnum.START,
+    "restart": JobActionEnum.RESTART,
+}
+
+def select_instances(location=None, organization=None, status=None, app_names=None):
+    # Returns None if no selector was given, so callers can't act on every instance by accident
+    if location is None and organization is None and status is None and app_names is None:
+        return None
+
+    instances = AppInstanceModel.objects.all()
+
+    if location is not None:
+        instances = instances.filter(location__pk=location)
+
+    if organization is not None:
+        instances = instances.filter(location__owner_org__pk=organization)
+
+    if status is not None:
+        instances = instances.filter(status=AppStatusEnum[status].value)
+
+    if app_names is not None:
+        instances = instances.filter(app_name__in=app_names)
+
+    return instances
+
+def start_bulk_action(action, instances):
+    # Queues a lifecycle job for every instance. The job workers run them concurrently and
+    # the caller follows their progress through the jobs. Instances that already have an
+    # unfinished job are skipped so two operations never run on the same instance.
+    # Returns the new jobs and the skipped instances.
+    instances = list(instances)
+
+    with transaction.atomic():
+        busy_pks = set(get_active_jobs().filter(instance__in=instances)
+                       .values_list("instance", flat=True))
+        skipped = [instance for instance in instances if instance.pk in busy_pks]
+        jobs = enqueue_jobs(BULK_ACTIONS[action], [instance for instance in instances if instance.pk not in busy_pks])
+
+    return jobs, skipped
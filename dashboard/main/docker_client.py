@@ -0,0 +1,79 @@
+from django.conf import settings
+
+import threading
+import time
+import docker
+import requests
+
+# Seconds between pings that make sure the shared client can still reach the daemon
+HEALTH_CHECK_INTERVAL = 30
+# Seconds a health check ping may take before the daemon is considered unreachable
+HEALTH_CHECK_TIMEOUT = 5
+
+_client = None
+_client_lock = threading.Lock()
+_last_health_check = 0.0
+
+def _create_client():
+    return docker.from_env(max_pool_size=settings.AMSYS_DOCKER_POOL_SIZE, timeout=settings.AMSYS_OPERATION_TIMEOUT)
+
+def _is_healthy(client):
+    try:
+        return client.ping(timeout=HEALTH_CHECK_TIMEOUT)
+    except (docker.errors.DockerException, requests.exceptions.RequestException):
+        return False
+
+def get_docker_client():
+    # Returns the process wide Docker client. It is created on first use and shared by
+    # all threads. Its connection pool is bounded by AMSYS_DOCKER_POOL_SIZE.
+    # The lock is only held to read or swap the client. Pinging and connecting talk to the
+    # daemon, so a slow daemon would otherwise block every thread that needs the client.
+    global _client, _last_health_check
+
+    with _client_lock:
+        client = _client
+        needs_check = client is not None and time.monotonic() - _last_health_check > HEALTH_CHECK_INTERVAL
+
+        if needs_check:
+            # Only this thread checks, the others keep using the client in the meantime
+            _last_health_check = time.monotonic()
+
+    if client is not None and (not needs_check or _is_healthy(client)):
+        return client
+
+    # Connecting asks the daemon for its API version
+    new_client = _create_client()
+
+    with _client_lock:
+        # The client may also have been reset in the meantime
+        if _client is client or _client is None:
+            old_client = _client
+            _client = new_client
+            _last_health_check = time.monotonic()
+        else:
+            # Another thread replaced the client first
+            old_client = new_client
+            new_client = _client
+
+    _close_client(old_client)
+    return new_client
+
+def reset_docker_client():
+    # Drops the shared client so the next get_docker_client() call reconnects.
+    # Call this after a connection error.
+    global _client
+
+    with _client_lock:
+        old_client = _client
+        _client = None
+
+    _close_client(old_client)
+
+def _close_client(client):
+    if client is None:
+        return
+
+    try:
+        client.close()
+    except Exception:
+        pass
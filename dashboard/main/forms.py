@@ -1,10 +1,9 @@
 from django import forms
-from django.conf import settings
 from .models import AppStatusEnum, OrganizationEntity, AppInstanceModel, TemplateFileModel, AppPresetModel, LocationModel
+from .template_files import sync_template_files
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import HTML, Layout, Div, Submit
 from crispy_forms.bootstrap import StrictButton
-import os
 
 class OrganizationEntityForm(forms.ModelForm):
     class Meta:
@@ -25,22 +24,6 @@ class LocationForm(forms.ModelForm):
         # Prevent crispy from rendering a form element for us. We define it in the template.
         self.helper.form_tag = False
 
-
-def update_instance_template_file_selection():
-    files = os.listdir(settings.INSTANCE_TEMPLATE_FILES_DIR)
-    template_files = TemplateFileModel.objects.all()
-
-    for tf in template_files:
-        if tf.filename not in files:
-            tf.delete()
-
-    for file in files:
-        filepath = f"{settings.INSTANCE_TEMPLATE_FILES_DIR}/{file}"
-
-        if not TemplateFileModel.objects.filter(filepath=filepath).exists():
-            template_file = TemplateFileModel(filename=file, filepath=filepath)
-            template_file.save()
-
 class AppInstanceForm(forms.ModelForm):
     transmit_destinations = forms.ModelMultipleChoiceField(
             queryset=AppInstanceModel.objects.all(),
@@ -74,7 +57,7 @@ class AppInstanceForm(forms.ModelForm):
 
         super().__init__(*args, **kwargs)
 
-        update_instance_template_file_selection()
+        sync_template_files()
 
         instance_arg = kwargs.get("instance", None)
         if (instance_arg):
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from .models import AppInstanceModel, AppStatusEnum
+from .instance_status import get_instance_statuses
+
+import urllib.parse
+
+INSTANCE_FILTERS = ["status", "location", "organization", "name"]
+
+def filter_instances(instances, params):
+    # Raises ValueError for malformed filter values
+    status = params.get("status")
+    location = params.get("location")
+    organization = params.get("organization")
+    name = params.get("name")
+
+    if status:
+        if status not in AppStatusEnum.__members__:
+            raise ValueError(f"Unknown status {status}")
+
+        instances = instances.filter(status=AppStatusEnum[status].value)
+
+    if location:
+        instances = instances.filter(location__pk=int(location))
+
+    if organization:
+        instances = instances.filter(location__owner_org__pk=int(organization))
+
+    if name:
+        instances = instances.filter(app_name__startswith=name)
+
+    return instances
+
+def get_instance_page(params, instances=None):
+    # Returns the requested page of instances and their status entries. Only the
+    # instances on the page are checked against Docker.
+    if instances is None:
+        instances = AppInstanceModel.objects.all()
+
+    instances = filter_instances(instances, params).select_related("location__owner_org").order_by("app_name")
+    page = Paginator(instances, settings.AMSYS_INSTANCES_PER_PAGE).get_page(params.get("page"))
+
+    return page, get_instance_statuses(page.object_list)
+
+def get_filter_query(params):
+    # Query string of the active filters, used to keep them in pagination links
+    return urllib.parse.urlencode({ x: params[x] for x in INSTANCE_FILTERS if params.get(x) })
+
+def status_entry_as_dict(status_entry):
+    inst = status_entry["instance"]
+
+    return {
+        "id": inst.pk,
+        "app_name": inst.app_name,
+        "url_path": inst.url_path,
+        "using_compose": inst.using_compose,
+        "created_at": inst.created_at,
+        "location": inst.location.location_name,
+        "organization": inst.location.owner_org.org_name,
+        "status": status_entry["status"],
+        "status_message": status_entry["status_message"],
+        "is_error": status_entry["is_error"],
+        "target_containers": status_entry["target_containers"]
+    }
+
+def page_as_dict(page, instance_statuses):
+    return {
+        "instances": [status_entry_as_dict(x) for x in instance_statuses],
+        "page": page.number,
+        "num_pages": page.paginator.num_pages,
+        "count": page.paginator.count,
+        "has_next": page.has_next()
+    }
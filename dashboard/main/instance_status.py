@@ -0,0 +1,236 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import AppInstanceModel, AppStatusEnum
+from .docker_client import get_docker_client
+from .topology import bump_topology_revision
+
+import docker
+import requests
+
+CONTAINER_NAMES_CACHE_KEY = "amsys:container_names"
+
+def get_container_inventory(docker_client, filters=None):
+    # List every container once and index them so instance statuses can be resolved
+    # without a Docker API round trip per instance. The low level API is used because
+    # containers.list() inspects each container separately.
+    containers_by_project = {}
+    containers_by_name = {}
+
+    for raw in docker_client.api.containers(all=True, filters=filters):
+        names = raw.get("Names") or []
+        name = names[0].lstrip("/") if len(names) > 0 else raw["Id"]
+        container = { "name": name, "status": raw.get("State") }
+        labels = raw.get("Labels") or {}
+        project = labels.get("com.docker.compose.project")
+
+        if project is not None:
+            containers_by_project.setdefault(project, []).append(container)
+
+        containers_by_name[name] = container
+
+    if filters is None:
+        # A full listing is a free refresh of the cached container names
+        cache.set(CONTAINER_NAMES_CACHE_KEY, set(containers_by_name.keys()), settings.AMSYS_CONTAINER_NAMES_TTL)
+
+    return {
+        "by_project": containers_by_project,
+        "by_name": containers_by_name
+    }
+
+def get_container_names():
+    # Names of all existing containers, running or not. Cached so that the instance API
+    # doesn't need a Docker call on every request.
+    names = cache.get(CONTAINER_NAMES_CACHE_KEY)
+
+    if names is None:
+        try:
+            names = set(get_container_inventory(get_docker_client())["by_name"].keys())
+        except (docker.errors.DockerException, requests.exceptions.RequestException) as e:
+            print(f"Failed to list containers: {e}")
+            return set()
+
+    return names
+
+def invalidate_container_names():
+    cache.delete(CONTAINER_NAMES_CACHE_KEY)
+
+def get_instance_container_filters(inst):
+    if inst.using_compose:
+        return { "label": f"com.docker.compose.project={inst.app_name}" }
+
+    return { "name": inst.app_name }
+
+def resolve_instance_status(inst, inventory):
+    # Sets inst.status to match the instance's containers in the given inventory.
+    # The instance is not saved. Returns the status entry used by the templates.
+    containers = []
+
+    if inst.using_compose:
+        for c in inventory["by_project"].get(inst.app_name, []):
+            if inst.app_name not in c["name"]:
+                # Skip containers that don't include the app name
+                continue
+            containers.append(c)
+    else:
+        # Image based apps always run in a single container named after the app
+        container = inventory["by_name"].get(inst.app_name)
+
+        if container is not None:
+            containers.append(container)
+
+    if len(containers) == 0:
+        if inst.status != AppStatusEnum.STOPPED.value and inst.status != AppStatusEnum.REMOVED.value:
+            inst.status = AppStatusEnum.MISSING.value
+
+        return get_status_entry(inst, [])
+
+    stopped_containers = []
+    running_containers = []
+
+    for c in containers:
+        if c["status"] == "running":
+            running_containers.append(c["name"])
+        else:
+            if inst.status != AppStatusEnum.REMOVED.value:
+                inst.status = AppStatusEnum.PAUSED.value
+
+            stopped_containers.append(c["name"])
+
+    if len(stopped_containers) == 0:
+        inst.status = AppStatusEnum.RUNNING.value
+        return get_status_entry(inst, running_containers)
+    elif len(running_containers) == 0:
+        return get_status_entry(inst, stopped_containers)
+    else:
+        # This should only happen when running with compose and not
+        # all containers are working
+        inst.status = AppStatusEnum.ERROR.value
+        return get_status_entry(inst, stopped_containers)
+
+def get_status_entry(inst, target_containers):
+    # Builds the status entry shown in instance listings from the stored status.
+    status = AppStatusEnum(inst.status)
+    is_error = True
+
+    if status == AppStatusEnum.RUNNING:
+        message = "All containers running"
+        is_error = False
+    elif status == AppStatusEnum.PAUSED \
+            or (status == AppStatusEnum.REMOVED and len(target_containers) > 0):
+        # Removed instances can still have stopped containers
+        message = "Containers are stopped"
+        is_error = False
+    elif status == AppStatusEnum.STOPPED:
+        message = "Containers removed."
+    elif status == AppStatusEnum.REMOVED:
+        message = "Containers removed. Data removed!"
+    elif status == AppStatusEnum.MISSING:
+        message = "Instance corrupted! Containers are missing. Data may be recoverable."
+    else:
+        message = "Some containers are not running!"
+
+    return {
+        "instance": inst,
+        "status": status.name,
+        "target_containers": target_containers,
+        "status_message": message,
+        "is_error": is_error
+    }
+
+def get_instance_statuses(instances=None):
+    # When instances are given, only their containers are listed
+    filters = None
+
+    if instances is None:
+        instances = AppInstanceModel.objects.all()
+    else:
+        instances = list(instances)
+        # Compose container names include the app name as well, so a name filter
+        # finds the containers of both kinds of apps
+        filters = { "name": [inst.app_name for inst in instances] }
+
+    if settings.AMSYS_STATUS_RECONCILER:
+        # The reconciler keeps the stored statuses up to date, so there is no need
+        # to ask Docker during the request.
+        return [get_db_instance_status(inst) for inst in instances]
+
+    if len(instances) == 0:
+        return []
+
+    docker_client = get_docker_client()
+    inventory = get_container_inventory(docker_client, filters=filters)
+    instance_statuses = []
+    changed_instances = []
+
+    for inst in instances:
+        old_status = inst.status
+        instance_statuses.append(resolve_instance_status(inst, inventory))
+
+        if inst.status != old_status:
+            changed_instances.append(inst)
+
+    save_instance_statuses(changed_instances)
+
+    return instance_statuses
+
+def save_instance_statuses(instances):
+    if len(instances) == 0:
+        return
+
+    with transaction.atomic():
+        AppInstanceModel.objects.bulk_update(instances, ["status"])
+        # bulk_update doesn't send post_save
+        bump_topology_revision()
+
+def get_db_instance_status(inst):
+    target_containers = []
+
+    # Compose container names are only known by Docker
+    if not inst.using_compose and inst.status in [AppStatusEnum.RUNNING.value, AppStatusEnum.PAUSED.value, AppStatusEnum.ERROR.value]:
+        target_containers = [inst.app_name]
+
+    return get_status_entry(inst, target_containers)
+
+def reconcile_instance(docker_client, inst):
+    # Re-reads the containers of a single instance and stores its status if it changed.
+    # Returns True if the status changed.
+    inventory = get_container_inventory(docker_client, filters=get_instance_container_filters(inst))
+    old_status = inst.status
+    resolve_instance_status(inst, inventory)
+
+    if inst.status == old_status:
+        return False
+
+    inst.save(update_fields=["status"])
+    return True
+
+def reconcile_all_instances(docker_client):
+    inventory = get_container_inventory(docker_client)
+    changed_instances = []
+
+    for inst in AppInstanceModel.objects.all():
+        old_status = inst.status
+        resolve_instance_status(inst, inventory)
+
+        if inst.status != old_status:
+            changed_instances.append(inst)
+
+    save_instance_statuses(changed_instances)
+
+    return len(changed_instances)
+
+def find_event_instance(event):
+    # Maps a Docker container event to the instance that owns the container
+    attributes = event.get("Actor", {}).get("Attributes", {})
+    project = attributes.get("com.docker.compose.project")
+
+    if project is not None:
+        return AppInstanceModel.objects.filter(app_name=project, using_compose=True).first()
+
+    name = attributes.get("name")
+
+    if name is None:
+        return None
+
+    return AppInstanceModel.objects.filter(app_name=name, using_compose=False).first()
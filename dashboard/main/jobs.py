@@ -0,0 +1,154 @@
+from typing import Iterable, List
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from .models import LifecycleJob, JobStatusEnum, JobActionEnum, AppInstanceModel
+from . import lifecycle
+
+import threading
+import traceback
+
+JOB_HANDLERS = {
+    JobActionEnum.CREATE.value: lifecycle.create_instance_job,
+    JobActionEnum.RESTART.value: lifecycle.restart_instance_job,
+    JobActionEnum.RECREATE.value: lifecycle.recreate_instance_job,
+    JobActionEnum.PAUSE.value: lifecycle.pause_instance_job,
+    JobActionEnum.STOP.value: lifecycle.stop_instance_job,
+    JobActionEnum.START.value: lifecycle.start_instance_job,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.AMSYS_JOB_WORKERS, thread_name_prefix="amsys-job")
+
+        return _executor
+
+def get_abandoned_cutoff():
+    # Running jobs started before this were cut off by a crash or restart of their process
+    return timezone.now() - timedelta(seconds=settings.AMSYS_JOB_TIMEOUT)
+
+def get_active_jobs():
+    # Queued and running jobs. Abandoned jobs don't block their instance even before
+    # fail_abandoned_jobs has marked them as failed.
+    return LifecycleJob.objects.filter(Q(status=JobStatusEnum.QUEUED.value)
+                                       | Q(status=JobStatusEnum.RUNNING.value, started_at__gte=get_abandoned_cutoff()))
+
+def get_active_job(instance: AppInstanceModel):
+    return get_active_jobs().filter(instance=instance).first()
+
+def fail_abandoned_jobs(jobs=None):
+    # Returns the number of failed jobs
+    jobs = LifecycleJob.objects.all() if jobs is None else jobs
+
+    return jobs.filter(status=JobStatusEnum.RUNNING.value, started_at__lt=get_abandoned_cutoff()) \
+        .update(status=JobStatusEnum.FAILED.value, message="The job was interrupted. Try again.",
+                finished_at=timezone.now())
+
+def enqueue_job(action: JobActionEnum, instance: AppInstanceModel, payload=None) -> LifecycleJob:
+    job = LifecycleJob.objects.create(action=action.value, instance=instance, app_name=instance.app_name,
+                                      payload=payload or {}, created_at=timezone.now())
+
+    # Jobs are stored in the database first so that any worker can pick them up
+    transaction.on_commit(lambda: get_executor().submit(process_jobs))
+
+    return job
+
+def enqueue_jobs(action: JobActionEnum, instances: Iterable[AppInstanceModel]) -> List[LifecycleJob]:
+    # Creates one job per instance with a single query
+    now = timezone.now()
+    jobs = LifecycleJob.objects.bulk_create([
+        LifecycleJob(action=action.value, instance=instance, app_name=instance.app_name, created_at=now)
+        for instance in instances
+    ])
+
+    # Each call runs jobs until the queue is empty, so one per worker is enough
+    for _ in range(min(len(jobs), settings.AMSYS_JOB_WORKERS)):
+        transaction.on_commit(lambda: get_executor().submit(process_jobs))
+
+    return jobs
+
+def claim_next_job():
+    queued_jobs = LifecycleJob.objects.filter(status=JobStatusEnum.QUEUED.value).order_by("created_at")
+
+    for job in queued_jobs[:10]:
+        # Conditional update so only one worker (thread or process) gets the job
+        claimed = LifecycleJob.objects.filter(pk=job.pk, status=JobStatusEnum.QUEUED.value) \
+            .update(status=JobStatusEnum.RUNNING.value, started_at=timezone.now())
+
+        if claimed == 1:
+            job.refresh_from_db()
+            return job
+
+    return None
+
+def run_job(job: LifecycleJob):
+    handler = JOB_HANDLERS[job.action]
+
+    try:
+        if job.instance is None:
+            raise lifecycle.LifecycleError("The instance no longer exists")
+
+        job.message = handler(job) or ""
+        job.status = JobStatusEnum.SUCCEEDED.value
+    except lifecycle.LifecycleError as e:
+        job.message = str(e)
+        job.status = JobStatusEnum.FAILED.value
+    except Exception as e:
+        traceback.print_exc()
+        job.message = f"Unexpected error: {e}"
+        job.status = JobStatusEnum.FAILED.value
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=["message", "status", "finished_at"])
+
+def process_jobs():
+    # Runs queued jobs until there are none left
+    try:
+        fail_abandoned_jobs()
+
+        while True:
+            job = claim_next_job()
+
+            if job is None:
+                break
+
+            run_job(job)
+    finally:
+        # Worker threads don't go through the request cycle that normally closes connections.
+        # Callers inside a transaction keep theirs, closing it would abort the transaction.
+        if not connection.in_atomic_block:
+            connection.close()
+
+def recover_jobs():
+    # Called when a dashboard process starts. Jobs that were running in a process that
+    # crashed or was restarted would block their instance forever, so running jobs older
+    # than AMSYS_JOB_TIMEOUT are failed. Queued jobs are handed to this process's workers.
+    # Returns the number of failed jobs.
+    failed = fail_abandoned_jobs()
+
+    if LifecycleJob.objects.filter(status=JobStatusEnum.QUEUED.value).exists():
+        get_executor().submit(process_jobs)
+
+    return failed
+
+def job_as_dict(job: LifecycleJob):
+    return {
+        "id": job.pk,
+        "action": job.action,
+        "app_name": job.app_name,
+        "status": JobStatusEnum(job.status).name,
+        "progress": job.progress,
+        "message": job.message,
+        "finished": job.is_finished(),
+        "created_at": job.created_at,
+        "finished_at": job.finished_at
+    }
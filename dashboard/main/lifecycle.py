@@ -0,0 +1,556 @@
+from typing import Dict, List, Tuple
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from .models import AppInstanceModel, AppPresetModel, TemplateFileModel, AppConnectionModel, AppStatusEnum, LifecycleJob
+from .docker_client import get_docker_client
+from .instance_status import invalidate_container_names
+from .template_store import provision_template_files
+from .trash import move_to_trash
+
+from subprocess import run, TimeoutExpired
+from pathlib import Path
+import functools
+import json
+import os
+import docker
+import requests
+
+class LifecycleError(Exception):
+    # Raised by lifecycle operations. The message is shown to the user.
+    pass
+
+class ContainerMissingError(LifecycleError):
+    # The instance's container doesn't exist. The instance has been marked as missing.
+    pass
+
+class ContainerApiError(LifecycleError):
+    pass
+
+class OperationTimeoutError(LifecycleError):
+    # Docker or docker compose didn't finish within AMSYS_OPERATION_TIMEOUT
+    pass
+
+def lifecycle_operation(operation):
+    # The shared Docker client gives up on requests after AMSYS_OPERATION_TIMEOUT seconds.
+    # Its timeouts are reported like any other lifecycle error so a hung daemon fails the
+    # operation instead of holding a job worker.
+    @functools.wraps(operation)
+    def wrapper(*args, **kwargs):
+        try:
+            return operation(*args, **kwargs)
+        except requests.exceptions.Timeout:
+            raise OperationTimeoutError(f"Docker didn't respond within {settings.AMSYS_OPERATION_TIMEOUT} seconds. Try again later.")
+        finally:
+            # Containers were created or removed, even if the operation failed halfway
+            invalidate_container_names()
+
+    return wrapper
+
+def get_amsys_path():
+    return Path(__file__).resolve().parent.parent
+
+def get_instance_base_path():
+    amsys_path = get_amsys_path()
+    default_instance_base = str(amsys_path.parent)
+    return os.getenv("AMSYS_INSTANCE_BASE_PATH", default_instance_base)
+
+def get_instance_path(app_name):
+    instance_path = get_instance_base_path() + f"/{app_name}"
+
+    if not os.path.exists(instance_path):
+        os.mkdir(instance_path)
+
+    return instance_path
+
+class ImageBasedAppAdvancedSettings:
+    def __init__(self, env_vars = [], labels = [], volumes = [],
+                 env_dict = {}, labels_dict = {}, volumes_dict = {}) -> None:
+        self.env_vars: List[Tuple[str, str]] = env_vars
+        self.labels: List[Tuple[str, str]] = labels
+        self.volumes: List[Tuple[str, str]] = volumes
+        self.env_dict: Dict = env_dict
+        self.labels_dict: Dict = labels_dict
+        self.volumes_dict: Dict = volumes_dict
+
+    @classmethod
+    def from_instance(cls, instance: AppInstanceModel) -> 'ImageBasedAppAdvancedSettings':
+        env_dict = instance.instance_environment_variables
+        labels_dict = instance.instance_labels
+        volumes_dict = instance.instance_volumes
+        env_vars = [(key, env_dict[key]) for key in env_dict.keys()]
+        labels = [(key, labels_dict[key]) for key in labels_dict.keys()]
+        volumes = [(key, volumes_dict[key]) for key in volumes_dict.keys()]
+
+        return cls(env_vars=env_vars, labels=labels, volumes=volumes, env_dict=env_dict,
+                   labels_dict=labels_dict, volumes_dict=volumes_dict)
+
+    @classmethod
+    def get_base_env(cls, url_path: str, api_token: str, instance_pk: str) -> Dict:
+        return {
+            # TODO: Rename this env var to AMSYS_URL_PATH.
+            # This is what apps use to determine the path where they are hosted.
+            "AMSYS_APP_NAME": url_path,
+            "AMSYS_API_TOKEN": api_token,
+            "AMSYS_APP_ID": instance_pk,
+            # TODO: It would probably make sense to make the port an env var
+            "AMSYS_API_BASE_URL": "http://host.docker.internal:8000/api",
+            "AMSYS_SSH_INSTANCE_KEY": "~/.ssh/instance_key.pub"
+        }
+
+    @classmethod
+    def get_base_labels(cls, app_name: str, url_path: str) -> Dict:
+        return {
+            "traefik.enable": "true",
+            f"traefik.http.routers.{app_name}-router.rule": f"PathPrefix(\"/{url_path}\")",
+            f"traefik.http.services.{app_name}-service.loadbalancer.server.port": "8000",
+            f"traefik.http.middlewares.{app_name}-strip.stripprefix.prefixes": f"/{url_path}",
+            f"traefik.http.routers.{app_name}-router.middlewares": f"{app_name}-strip@docker"
+        }
+
+    @classmethod
+    def get_base_volumes(cls) -> Dict:
+        amsys_path = get_amsys_path()
+
+        return {
+            f"{amsys_path}/ssh/instance_ca.pub": { "bind": "/etc/ssh/instance_ca.pub", "mode": "ro" }
+        }
+
+    def set_env_vars(self, env_keys: List[str], env_vals: List[str]) -> None:
+        self.env_vars = list(zip(env_keys, env_vals))
+        env_dict = {}
+
+        for key, value in self.env_vars:
+            env_dict[key] = value
+
+        self.env_dict = env_dict
+
+    def set_labels(self, label_keys: List[str], label_vals: List[str]) -> None:
+        self.labels = list(zip(label_keys, label_vals))
+        labels_dict = {}
+
+        for key, value in self.labels:
+            labels_dict[key] = value
+
+        self.labels_dict = labels_dict
+
+    def set_volumes(self, volume_keys: List[str], volume_vals: List[str]) -> None:
+        self.volumes = list(zip(volume_keys, volume_vals))
+        volumes_dict = {}
+
+        # for entry in self.volumes:
+        #     volumes_dict[f"{instance_path}/{entry[0]}"] = {
+        #         "bind": entry[1],
+        #         "mode": "rw"
+        #     }
+
+        for key, value in self.volumes:
+            volumes_dict[key] = value
+
+        self.volumes_dict = volumes_dict
+
+    def get_full_env_as_dict(self, url_path: str, api_token: str, instance_pk: str) -> Dict:
+        env = ImageBasedAppAdvancedSettings.get_base_env(url_path, api_token, instance_pk)
+        env.update(self.env_dict)
+        return env
+
+    def get_full_env_as_json_string(self, url_path: str, api_token: str, instance_pk: str) -> str:
+        env = self.get_full_env_as_dict(url_path, api_token, instance_pk)
+        return json.dumps(env)
+
+    def get_full_labels_as_dict(self, app_name: str, url_path: str) -> Dict:
+        labels = ImageBasedAppAdvancedSettings.get_base_labels(app_name, url_path)
+        labels.update(self.labels_dict)
+        return labels
+
+    def get_full_labels_as_json_string(self, app_name: str, url_path: str) -> str:
+        labels = self.get_full_labels_as_dict(app_name, url_path)
+        return json.dumps(labels)
+
+    def get_full_volumes_as_dict(self, instance_path: str) -> Dict:
+        volumes = ImageBasedAppAdvancedSettings.get_base_volumes()
+        full_volumes_dict = {}
+
+        for key in self.volumes_dict.keys():
+            full_volumes_dict[f"{instance_path}/{key}"] = {
+                "bind": self.volumes_dict[key],
+                "more": "rw"
+            }
+
+        volumes.update(full_volumes_dict)
+
+        return volumes
+
+    def get_full_volumes_as_json_string(self, instance_path: str) -> str:
+        volumes = self.get_full_volumes_as_dict(instance_path)
+        return json.dumps(volumes)
+
+# TODO: Rename or actually set all the advanced settings
+def set_instance_advanced_settings(instance: AppInstanceModel, settings: ImageBasedAppAdvancedSettings) -> None:
+    instance.instance_environment_variables = settings.env_dict
+    instance.instance_labels = settings.labels_dict
+    instance.instance_volumes = settings.volumes_dict
+    instance.save()
+
+def create_app_from_image(advanced_settings: ImageBasedAppAdvancedSettings, container_image: str,
+                          container_user: str, app_instance: AppInstanceModel, instance_path: str,
+                          template_files: List[TemplateFileModel], preset_name: str | None = None):
+    if container_user == "root" or container_user == "root:root":
+        container_user = ""
+
+    # preset_name = request.POST.get("preset_name", None)
+    set_instance_advanced_settings(app_instance, advanced_settings)
+    docker_client = get_docker_client()
+
+    app_name = str(app_instance.app_name)
+    url_path = str(app_instance.url_path)
+    api_token = str(app_instance.api_token)
+    full_env = advanced_settings.get_full_env_as_dict(url_path, api_token, str(app_instance.pk))
+    full_labels = advanced_settings.get_full_labels_as_dict(app_name, url_path)
+    full_volumes = advanced_settings.get_full_volumes_as_dict(instance_path)
+
+    try:
+        docker_client.containers.run(
+            image=container_image,
+            environment=full_env,
+            labels=full_labels,
+            volumes=full_volumes,
+            detach=True,
+            network="amsys-net",
+            user=container_user,
+            name=app_name)
+    except docker.errors.ImageNotFound:
+        print(f"Container image '{container_image}' not found.")
+        return False
+    except (docker.errors.APIError, requests.exceptions.Timeout) as e:
+        print("Docker API error:")
+        print(e)
+
+        try:
+            app_container = docker_client.containers.get(app_name)
+            app_container.remove(force=True)
+        except:
+            pass
+
+        return False
+
+    if preset_name is not None:
+        preset = AppPresetModel(
+            preset_name=preset_name,
+            container_image=container_image,
+            container_user=container_user,
+            instance_directories=app_instance.instance_directories,
+            instance_labels=advanced_settings.labels_dict,
+            instance_volumes=advanced_settings.volumes_dict,
+            instance_environment_variables=advanced_settings.env_dict)
+
+        preset.save()
+        preset.template_files.set(template_files)
+        preset.save()
+
+    return True
+
+def write_compose_file(compose_file: UploadedFile, instance_path: str):
+    with open(f"{instance_path}/docker-compose.yaml", "wb+") as destination:
+        for chunk in compose_file.chunks():
+            destination.write(chunk)
+
+def create_app_from_compose(instance_path: str, app_name: str):
+    # Set the compose project name with -p so it can be used to filter container lists.
+    # This way the compose file can create containers with any name and still the amsys
+    # app can find them.
+    start_compose_result = run_compose(app_name, instance_path, ["up", "-d"])
+
+    if start_compose_result.returncode != 0:
+        print(start_compose_result.stdout)
+        print(start_compose_result.stderr)
+        return False
+
+    return True
+
+def provision_instance_files(instance: AppInstanceModel, instance_path: str):
+    provision_template_files(instance.template_files.all(), instance_path)
+
+    dir_entries = instance.instance_directories
+
+    # TODO: make sure the user doesn't create any weird directories outside the instance dir
+    for dir_path in dir_entries:
+        path_in_instance = f"{instance_path}/{dir_path}"
+        if not os.path.exists(path_in_instance):
+            os.makedirs(path_in_instance)
+
+def run_compose(app_name: str, instance_path: str, command: List[str]):
+    # docker compose is killed if it hangs, e.g. on an unresponsive daemon
+    try:
+        return run(["docker", "compose", "-p", app_name] + command, cwd=instance_path, capture_output=True, text=True,
+                   timeout=settings.AMSYS_OPERATION_TIMEOUT)
+    except TimeoutExpired:
+        raise OperationTimeoutError(f"docker compose {' '.join(command)} didn't finish within "
+                                    f"{settings.AMSYS_OPERATION_TIMEOUT} seconds.")
+
+def run_compose_command(instance: AppInstanceModel, instance_path: str, command: List[str], error_message: str):
+    compose_result = run_compose(instance.app_name, instance_path, command)
+
+    if compose_result.returncode != 0:
+        print(compose_result.stdout)
+        print(compose_result.stderr)
+        raise LifecycleError(f"{error_message} Error code {compose_result.returncode}")
+
+def get_app_container(instance: AppInstanceModel):
+    try:
+        return get_docker_client().containers.get(instance.app_name)
+    except docker.errors.NotFound:
+        instance.status = AppStatusEnum.MISSING.value
+        instance.save()
+
+        raise ContainerMissingError("App container not found! Some data may be lost.")
+    except docker.errors.APIError:
+        raise ContainerApiError("Container API error. Try again later.")
+
+@lifecycle_operation
+def pause_app(instance: AppInstanceModel, should_kill=False):
+    instance_path = get_instance_path(instance.app_name)
+
+    if (instance.using_compose):
+        command = ["kill"] if should_kill else ["stop"]
+        run_compose_command(instance, instance_path, command, "App failed to pause.")
+    else:
+        app_container = get_app_container(instance)
+
+        try:
+            if should_kill:
+                app_container.kill()
+            else:
+                app_container.stop()
+        except docker.errors.APIError:
+            raise ContainerApiError("Container API error. Try again later.")
+
+    instance.status = AppStatusEnum.PAUSED.value
+    instance.save()
+
+@lifecycle_operation
+def stop_app(instance: AppInstanceModel):
+    instance_path = get_instance_path(instance.app_name)
+
+    if (instance.using_compose):
+        run_compose_command(instance, instance_path, ["stop"], "App failed to stop.")
+    else:
+        app_container = get_app_container(instance)
+
+        try:
+            app_container.stop()
+            app_container.remove(v=True, force=True)
+        except docker.errors.APIError:
+            raise ContainerApiError("Container API error. Try again later.")
+
+    instance.status = AppStatusEnum.STOPPED.value
+    instance.save()
+
+@lifecycle_operation
+def start_app(instance: AppInstanceModel):
+    instance_path = get_instance_path(instance.app_name)
+
+    if (instance.using_compose):
+        run_compose_command(instance, instance_path, ["start"], "Failed to start instance.")
+    else:
+        app_container = get_app_container(instance)
+
+        try:
+            app_container.start()
+        except docker.errors.APIError:
+            raise ContainerApiError("Container API error. Try again later.")
+
+    instance.status = AppStatusEnum.RUNNING.value
+    instance.save()
+
+@lifecycle_operation
+def remove_app(instance: AppInstanceModel):
+    # Returns a warning message if the removal succeeded with problems
+    instance_path = get_instance_path(instance.app_name)
+    warning = None
+
+    if (instance.using_compose):
+        run_compose_command(instance, instance_path, ["down"], "Failed to remove instance.")
+    else:
+        try:
+            app_container = get_docker_client().containers.get(instance.app_name)
+            app_container.remove(v=True, force=True)
+        except docker.errors.NotFound:
+            warning = "App container not found! Removing data."
+        except docker.errors.APIError:
+            raise ContainerApiError("Container API error. Try again later.")
+
+    # TODO: Ensure the app name can't change the instance path to something weird
+    # The data is deleted in the background
+    move_to_trash(instance_path)
+
+    instance.status = AppStatusEnum.REMOVED.value
+    instance.save()
+
+    return warning
+
+def no_progress(progress):
+    pass
+
+@lifecycle_operation
+def create_app(instance: AppInstanceModel, preset_name=None, transmit_destinations=[], report_progress=no_progress):
+    instance_path = get_instance_path(instance.app_name)
+
+    report_progress("Copying template files")
+    provision_instance_files(instance, instance_path)
+
+    report_progress("Starting containers")
+
+    try:
+        if instance.using_compose:
+            # The view saves the uploaded compose file into the instance directory
+            started_successfully = create_app_from_compose(instance_path, instance.app_name)
+        else:
+            advanced_settings = ImageBasedAppAdvancedSettings.from_instance(instance=instance)
+            started_successfully = create_app_from_image(advanced_settings, instance.container_image,
+                                  instance.container_user, instance, instance_path,
+                                  instance.template_files.all(), preset_name)
+    except OperationTimeoutError:
+        instance.delete()
+        raise
+
+    if not started_successfully:
+        print("app startup failed")
+        instance.delete()
+        raise LifecycleError("App didn't start succesfully")
+
+    # New instances are stored as stopped until their containers have started
+    instance.status = AppStatusEnum.RUNNING.value
+    instance.save()
+
+    # Dashboard will always know which instances can transmit to which.
+    # Instances should always ask what they can do before trying to do things.
+    for dest in AppInstanceModel.objects.filter(pk__in=transmit_destinations):
+        connection = AppConnectionModel(instance_from=instance, instance_to=dest)
+        connection.save()
+
+@lifecycle_operation
+def restart_app(instance: AppInstanceModel, report_progress=no_progress):
+    app_name = instance.app_name
+    instance_path = get_instance_path(app_name)
+
+    report_progress("Removing containers")
+
+    if (instance.using_compose):
+        run_compose(app_name, instance_path, ["kill"])
+        # We don't care about the result. If removal was successful, good. If there was
+        # nothing to remove, also good. In the case this throws some other error, the handling
+        # can be added then.
+    else:
+        try:
+            app_container = get_docker_client().containers.get(app_name)
+            app_container.remove(v=True, force=True)
+        except docker.errors.NotFound:
+            pass
+        except docker.errors.APIError:
+            raise ContainerApiError("Container API error. Try again later or contact an administrator.")
+
+    if (instance.using_compose):
+        # TODO: implement
+        raise LifecycleError("Restarting compose files is not implemented")
+
+    report_progress("Starting containers")
+    advanced_settings = ImageBasedAppAdvancedSettings.from_instance(instance=instance)
+    started_successfully = create_app_from_image(advanced_settings, instance.container_image,
+                          instance.container_user, instance, instance_path, instance.template_files.all())
+
+    if not started_successfully:
+        print("app restart failed")
+        instance.status = AppStatusEnum.ERROR.value
+        instance.save()
+
+        raise LifecycleError("App failed to restart!")
+
+    instance.status = AppStatusEnum.RUNNING.value
+    instance.save()
+
+@lifecycle_operation
+def recreate_app(instance: AppInstanceModel, report_progress=no_progress):
+    app_name = instance.app_name
+    instance_path = get_instance_path(app_name)
+    compose_file_path = f"{instance_path}/docker-compose.yaml"
+    compose_file_data = None
+
+    report_progress("Removing containers")
+
+    if (instance.using_compose):
+        run_compose_command(instance, instance_path, ["kill"], "Failed to recreate instance.")
+
+        # Keep the compose file so the project can be started again from the clean directory
+        if os.path.exists(compose_file_path):
+            with open(compose_file_path, "rb") as compose_file:
+                compose_file_data = compose_file.read()
+    else:
+        try:
+            app_container = get_docker_client().containers.get(app_name)
+            app_container.remove(v=True, force=True)
+        except docker.errors.NotFound:
+            report_progress("App container not found! Some data may be lost.")
+        except docker.errors.APIError:
+            raise ContainerApiError("Container API error. Try again later or contact an administrator.")
+
+    report_progress("Removing data")
+
+    # TODO: Ensure the app name can't change the instance path to something weird
+    # The data is deleted in the background
+    move_to_trash(instance_path)
+
+    instance.status = AppStatusEnum.REMOVED.value
+    instance.save()
+
+    os.makedirs(instance_path)
+
+    report_progress("Copying template files")
+    provision_instance_files(instance, instance_path)
+
+    report_progress("Starting containers")
+    started_successfully = False
+
+    if (instance.using_compose):
+        if compose_file_data is not None:
+            with open(compose_file_path, "wb") as compose_file:
+                compose_file.write(compose_file_data)
+
+            started_successfully = create_app_from_compose(instance_path, instance.app_name)
+    else:
+        advanced_settings = ImageBasedAppAdvancedSettings.from_instance(instance=instance)
+        started_successfully = create_app_from_image(advanced_settings, instance.container_image,
+                              instance.container_user, instance, instance_path, instance.template_files.all())
+
+    if not started_successfully:
+        print("app recreation failed")
+        instance.status = AppStatusEnum.ERROR.value
+        instance.save()
+
+        raise LifecycleError("App recreation unsuccessful!")
+
+    instance.status = AppStatusEnum.RUNNING.value
+    instance.save()
+
+def create_instance_job(job: LifecycleJob):
+    create_app(job.instance, job.payload.get("preset_name"), job.payload.get("transmit_destinations", []), job.set_progress)
+    return "App started successfully"
+
+def restart_instance_job(job: LifecycleJob):
+    restart_app(job.instance, job.set_progress)
+    return "App restarted successfully"
+
+def recreate_instance_job(job: LifecycleJob):
+    recreate_app(job.instance, job.set_progress)
+    return "App recreated successfully"
+
+def pause_instance_job(job: LifecycleJob):
+    pause_app(job.instance)
+    return "App paused"
+
+def stop_instance_job(job: LifecycleJob):
+    stop_app(job.instance)
+    return "App stopped"
+
+def start_instance_job(job: LifecycleJob):
+    start_app(job.instance)
+    return "App started"
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from main.models import AppInstanceModel, AppConnectionModel, LocationModel, OrganizationEntity, AppStatusEnum
+
+import random
+import time
+
+class Command(BaseCommand):
+    help = "Measures instance and connection lookup times against generated instances. The generated rows are rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--instances", type=int, default=10000, help="Number of instances to generate.")
+        parser.add_argument("--connections-per-instance", type=int, default=3, help="Number of connections to generate per instance.")
+        parser.add_argument("--repeat", type=int, default=1000, help="Number of lookups to time per benchmark.")
+
+    def handle(self, *args, **options):
+        instance_count = options["instances"]
+        repeat = options["repeat"]
+
+        with transaction.atomic():
+            instances = self.generate_instances(instance_count, options["connections_per_instance"])
+            self.stdout.write(f"Generated {instance_count} instances and {AppConnectionModel.objects.count()} connections.")
+
+            running = AppStatusEnum.RUNNING.value
+            benchmarks = [
+                ("Instance by app_name", lambda inst: AppInstanceModel.objects.filter(app_name=inst.app_name)),
+                ("URL path exists", lambda inst: AppInstanceModel.objects.filter(url_path=inst.url_path)),
+                ("Available destinations", lambda inst: AppConnectionModel.objects.filter(instance_from=inst, instance_to__status=running)),
+                ("Connection exists", lambda inst: AppConnectionModel.objects.filter(instance_from=inst, instance_to=inst)),
+            ]
+
+            for name, get_queryset in benchmarks:
+                self.run_benchmark(name, get_queryset, instances, repeat)
+
+            transaction.set_rollback(True)
+
+    def generate_instances(self, instance_count, connections_per_instance):
+        org = OrganizationEntity.objects.create(org_name="benchmark", nationality="benchmark")
+        location = LocationModel.objects.create(location_name="benchmark", owner_org=org, latitude=0, longitude=0)
+        statuses = [x.value for x in AppStatusEnum]
+        now = timezone.now()
+
+        instances = AppInstanceModel.objects.bulk_create([
+            AppInstanceModel(app_name=f"benchmark-{i}", url_path=f"benchmark-{i}", location=location,
+                             status=random.choice(statuses), created_at=now, api_token="benchmark",
+                             using_compose=False)
+            for i in range(instance_count)
+        ], batch_size=1000)
+
+        AppConnectionModel.objects.bulk_create([
+            AppConnectionModel(instance_from=inst, instance_to=random.choice(instances))
+            for inst in instances
+            for _ in range(connections_per_instance)
+        ], batch_size=1000)
+
+        return instances
+
+    def run_benchmark(self, name, get_queryset, instances, repeat):
+        samples = random.choices(instances, k=repeat)
+        start = time.perf_counter()
+
+        for inst in samples:
+            list(get_queryset(inst))
+
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(f"\n{name}: {elapsed / repeat * 1e6:.1f} µs per lookup")
+        # The query plan shows whether an index is used
+        self.stdout.write(get_queryset(samples[0]).explain())
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from main.instance_status import reconcile_all_instances, reconcile_instance, find_event_instance, invalidate_container_names
+from main.docker_client import get_docker_client, reset_docker_client
+from main.proxy_state import is_proxy_event, update_proxy_state_from_event
+
+from datetime import datetime
+import time
+import docker
+import requests
+
+CONTAINER_EVENTS = ["start", "stop", "die", "destroy", "pause", "unpause"]
+
+class Command(BaseCommand):
+    help = "Keeps stored instance statuses in sync with Docker by following the Docker event stream."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--retry-delay", type=float, default=5,
+                            help="Seconds to wait before reconnecting to Docker after an error.")
+
+    def handle(self, *args, **options):
+        retry_delay = options["retry_delay"]
+
+        while True:
+            try:
+                self.follow_events()
+            except (docker.errors.DockerException, requests.exceptions.RequestException) as e:
+                self.stderr.write(f"Docker connection lost: {e}. Reconnecting in {retry_delay} seconds.")
+                reset_docker_client()
+                time.sleep(retry_delay)
+
+    def follow_events(self):
+        docker_client = get_docker_client()
+
+        # Subscribe from the moment before the full sync so no events are missed in between
+        since = datetime.now()
+        close_old_connections()
+        changed = reconcile_all_instances(docker_client)
+        self.stdout.write(f"Synchronized instance statuses. {changed} changed.")
+
+        events = docker_client.events(decode=True, since=since, filters={
+            "type": "container",
+            "event": CONTAINER_EVENTS
+        })
+
+        for event in events:
+            invalidate_container_names()
+
+            if is_proxy_event(event):
+                update_proxy_state_from_event(event)
+                continue
+
+            close_old_connections()
+            instance = find_event_instance(event)
+
+            if instance is None:
+                continue
+
+            if reconcile_instance(docker_client, instance):
+                self.stdout.write(f"{instance.app_name}: {event.get('Action')} -> {instance.get_status_display()}")
@@ -0,0 +1,119 @@
+from django.core.management.base import BaseCommand
+
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+ROW_COUNT = 1000
+PAGE_SIZE = 20
+PROFILES = ["development", "production"]
+
+def setup_django(db_path, profile):
+    # Runs in a new process. The database is configured by dashboard/settings.py from
+    # the same variables as in a deployment, so the profile's connection settings and
+    # PRAGMAs are the ones being measured.
+    import django
+
+    os.environ.update({
+        "AMSYS_DB_ENGINE": "sqlite",
+        "AMSYS_DB_PROFILE": profile,
+        "AMSYS_SQLITE_PATH": db_path,
+    })
+    django.setup()
+
+def create_database(db_path, profile):
+    setup_django(db_path, profile)
+
+    from django.core.management import call_command
+    from django.utils import timezone
+    from main.models import AppInstanceModel, LocationModel, OrganizationEntity
+
+    call_command("migrate", verbosity=0)
+    org = OrganizationEntity.objects.create(org_name="org", nationality="FI")
+    location = LocationModel.objects.create(location_name="location", owner_org=org, latitude=0, longitude=0)
+    AppInstanceModel.objects.bulk_create([
+        AppInstanceModel(app_name=f"app-{i}", url_path=f"app-{i}", location=location, status=1,
+                         created_at=timezone.now(), api_token="token", using_compose=False)
+        for i in range(ROW_COUNT)
+    ])
+
+def run_worker(db_path, profile, seconds, write_ratio, results):
+    # Each operation is handled like a request: it reads a page of instances like the
+    # instance listing or updates a status like the reconciler, and connections are
+    # closed or kept according to CONN_MAX_AGE when it ends
+    setup_django(db_path, profile)
+
+    from django.db import close_old_connections, OperationalError
+    from main.models import AppInstanceModel
+
+    instance_pks = list(AppInstanceModel.objects.values_list("pk", flat=True))
+    reads = 0
+    writes = 0
+    errors = 0
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        close_old_connections()
+
+        try:
+            if random.random() < write_ratio:
+                AppInstanceModel.objects.filter(pk=random.choice(instance_pks)).update(status=random.randint(1, 6))
+                writes += 1
+            else:
+                offset = random.randint(0, ROW_COUNT - PAGE_SIZE)
+                list(AppInstanceModel.objects.order_by("app_name").values_list("pk", "app_name", "status")[offset:offset + PAGE_SIZE])
+                reads += 1
+        except OperationalError:
+            # "database is locked"
+            errors += 1
+
+        close_old_connections()
+
+    results.put((reads, writes, errors))
+
+class Command(BaseCommand):
+    help = "Runs concurrent readers and writers against a temporary SQLite database with the development and production profiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8, help="Number of worker processes.")
+        parser.add_argument("--seconds", type=float, default=10, help="Duration of each run.")
+        parser.add_argument("--write-ratio", type=float, default=0.2, help="Share of operations that are writes.")
+
+    def handle(self, *args, **options):
+        # Separate processes like gunicorn workers, so Python's GIL doesn't serialize them.
+        # Spawned processes also start without this process's database configuration.
+        context = multiprocessing.get_context("spawn")
+
+        for profile in PROFILES:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                db_path = os.path.join(tmp_dir, "stress.sqlite3")
+                setup = context.Process(target=create_database, args=(db_path, profile))
+                setup.start()
+                setup.join()
+                reads, writes, errors = self.run_profile(context, db_path, profile, options)
+
+            seconds = options["seconds"]
+            self.stdout.write(f"{profile}: {reads / seconds:.0f} reads/s, {writes / seconds:.0f} writes/s, {errors} lock errors")
+
+    def run_profile(self, context, db_path, profile, options):
+        results = context.Queue()
+        workers = [
+            context.Process(target=run_worker, args=(db_path, profile, options["seconds"], options["write_ratio"], results))
+            for _ in range(options["workers"])
+        ]
+
+        for worker in workers:
+            worker.start()
+
+        totals = [0, 0, 0]
+
+        for _ in workers:
+            for index, value in enumerate(results.get()):
+                totals[index] += value
+
+        for worker in workers:
+            worker.join()
+
+        return totals
@@ -0,0 +1,196 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from .models import AppInstanceModel, AppConnectionModel, LocationModel, AppStatusEnum
+from .topology import get_topology_revision
+
+import json
+import math
+
+MAP_DATA_CACHE_KEY = "amsys:map_data"
+MAP_VIEW_CACHE_KEY = "amsys:map_view"
+
+# Locations closer than this many pixels to each other at the current zoom level are
+# clustered together. Leaflet uses 256 pixel tiles.
+TILE_SIZE = 256
+CLUSTER_CELL_SIZE = 64
+# Locations are shown individually from this zoom level on
+MAX_CLUSTER_ZOOM = 12
+
+def get_map_data(revision):
+    # The cache key contains the topology revision, which is bumped whenever locations,
+    # instances or connections change, so stale data is never served
+    cache_key = f"{MAP_DATA_CACHE_KEY}:{revision}"
+    data = cache.get(cache_key)
+
+    if data is None:
+        data = build_map_data()
+        cache.set(cache_key, data, settings.AMSYS_MAP_CACHE_TTL)
+
+    return data
+
+def build_map_data():
+    # Three queries regardless of how many locations, instances and connections exist
+    locations = {}
+
+    for location in LocationModel.objects.values():
+        location["latitude"] = float(location["latitude"])
+        location["longitude"] = float(location["longitude"])
+        location["apps"] = []
+        locations[location["id"]] = location
+
+    instances = AppInstanceModel.objects.values("location_id", "app_name", "url_path", "status")
+
+    for inst in instances:
+        location = locations.get(inst.pop("location_id"))
+
+        if location is None:
+            continue
+
+        inst["status"] = str(AppStatusEnum(inst["status"]).name)
+        location["apps"].append(inst)
+
+    # Connections are aggregated by the database into one row per pair of locations
+    running = Q(instance_from__status=AppStatusEnum.RUNNING.value, instance_to__status=AppStatusEnum.RUNNING.value)
+    location_pairs = AppConnectionModel.objects \
+        .values("instance_from__location_id", "instance_to__location_id") \
+        .annotate(weight=Count("id"), running=Count("id", filter=running)) \
+        .order_by()
+
+    edges = [
+        (x["instance_from__location_id"], x["instance_to__location_id"], x["weight"], x["running"])
+        for x in location_pairs
+        if x["instance_from__location_id"] != x["instance_to__location_id"]
+    ]
+
+    return { "locations": locations, "edges": edges }
+
+def get_cluster_cell_size(zoom):
+    # Grid cell size in degrees. Latitude degrees aren't equally tall on a Mercator map,
+    # but the grid only needs to be roughly right for grouping nearby locations.
+    if zoom >= MAX_CLUSTER_ZOOM:
+        return None
+
+    return 360 / (2 ** zoom) * CLUSTER_CELL_SIZE / TILE_SIZE
+
+def cluster_locations(locations, zoom):
+    # Returns the clusters and a mapping from location ID to cluster ID
+    cell_size = get_cluster_cell_size(zoom)
+    clusters = {}
+    location_clusters = {}
+
+    for location in locations.values():
+        if cell_size is None:
+            cluster_id = f"location-{location['id']}"
+        else:
+            cluster_id = f"cell-{math.floor(location['latitude'] / cell_size)}-{math.floor(location['longitude'] / cell_size)}"
+
+        cluster = clusters.setdefault(cluster_id, { "id": cluster_id, "locations": [] })
+        cluster["locations"].append(location)
+        location_clusters[location["id"]] = cluster_id
+
+    for cluster in clusters.values():
+        cluster_members = cluster.pop("locations")
+        cluster["latitude"] = sum(x["latitude"] for x in cluster_members) / len(cluster_members)
+        cluster["longitude"] = sum(x["longitude"] for x in cluster_members) / len(cluster_members)
+        cluster["location_count"] = len(cluster_members)
+        cluster["app_count"] = sum(len(x["apps"]) for x in cluster_members)
+        # Details are only sent for single locations so clusters stay small
+        cluster["location"] = cluster_members[0] if len(cluster_members) == 1 else None
+
+    return clusters, location_clusters
+
+def is_in_bbox(latitude, longitude, bbox):
+    west, south, east, north = bbox
+
+    if latitude < south or latitude > north:
+        return False
+
+    # The bounding box crosses the antimeridian
+    if west > east:
+        return longitude >= west or longitude <= east
+
+    return west <= longitude <= east
+
+def get_edge_status(weight, running):
+    if running == weight:
+        return "running"
+
+    if running == 0:
+        return "down"
+
+    return "partial"
+
+def snap_bbox(bbox, zoom):
+    # Widens the bounding box to whole map tiles, so viewports that were only panned a
+    # little share a cached response
+    tile_degrees = 360 / (2 ** zoom)
+    west, south, east, north = bbox
+
+    return [math.floor(west / tile_degrees) * tile_degrees, math.floor(south / tile_degrees) * tile_degrees,
+            math.ceil(east / tile_degrees) * tile_degrees, math.ceil(north / tile_degrees) * tile_degrees]
+
+def get_map_view_json(zoom, bbox=None, color_by_status=False) -> str:
+    # Returns get_map_view serialized as JSON. The serialized response is cached, so a
+    # cached view is served without clustering or encoding anything.
+    revision = get_topology_revision()
+
+    if bbox is not None:
+        bbox = snap_bbox(bbox, zoom)
+
+    cache_key = f"{MAP_VIEW_CACHE_KEY}:{revision}:{zoom}:{int(color_by_status)}:{bbox}"
+    content = cache.get(cache_key)
+
+    if content is None:
+        content = json.dumps(get_map_view(revision, zoom, bbox, color_by_status))
+        cache.set(cache_key, content, settings.AMSYS_MAP_CACHE_TTL)
+
+    return content
+
+def get_map_view(revision, zoom, bbox=None, color_by_status=False):
+    # Returns the clusters inside the bounding box and the aggregated connections that
+    # touch them. The size depends on the viewport rather than the number of locations.
+    data = get_map_data(revision)
+    clusters, location_clusters = cluster_locations(data["locations"], zoom)
+
+    visible_clusters = {
+        cluster_id for cluster_id, cluster in clusters.items()
+        if bbox is None or is_in_bbox(cluster["latitude"], cluster["longitude"], bbox)
+    }
+
+    cluster_edges = {}
+
+    for location_from, location_to, weight, running in data["edges"]:
+        cluster_from = location_clusters[location_from]
+        cluster_to = location_clusters[location_to]
+
+        if cluster_from == cluster_to:
+            continue
+
+        if cluster_from not in visible_clusters and cluster_to not in visible_clusters:
+            continue
+
+        # Lines are drawn without a direction, so both directions share an edge
+        key = tuple(sorted([cluster_from, cluster_to]))
+        edge = cluster_edges.setdefault(key, [0, 0])
+        edge[0] += weight
+        edge[1] += running
+
+    edges = []
+
+    for (cluster_from, cluster_to), (weight, running) in cluster_edges.items():
+        edge = {
+            "from": [clusters[cluster_from]["latitude"], clusters[cluster_from]["longitude"]],
+            "to": [clusters[cluster_to]["latitude"], clusters[cluster_to]["longitude"]],
+            "weight": weight
+        }
+
+        if color_by_status:
+            edge["status"] = get_edge_status(weight, running)
+
+        edges.append(edge)
+
+    return {
+        "clusters": [x for x in clusters.values() if x["id"] in visible_clusters],
+        "edges": edges
+    }
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.23 on 2026-10-18 09:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0024_alter_appinstancemodel_template_files'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appinstancemodel',
+            name='status',
+            field=models.IntegerField(choices=[(1, 'RUNNING'), (2, 'PAUSED'), (3, 'STOPPED'), (4, 'REMOVED'), (5, 'MISSING'), (6, 'ERROR')]),
+        ),
+        migrations.CreateModel(
+            name='LifecycleJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('create', 'CREATE'), ('restart', 'RESTART'), ('recreate', 'RECREATE')], max_length=20)),
+                ('app_name', models.CharField(max_length=20)),
+                ('status', models.IntegerField(choices=[(1, 'QUEUED'), (2, 'RUNNING'), (3, 'SUCCEEDED'), (4, 'FAILED')], default=1)),
+                ('progress', models.CharField(blank=True, max_length=200)),
+                ('message', models.CharField(blank=True, max_length=1024)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField()),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('instance', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='main.appinstancemodel')),
+            ],
+        ),
+    ]
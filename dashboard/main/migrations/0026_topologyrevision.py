@@ -0,0 +1,20 @@
+# Generated by Django 4.2.23 on 2026-10-18 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0025_lifecyclejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopologyRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('revision', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
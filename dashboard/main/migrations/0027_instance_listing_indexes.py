@@ -0,0 +1,24 @@
+# Generated by Django 4.2.23 on 2026-10-18 10:08
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0026_topologyrevision'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appinstancemodel',
+            name='app_name',
+            field=models.CharField(db_index=True, help_text="Allowed characters: A-Z, -, _. Don't use spaces or numbers. Must be at least 3 characters long.", max_length=20, validators=[django.core.validators.RegexValidator(regex='^[a-zA-Z_-]{3,}$')], verbose_name='App name'),
+        ),
+        migrations.AlterField(
+            model_name='appinstancemodel',
+            name='status',
+            field=models.IntegerField(choices=[(1, 'RUNNING'), (2, 'PAUSED'), (3, 'STOPPED'), (4, 'REMOVED'), (5, 'MISSING'), (6, 'ERROR')], db_index=True),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.23 on 2026-10-18 10:08
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicates(apps, schema_editor):
+    # The unique indexes can't be created while duplicates exist. The instances aren't
+    # renamed automatically because the app name is also the name of the instance's
+    # containers and directory and the URL path is in its proxy labels.
+    AppInstanceModel = apps.get_model("main", "AppInstanceModel")
+    problems = []
+
+    for field in ["app_name", "url_path"]:
+        duplicates = AppInstanceModel.objects.values(field).annotate(count=Count("pk")).filter(count__gt=1).order_by(field)
+
+        for duplicate in duplicates:
+            pks = AppInstanceModel.objects.filter(**{ field: duplicate[field] }).order_by("pk").values_list("pk", flat=True)
+            problems.append(f"{field} '{duplicate[field]}' is used by the instances with IDs {', '.join(str(pk) for pk in pks)}")
+
+    if len(problems) > 0:
+        raise RuntimeError("App names and URL paths must be unique before migrating. Rename or remove the "
+                           "duplicate instances, e.g. in the admin site, and run migrate again.\n"
+                           + "\n".join(problems))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0027_instance_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='appinstancemodel',
+            name='app_name',
+            field=models.CharField(help_text="Allowed characters: A-Z, -, _. Don't use spaces or numbers. Must be at least 3 characters long.", max_length=20, unique=True, validators=[django.core.validators.RegexValidator(regex='^[a-zA-Z_-]{3,}$')], verbose_name='App name'),
+        ),
+        migrations.AlterField(
+            model_name='appinstancemodel',
+            name='url_path',
+            field=models.CharField(blank=True, help_text='Leave empty to match app name. Allowed characters: A-Z, -, _. Must be at least 3 characters long.', max_length=20, unique=True, validators=[django.core.validators.RegexValidator(regex='^[a-zA-Z_-]{3,}$')], verbose_name='URL path'),
+        ),
+        migrations.AddIndex(
+            model_name='appconnectionmodel',
+            index=models.Index(fields=['instance_from', 'instance_to'], name='main_connection_from_to_idx'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 4.2.23 on 2026-10-18 10:10
+
+from django.db import migrations, models
+import json
+
+SETTINGS_DEFAULTS = {
+    "instance_directories": list,
+    "instance_labels": dict,
+    "instance_volumes": dict,
+    "instance_environment_variables": dict,
+}
+
+
+def normalize_settings(apps, schema_editor):
+    # Empty or malformed values can't be converted to JSON columns, so they are
+    # replaced with empty JSON before the columns are altered
+    for model_name in ["AppInstanceModel", "AppPresetModel"]:
+        model = apps.get_model("main", model_name)
+
+        for row in model.objects.values("pk", *SETTINGS_DEFAULTS.keys()):
+            changed_fields = {}
+
+            for field, default in SETTINGS_DEFAULTS.items():
+                try:
+                    value = json.loads(row[field])
+                except (TypeError, ValueError):
+                    value = None
+
+                if not isinstance(value, default):
+                    changed_fields[field] = json.dumps(default())
+
+            if len(changed_fields) > 0:
+                model.objects.filter(pk=row["pk"]).update(**changed_fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0028_lookup_constraints'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_settings, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='appinstancemodel',
+            name='instance_directories',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name='appinstancemodel',
+            name='instance_environment_variables',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='appinstancemodel',
+            name='instance_labels',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='appinstancemodel',
+            name='instance_volumes',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='apppresetmodel',
+            name='instance_directories',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name='apppresetmodel',
+            name='instance_environment_variables',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='apppresetmodel',
+            name='instance_labels',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='apppresetmodel',
+            name='instance_volumes',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
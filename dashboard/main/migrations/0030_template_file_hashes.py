@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0029_json_settings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='templatefilemodel',
+            name='mtime_ns',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='templatefilemodel',
+            name='sha256',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='templatefilemodel',
+            name='size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 10:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0030_template_file_hashes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lifecyclejob',
+            name='action',
+            field=models.CharField(choices=[('create', 'CREATE'), ('restart', 'RESTART'), ('recreate', 'RECREATE'), ('pause', 'PAUSE'), ('stop', 'STOP'), ('start', 'START')], max_length=20),
+        ),
+    ]
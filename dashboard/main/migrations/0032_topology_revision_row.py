@@ -0,0 +1,24 @@
+# Generated by Django 4.2.23 on 2026-10-18 14:20
+
+from django.db import migrations
+
+# Matches main.topology.TOPOLOGY_REVISION_PK
+TOPOLOGY_REVISION_PK = 1
+
+
+def create_topology_revision(apps, schema_editor):
+    # Created here so bumping the revision is always a single UPDATE that can't race
+    # another process creating the row
+    TopologyRevision = apps.get_model("main", "TopologyRevision")
+    TopologyRevision.objects.get_or_create(pk=TOPOLOGY_REVISION_PK)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0031_lifecyclejob_instance_actions'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_topology_revision, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.23 on 2026-10-18 10:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0032_topology_revision_row'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TemplateFileSync',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('directory', models.CharField(max_length=512, unique=True)),
+                ('mtime_ns', models.BigIntegerField()),
+            ],
+        ),
+    ]
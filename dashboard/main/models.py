@@ -28,10 +28,23 @@ def instance_template_files():
 class TemplateFileModel(models.Model):
     filename = models.CharField(max_length=512)
     filepath = models.CharField(max_length=512)
+    # Content hash and the file's size and modification time when it was hashed
+    sha256 = models.CharField(max_length=64, blank=True, default="")
+    size = models.BigIntegerField(null=True, blank=True)
+    mtime_ns = models.BigIntegerField(null=True, blank=True)
 
     def __str__(self):
         return str(self.filename)
 
+class TemplateFileSync(models.Model):
+    # Modification time of a template file directory when TemplateFileModel was last
+    # synced with it. Stored in the database so every process sees when it's invalidated.
+    directory = models.CharField(max_length=512, unique=True)
+    mtime_ns = models.BigIntegerField()
+
+    def __str__(self):
+        return str(self.directory)
+
 class AppStatusEnum(Enum):
     RUNNING = 1
     PAUSED  = 2
@@ -46,23 +59,23 @@ class AppStatusEnum(Enum):
 
 class AppInstanceModel(models.Model):
     app_name = models.CharField(max_length=20, verbose_name="App name", help_text="Allowed characters: A-Z, -, _. Don't use spaces or numbers. Must be at least 3 characters long.",
-                                validators=[RegexValidator(regex="^[a-zA-Z_-]{3,}$")])
+                                validators=[RegexValidator(regex="^[a-zA-Z_-]{3,}$")], unique=True)
     url_path = models.CharField(max_length=20, verbose_name="URL path", blank=True, help_text="Leave empty to match app name. Allowed characters: A-Z, -, _. Must be at least 3 characters long.",
-                                validators=[RegexValidator(regex="^[a-zA-Z_-]{3,}$")])
+                                validators=[RegexValidator(regex="^[a-zA-Z_-]{3,}$")], unique=True)
     location = models.ForeignKey(LocationModel, on_delete=models.CASCADE, help_text="Attach this application to a location")
     template_files = models.ManyToManyField(TemplateFileModel, blank=True)
-    status = models.IntegerField(choices=AppStatusEnum.as_tuple_list())
+    status = models.IntegerField(choices=AppStatusEnum.as_tuple_list(), db_index=True)
     created_at = models.DateTimeField()
     api_token = models.CharField(max_length=50)
     using_compose = models.BooleanField()
     container_image = models.CharField(max_length=50, blank=True)
     container_user = models.CharField(max_length=50, blank=True)
     info = models.CharField(max_length=512, blank=True)
-    # These should contain JSON formatted data:
-    instance_directories = models.CharField(max_length=1024, blank=True)
-    instance_labels = models.CharField(max_length=1024, blank=True)
-    instance_volumes = models.CharField(max_length=1024, blank=True)
-    instance_environment_variables = models.CharField(max_length=1024, blank=True)
+    # Directories are a list of paths, the others map names to values
+    instance_directories = models.JSONField(default=list, blank=True)
+    instance_labels = models.JSONField(default=dict, blank=True)
+    instance_volumes = models.JSONField(default=dict, blank=True)
+    instance_environment_variables = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return str(self.app_name)
@@ -71,16 +84,75 @@ class AppConnectionModel(models.Model):
     instance_from = models.ForeignKey(AppInstanceModel, on_delete=models.CASCADE, related_name="instance_from")
     instance_to = models.ForeignKey(AppInstanceModel, on_delete=models.CASCADE, related_name="instance_to")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["instance_from", "instance_to"], name="main_connection_from_to_idx"),
+        ]
+
 class AppPresetModel(models.Model):
     preset_name = models.CharField(max_length=20, verbose_name="Preset name")
     container_image = models.CharField(max_length=20)
     container_user = models.CharField(max_length=50)
     template_files = models.ManyToManyField(TemplateFileModel)
-    # These should contain JSON formatted data:
-    instance_directories = models.CharField(max_length=1024, blank=True)
-    instance_labels = models.CharField(max_length=1024, blank=True)
-    instance_volumes = models.CharField(max_length=1024, blank=True)
-    instance_environment_variables = models.CharField(max_length=1024, blank=True)
+    # Directories are a list of paths, the others map names to values
+    instance_directories = models.JSONField(default=list, blank=True)
+    instance_labels = models.JSONField(default=dict, blank=True)
+    instance_volumes = models.JSONField(default=dict, blank=True)
+    instance_environment_variables = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return str(self.preset_name)
+
+class JobStatusEnum(Enum):
+    QUEUED    = 1
+    RUNNING   = 2
+    SUCCEEDED = 3
+    FAILED    = 4
+
+    @classmethod
+    def as_tuple_list(cls):
+        return [(x.value, x.name) for x in list(cls)]
+
+class JobActionEnum(Enum):
+    CREATE   = "create"
+    RESTART  = "restart"
+    RECREATE = "recreate"
+    PAUSE    = "pause"
+    STOP     = "stop"
+    START    = "start"
+
+    @classmethod
+    def as_tuple_list(cls):
+        return [(x.value, x.name) for x in list(cls)]
+
+class LifecycleJob(models.Model):
+    action = models.CharField(max_length=20, choices=JobActionEnum.as_tuple_list())
+    # The instance may be deleted by a failed creation job, so the name is stored separately
+    instance = models.ForeignKey(AppInstanceModel, on_delete=models.SET_NULL, null=True, blank=True, related_name="jobs")
+    app_name = models.CharField(max_length=20)
+    status = models.IntegerField(choices=JobStatusEnum.as_tuple_list(), default=JobStatusEnum.QUEUED.value)
+    progress = models.CharField(max_length=200, blank=True)
+    message = models.CharField(max_length=1024, blank=True)
+    # Action specific arguments, e.g. the connections to create for a new instance
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField()
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def set_progress(self, progress):
+        self.progress = progress
+        self.save(update_fields=["progress"])
+
+    def is_finished(self):
+        return self.status in [JobStatusEnum.SUCCEEDED.value, JobStatusEnum.FAILED.value]
+
+    def __str__(self):
+        return f"{self.action} {self.app_name} ({JobStatusEnum(self.status).name})"
+
+class TopologyRevision(models.Model):
+    # Single row counter that is bumped whenever instances or their connections change.
+    # Instances use it through ETags to skip refetching data that hasn't changed.
+    revision = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Topology revision {self.revision}"
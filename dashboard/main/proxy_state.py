@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.cache import cache
+from .docker_client import get_docker_client
+
+import docker
+import requests
+
+PROXY_CONTAINER_NAME = "amsys-traefik"
+PROXY_STATE_CACHE_KEY = "amsys:proxy_running"
+
+def is_proxy_running():
+    # Cached so that rendering the proxy badge doesn't need a Docker call on every page.
+    # The cache is updated by start_proxy/stop_proxy and the status reconciler.
+    running = cache.get(PROXY_STATE_CACHE_KEY)
+
+    if running is None:
+        running = fetch_proxy_state()
+        set_proxy_state(running)
+
+    return running
+
+def fetch_proxy_state():
+    try:
+        proxy_containers = get_docker_client().api.containers(filters={
+            "name": PROXY_CONTAINER_NAME,
+            "status": "running"
+        })
+    except (docker.errors.DockerException, requests.exceptions.RequestException) as e:
+        print(f"Failed to fetch proxy status: {e}")
+        return False
+
+    # The name filter matches substrings, so compare the exact name
+    return any(f"/{PROXY_CONTAINER_NAME}" in c.get("Names", []) for c in proxy_containers)
+
+def set_proxy_state(running):
+    cache.set(PROXY_STATE_CACHE_KEY, running, settings.AMSYS_PROXY_STATE_TTL)
+
+def invalidate_proxy_state():
+    cache.delete(PROXY_STATE_CACHE_KEY)
+
+def is_proxy_event(event):
+    return event.get("Actor", {}).get("Attributes", {}).get("name") == PROXY_CONTAINER_NAME
+
+def update_proxy_state_from_event(event):
+    set_proxy_state(event.get("Action") in ["start", "unpause"])
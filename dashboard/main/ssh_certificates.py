@@ -0,0 +1,107 @@
+from django.conf import settings
+from cryptography.exceptions import UnsupportedAlgorithm
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.serialization import SSHCertificateBuilder, SSHCertificateType
+from .caching import LRUCache
+
+import hashlib
+import os
+import threading
+import time
+
+INSTANCE_CA_PATH = "./ssh/instance_ca"
+CERTIFICATE_PRINCIPAL = "remote"
+CERTIFICATE_VALIDITY_SECONDS = 5 * 60
+
+# Same extensions ssh-keygen adds to user certificates by default
+DEFAULT_EXTENSIONS = [
+    b"permit-X11-forwarding",
+    b"permit-agent-forwarding",
+    b"permit-port-forwarding",
+    b"permit-pty",
+    b"permit-user-rc",
+]
+
+class CertificateError(Exception):
+    pass
+
+class CertificateAuthorityError(CertificateError):
+    # The CA key is missing or unreadable, which is a server side problem
+    pass
+
+_ca_key = None
+_ca_key_lock = threading.Lock()
+
+# (instance ID, public key fingerprint, principal) -> (certificate, valid_before)
+certificate_cache = LRUCache(settings.AMSYS_SSH_CERT_CACHE_SIZE)
+
+def get_ca_key():
+    # The CA key is read once per process. Key objects are immutable so they can be
+    # used for signing from many threads at once.
+    global _ca_key
+
+    with _ca_key_lock:
+        if _ca_key is None:
+            if not os.path.exists(INSTANCE_CA_PATH):
+                raise CertificateAuthorityError(f"Instance CA key not found at {INSTANCE_CA_PATH}")
+
+            try:
+                with open(INSTANCE_CA_PATH, "rb") as ca_file:
+                    _ca_key = serialization.load_ssh_private_key(ca_file.read(), password=None)
+            except (OSError, ValueError, UnsupportedAlgorithm) as e:
+                raise CertificateAuthorityError(f"Failed to load instance CA key: {e}")
+
+        return _ca_key
+
+def sign_public_key(public_key: str, key_id: str) -> str:
+    # Equivalent to "ssh-keygen -s instance_ca -I <key_id> -n remote -V +5m", but done in
+    # memory. Returns the certificate in the same format as the -cert.pub file.
+    # Certificates are reused until they are about to expire.
+    key_parts = public_key.strip().split(maxsplit=2)
+
+    try:
+        loaded_key = serialization.load_ssh_public_identity(" ".join(key_parts[:2]).encode())
+    except (ValueError, UnsupportedAlgorithm) as e:
+        raise CertificateError(f"Invalid public key: {e}")
+
+    if isinstance(loaded_key, serialization.SSHCertificate):
+        raise CertificateError("Invalid public key: expected a key, not a certificate")
+
+    now = int(time.time())
+    cache_key = (key_id, get_key_fingerprint(loaded_key), CERTIFICATE_PRINCIPAL)
+    cached = certificate_cache.get(cache_key)
+
+    if cached is not None and cached[1] - now > settings.AMSYS_SSH_CERT_MIN_REMAINING:
+        certificate = cached[0]
+    else:
+        certificate, valid_before = build_certificate(loaded_key, key_id, now)
+        certificate_cache.set(cache_key, (certificate, valid_before))
+
+    # ssh-keygen keeps the comment of the signed key
+    if len(key_parts) > 2:
+        certificate += " " + key_parts[2]
+
+    return certificate + "\n"
+
+def get_key_fingerprint(public_key) -> bytes:
+    key_blob = public_key.public_bytes(serialization.Encoding.OpenSSH, serialization.PublicFormat.OpenSSH)
+    return hashlib.sha256(key_blob).digest()
+
+def build_certificate(public_key, key_id: str, now: int):
+    # ssh-keygen backdates certificates to the start of the minute 59 seconds ago, for hosts
+    # with poorly synchronised clocks
+    valid_before = now + CERTIFICATE_VALIDITY_SECONDS
+
+    builder = SSHCertificateBuilder() \
+        .public_key(public_key) \
+        .type(SSHCertificateType.USER) \
+        .key_id(key_id.encode()) \
+        .valid_principals([CERTIFICATE_PRINCIPAL.encode()]) \
+        .valid_after((now - 59) // 60 * 60) \
+        .valid_before(valid_before) \
+        .serial(0)
+
+    for extension in DEFAULT_EXTENSIONS:
+        builder = builder.add_extension(extension, b"")
+
+    return builder.sign(get_ca_key()).public_bytes().decode(), valid_before
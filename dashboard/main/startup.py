@@ -0,0 +1,15 @@
+from django.db import DatabaseError
+from .lifecycle import get_instance_base_path
+from .trash import start_trash_reaper
+from .jobs import recover_jobs
+
+def start_background_tasks():
+    # Called when a dashboard process starts to pick up work left behind when the server
+    # stopped: instance data in the trash and unfinished lifecycle jobs
+    start_trash_reaper(get_instance_base_path())
+
+    try:
+        recover_jobs()
+    except DatabaseError as e:
+        # E.g. the migrations haven't been run yet
+        print(f"Failed to recover lifecycle jobs: {e}")
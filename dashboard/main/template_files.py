@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import TemplateFileModel, TemplateFileSync
+from .template_store import prune_template_store
+
+import os
+import threading
+import time
+
+# Stops threads of the same process from syncing at the same time
+_sync_lock = threading.Lock()
+# Set while the current thread is syncing, so the sync's own deletes don't invalidate it
+_syncing = threading.local()
+
+# File systems update timestamps with a coarse clock, so a change made right after a sync
+# can leave the mtime as it was. Recently modified directories are synced every time.
+RACY_MTIME_NS = 1_000_000_000
+
+def sync_template_files():
+    # Makes TemplateFileModel match the files in INSTANCE_TEMPLATE_FILES_DIR. The mtime of
+    # a directory changes whenever files are added, removed or renamed in it, so it's only
+    # listed again when its mtime differs from the last sync. Costs one stat call and one
+    # query when nothing has changed.
+    directory = str(settings.INSTANCE_TEMPLATE_FILES_DIR)
+
+    with _sync_lock:
+        # Read the mtime before listing so changes made during the sync are seen next time
+        mtime = os.stat(directory).st_mtime_ns
+
+        if TemplateFileSync.objects.filter(directory=directory, mtime_ns=mtime).exists():
+            return
+
+        files = { f"{directory}/{x.name}": x.name for x in os.scandir(directory) if x.is_file() }
+
+        with transaction.atomic():
+            _syncing.active = True
+
+            try:
+                deleted, _ = TemplateFileModel.objects.exclude(filepath__in=files.keys()).delete()
+            finally:
+                _syncing.active = False
+
+            existing = set(TemplateFileModel.objects.filter(filepath__in=files.keys()).values_list("filepath", flat=True))
+            TemplateFileModel.objects.bulk_create([
+                TemplateFileModel(filename=filename, filepath=filepath)
+                for filepath, filename in files.items()
+                if filepath not in existing
+            ])
+
+        if deleted > 0:
+            prune_template_store()
+
+        if time.time_ns() - mtime > RACY_MTIME_NS:
+            TemplateFileSync.objects.bulk_create([TemplateFileSync(directory=directory, mtime_ns=mtime)],
+                                                 update_conflicts=True, unique_fields=["directory"], update_fields=["mtime_ns"])
+
+@receiver([post_save, post_delete], sender=TemplateFileModel)
+def invalidate_template_file_syncs(sender, **kwargs):
+    # Rows changed outside the sync, e.g. in the admin site. Every process syncs again.
+    if not getattr(_syncing, "active", False):
+        TemplateFileSync.objects.all().delete()
@@ -0,0 +1,191 @@
+from typing import Dict, Iterable
+from django.conf import settings
+from .models import TemplateFileModel
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+import time
+
+# ioctl request number of FICLONE from linux/fs.h
+FICLONE = 0x40049409
+CHUNK_SIZE = 1024 * 1024
+# Lists the template files provisioned into an instance directory and their hashes
+MANIFEST_FILENAME = ".amsys-template-files.json"
+# Seconds unreferenced objects are kept for, so an object another process has just stored
+# isn't pruned before that process saves its hash
+PRUNE_GRACE_PERIOD = 3600
+
+def get_object_path(sha256: str) -> str:
+    return f"{settings.TEMPLATE_STORE_DIR}/{sha256[:2]}/{sha256}"
+
+def is_object_stored(object_path: str, size: int) -> bool:
+    # A truncated object, e.g. from a full disk, is stored again
+    try:
+        return os.stat(object_path).st_size == size
+    except FileNotFoundError:
+        return False
+
+def store_template_file(template_file: TemplateFileModel) -> str:
+    # Adds the template file's content to the store and returns its hash. The file is only
+    # read again when its size or modification time has changed since it was hashed.
+    file_stat = os.stat(template_file.filepath)
+    previous_sha256 = template_file.sha256
+
+    if template_file.sha256 \
+            and template_file.size == file_stat.st_size \
+            and template_file.mtime_ns == file_stat.st_mtime_ns \
+            and is_object_stored(get_object_path(template_file.sha256), file_stat.st_size):
+        return template_file.sha256
+
+    os.makedirs(settings.TEMPLATE_STORE_DIR, exist_ok=True)
+    # The copy is hashed while it's written, so the stored content always matches its name
+    # even if the template file changes at the same time
+    fd, incoming_path = tempfile.mkstemp(dir=settings.TEMPLATE_STORE_DIR, prefix=".incoming-")
+
+    try:
+        content_hash = hashlib.sha256()
+
+        with open(template_file.filepath, "rb") as source, os.fdopen(fd, "wb") as incoming:
+            while chunk := source.read(CHUNK_SIZE):
+                content_hash.update(chunk)
+                incoming.write(chunk)
+
+        sha256 = content_hash.hexdigest()
+        object_path = get_object_path(sha256)
+
+        if not is_object_stored(object_path, os.path.getsize(incoming_path)):
+            # Instances get their own copies, so stored content is never written through them
+            os.chmod(incoming_path, stat.S_IMODE(file_stat.st_mode) & ~0o222)
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            os.replace(incoming_path, object_path)
+        else:
+            # Keeps a reused object from being pruned before its hash is saved below
+            os.utime(object_path)
+    finally:
+        if os.path.exists(incoming_path):
+            os.remove(incoming_path)
+
+    # Not saved with save() so the template file sync isn't invalidated
+    TemplateFileModel.objects.filter(pk=template_file.pk) \
+        .update(sha256=sha256, size=file_stat.st_size, mtime_ns=file_stat.st_mtime_ns)
+    template_file.sha256 = sha256
+    template_file.size = file_stat.st_size
+    template_file.mtime_ns = file_stat.st_mtime_ns
+
+    if previous_sha256 and previous_sha256 != sha256:
+        prune_template_store()
+
+    return sha256
+
+def prune_template_store():
+    # Deletes the objects that no template file has as its content anymore, along with
+    # temporary files left behind by a crash
+    if not os.path.isdir(settings.TEMPLATE_STORE_DIR):
+        return
+
+    referenced = set(TemplateFileModel.objects.exclude(sha256="").values_list("sha256", flat=True))
+    cutoff = time.time() - PRUNE_GRACE_PERIOD
+
+    for root, dirs, files in os.walk(settings.TEMPLATE_STORE_DIR):
+        for name in files:
+            path = f"{root}/{name}"
+
+            try:
+                if name not in referenced and os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                # Pruned by another process at the same time
+                pass
+
+def copy_content(source_path: str, target_path: str) -> str:
+    # Reflinked files share their data blocks until either is modified, on file systems
+    # that support it (Btrfs, XFS)
+    with open(source_path, "rb") as source, open(target_path, "wb") as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            return "reflink"
+        except OSError:
+            pass
+
+    shutil.copyfile(source_path, target_path)
+    return "copy"
+
+def write_template_file(template_file: TemplateFileModel, object_path: str, target_path: str) -> str:
+    # Writes next to the target and renames the file over it, so a running container sees
+    # either the old or the new file but never a partially written one. Returns
+    # "reflink" or "copy".
+    incoming_path = f"{target_path}.amsys-incoming"
+
+    if os.path.lexists(incoming_path):
+        os.remove(incoming_path)
+
+    try:
+        method = copy_content(object_path, incoming_path)
+        shutil.copymode(template_file.filepath, incoming_path)
+        os.replace(incoming_path, target_path)
+        return method
+    finally:
+        if os.path.lexists(incoming_path):
+            os.remove(incoming_path)
+
+def read_manifest(instance_path: str) -> Dict[str, dict]:
+    try:
+        with open(f"{instance_path}/{MANIFEST_FILENAME}") as manifest_file:
+            return json.load(manifest_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def write_manifest(instance_path: str, manifest: Dict[str, dict]):
+    manifest_path = f"{instance_path}/{MANIFEST_FILENAME}"
+
+    with open(f"{manifest_path}.amsys-incoming", "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=4)
+
+    os.replace(f"{manifest_path}.amsys-incoming", manifest_path)
+
+def get_manifest_entry(sha256: str, target_stat: os.stat_result) -> dict:
+    return {
+        "sha256": sha256,
+        "size": target_stat.st_size,
+        "mtime_ns": target_stat.st_mtime_ns,
+        "inode": target_stat.st_ino
+    }
+
+def provision_template_files(template_files: Iterable[TemplateFileModel], instance_path: str) -> Dict[str, str]:
+    # Copies the template files into the instance directory. Files whose content hasn't
+    # changed since they were last provisioned are skipped. Returns how each file was
+    # provisioned by filename: "skipped", "reflink" or "copy".
+    manifest = read_manifest(instance_path)
+    new_manifest = {}
+    results = {}
+
+    for template_file in template_files:
+        sha256 = store_template_file(template_file)
+        target_path = f"{instance_path}/{template_file.filename}"
+
+        try:
+            target_stat = os.stat(target_path)
+        except FileNotFoundError:
+            target_stat = None
+
+        # The manifest records the hash of each file AMSYS wrote, along with the file's
+        # stat, so the target doesn't have to be read to know what's in it
+        entry = manifest.get(template_file.filename)
+
+        if target_stat is not None and entry == get_manifest_entry(sha256, target_stat):
+            results[template_file.filename] = "skipped"
+        else:
+            results[template_file.filename] = write_template_file(template_file, get_object_path(sha256), target_path)
+            target_stat = os.stat(target_path)
+
+        new_manifest[template_file.filename] = get_manifest_entry(sha256, target_stat)
+
+    if new_manifest != manifest:
+        write_manifest(instance_path, new_manifest)
+
+    return results
@@ -1,3 +1,1058 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, IntegrityError
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from unittest import mock, skipUnless
+from asgiref.sync import sync_to_async
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519
+from .models import AppInstanceModel, AppConnectionModel, AppStatusEnum, LocationModel, OrganizationEntity, LifecycleJob, JobActionEnum, JobStatusEnum, TemplateFileModel, TemplateFileSync, TopologyRevision
+from .instance_status import get_instance_statuses, save_instance_statuses, CONTAINER_NAMES_CACHE_KEY
+from .lifecycle import LifecycleError, stop_app, ImageBasedAppAdvancedSettings, set_instance_advanced_settings
+from .bulk_actions import select_instances, start_bulk_action
+from .api_auth import token_digest_cache
+from .topology import diff_destinations, get_topology_revision, bump_topology_revision
+from .docker_client import get_docker_client, reset_docker_client, HEALTH_CHECK_TIMEOUT
+from .proxy_state import is_proxy_running, update_proxy_state_from_event, PROXY_STATE_CACHE_KEY
+from .ssh_certificates import sign_public_key, build_certificate, certificate_cache
+from .database import apply_sqlite_pragmas
+from .template_files import sync_template_files
+from .template_store import provision_template_files, get_object_path, prune_template_store, PRUNE_GRACE_PERIOD
+from .trash import move_to_trash, empty_trash, get_trash_path
+from . import jobs, forms, trash
 
-# Create your tests here.
+import fcntl
+import hashlib
+import io
+import math
+import os
+import requests
+import runpy
+import shutil
+import subprocess
+import sys
+import threading
+import tempfile
+import time
+
+def create_location():
+    org = OrganizationEntity.objects.create(org_name="org", nationality="FI")
+    return LocationModel.objects.create(location_name="location", owner_org=org, latitude=0, longitude=0)
+
+def create_instances(location, count, status=AppStatusEnum.RUNNING.value, prefix="app-"):
+    return AppInstanceModel.objects.bulk_create([
+        AppInstanceModel(app_name=f"{prefix}{i}", url_path=f"{prefix}{i}", location=location, status=status,
+                         created_at=timezone.now(), api_token=f"token-{prefix}{i}", using_compose=False)
+        for i in range(count)
+    ])
+
+def mock_docker_client(containers):
+    docker_client = mock.Mock()
+    docker_client.api.containers.return_value = [
+        { "Id": name, "Names": [f"/{name}"], "State": state, "Labels": {} }
+        for name, state in containers
+    ]
+    return docker_client
+
+class InstanceStatusTests(TestCase):
+    instance_count = 500
+
+    def setUp(self):
+        self.location = create_location()
+        create_instances(self.location, self.instance_count)
+
+    def get_statuses(self, containers):
+        with mock.patch("main.instance_status.get_docker_client", return_value=mock_docker_client(containers)):
+            return get_instance_statuses()
+
+    def test_unchanged_statuses_are_not_written(self):
+        containers = [(f"app-{i}", "running") for i in range(self.instance_count)]
+
+        # Only the instance listing query
+        with self.assertNumQueries(1):
+            statuses = self.get_statuses(containers)
+
+        self.assertEqual(len(statuses), self.instance_count)
+        self.assertTrue(all(entry["status"] == "RUNNING" for entry in statuses))
+
+    def test_changed_statuses_are_written_in_bulk(self):
+        containers = [(f"app-{i}", "exited") for i in range(self.instance_count)]
+
+        # Listing query, savepoint and its release, the batched UPDATE statements and
+        # the topology revision bump. The count must not grow with the number of instances.
+        # SQLite limits the number of parameters per statement, so it needs more batches.
+        batch_size = connection.ops.bulk_batch_size(["pk", "pk", "status"], range(self.instance_count))
+
+        with self.assertNumQueries(4 + math.ceil(self.instance_count / batch_size)):
+            self.get_statuses(containers)
+
+        self.assertEqual(AppInstanceModel.objects.filter(status=AppStatusEnum.PAUSED.value).count(), self.instance_count)
+
+    def test_only_changed_rows_are_written(self):
+        containers = [(f"app-{i}", "running") for i in range(self.instance_count)]
+        containers[0] = ("app-0", "exited")
+
+        with self.assertNumQueries(5):
+            self.get_statuses(containers)
+
+        self.assertEqual(AppInstanceModel.objects.get(app_name="app-0").status, AppStatusEnum.PAUSED.value)
+        self.assertEqual(AppInstanceModel.objects.filter(status=AppStatusEnum.RUNNING.value).count(), self.instance_count - 1)
+
+    def test_removed_instances_with_stopped_containers(self):
+        AppInstanceModel.objects.filter(app_name="app-0").update(status=AppStatusEnum.REMOVED.value)
+        AppInstanceModel.objects.filter(app_name="app-1").update(status=AppStatusEnum.REMOVED.value)
+        containers = [(f"app-{i}", "running") for i in range(2, self.instance_count)]
+        containers.append(("app-0", "exited"))
+        statuses = { x["instance"].app_name: x for x in self.get_statuses(containers) }
+
+        self.assertEqual(statuses["app-0"]["status"], "REMOVED")
+        self.assertEqual(statuses["app-0"]["status_message"], "Containers are stopped")
+        self.assertFalse(statuses["app-0"]["is_error"])
+        self.assertEqual(statuses["app-1"]["status_message"], "Containers removed. Data removed!")
+        self.assertTrue(statuses["app-1"]["is_error"])
+
+class LifecycleJobTests(TestCase):
+    def setUp(self):
+        create_instances(create_location(), 1)
+        self.instance = AppInstanceModel.objects.get()
+
+    def test_queued_jobs_are_run_once(self):
+        handler = mock.Mock(return_value="Done")
+        job = jobs.enqueue_job(JobActionEnum.RESTART, self.instance)
+
+        with mock.patch.dict(jobs.JOB_HANDLERS, { JobActionEnum.RESTART.value: handler }):
+            jobs.process_jobs()
+            jobs.process_jobs()
+
+        job.refresh_from_db()
+        handler.assert_called_once()
+        self.assertEqual(job.status, JobStatusEnum.SUCCEEDED.value)
+        self.assertEqual(job.message, "Done")
+
+    def test_lifecycle_errors_fail_the_job(self):
+        handler = mock.Mock(side_effect=LifecycleError("App failed to restart!"))
+        job = jobs.enqueue_job(JobActionEnum.RESTART, self.instance)
+
+        with mock.patch.dict(jobs.JOB_HANDLERS, { JobActionEnum.RESTART.value: handler }):
+            jobs.process_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatusEnum.FAILED.value)
+        self.assertEqual(job.message, "App failed to restart!")
+
+    @override_settings(AMSYS_OPERATION_TIMEOUT=5)
+    def test_hung_docker_operations_fail_the_job(self):
+        compose_job = jobs.enqueue_job(JobActionEnum.STOP, self.instance)
+        self.instance.using_compose = True
+
+        with mock.patch("main.lifecycle.get_instance_path", return_value=tempfile.gettempdir()), \
+                mock.patch("main.lifecycle.run", side_effect=subprocess.TimeoutExpired(["docker"], 5)) as run:
+            jobs.run_job(compose_job)
+
+        self.assertEqual(run.call_args.kwargs["timeout"], 5)
+        self.assertEqual(compose_job.status, JobStatusEnum.FAILED.value)
+        self.assertEqual(compose_job.message, "docker compose stop didn't finish within 5 seconds.")
+
+        sdk_job = jobs.enqueue_job(JobActionEnum.STOP, self.instance)
+        sdk_job.instance.using_compose = False
+        docker_client = mock.Mock()
+        docker_client.containers.get.return_value.stop.side_effect = requests.exceptions.ReadTimeout()
+
+        with mock.patch("main.lifecycle.get_instance_path", return_value=tempfile.gettempdir()), \
+                mock.patch("main.lifecycle.get_docker_client", return_value=docker_client):
+            jobs.run_job(sdk_job)
+
+        self.assertEqual(sdk_job.status, JobStatusEnum.FAILED.value)
+        self.assertEqual(sdk_job.message, "Docker didn't respond within 5 seconds. Try again later.")
+
+    def test_operations_invalidate_the_container_names(self):
+        cache.set(CONTAINER_NAMES_CACHE_KEY, { "app-0" })
+        docker_client = mock.Mock()
+
+        with mock.patch("main.lifecycle.get_instance_path", return_value=tempfile.gettempdir()), \
+                mock.patch("main.lifecycle.get_docker_client", return_value=docker_client):
+            stop_app(self.instance)
+
+        self.assertIsNone(cache.get(CONTAINER_NAMES_CACHE_KEY))
+
+    def test_abandoned_jobs_are_recovered(self):
+        def create_job(status, started_minutes_ago=None):
+            started_at = None if started_minutes_ago is None else timezone.now() - timedelta(minutes=started_minutes_ago)
+            return LifecycleJob.objects.create(action=JobActionEnum.RESTART.value, instance=self.instance, app_name="app-0",
+                                               status=status, created_at=timezone.now(), started_at=started_at)
+
+        abandoned = create_job(JobStatusEnum.RUNNING.value, started_minutes_ago=120)
+        running = create_job(JobStatusEnum.RUNNING.value, started_minutes_ago=1)
+        create_job(JobStatusEnum.QUEUED.value)
+        executor = mock.Mock()
+
+        with override_settings(AMSYS_JOB_TIMEOUT=3600), mock.patch("main.jobs.get_executor", return_value=executor):
+            self.assertEqual(jobs.recover_jobs(), 1)
+
+        abandoned.refresh_from_db()
+        running.refresh_from_db()
+        self.assertEqual(abandoned.status, JobStatusEnum.FAILED.value)
+        self.assertIsNotNone(abandoned.finished_at)
+        self.assertEqual(running.status, JobStatusEnum.RUNNING.value)
+        executor.submit.assert_called_once_with(jobs.process_jobs)
+
+    def test_abandoned_jobs_dont_block_the_instance(self):
+        self.client.force_login(User.objects.create_superuser("admin"))
+        abandoned = LifecycleJob.objects.create(action=JobActionEnum.RESTART.value, instance=self.instance, app_name="app-0",
+                                                status=JobStatusEnum.RUNNING.value, created_at=timezone.now(),
+                                                started_at=timezone.now() - timedelta(seconds=settings.AMSYS_JOB_TIMEOUT + 60))
+
+        self.assertIsNone(jobs.get_active_job(self.instance))
+        self.assertEqual(start_bulk_action("stop", [self.instance])[1], [])
+
+        # Pollers of the job see it fail
+        response = self.client.get(f"/job_status/{abandoned.pk}/")
+        self.assertEqual(response.json()["status"], "FAILED")
+        self.assertTrue(response.json()["finished"])
+
+    def test_operations_wait_for_unfinished_jobs(self):
+        self.client.force_login(User.objects.create_superuser("admin"))
+        jobs.enqueue_job(JobActionEnum.RESTART, self.instance)
+
+        with mock.patch("main.views.stop_app") as stop_app:
+            response = self.client.get("/stop_instance/app-0/")
+
+        self.assertEqual(response.status_code, 409)
+        stop_app.assert_not_called()
+
+class BulkActionTests(TestCase):
+    def setUp(self):
+        create_instances(create_location(), 6)
+
+    def test_instances_must_be_selected(self):
+        self.assertIsNone(select_instances())
+        self.assertEqual(select_instances(app_names=["app-1", "app-2"]).count(), 2)
+        self.assertEqual(select_instances(status="RUNNING").count(), 6)
+
+    def test_one_job_is_queued_per_instance(self):
+        busy = AppInstanceModel.objects.get(app_name="app-2")
+        jobs.enqueue_job(JobActionEnum.RECREATE, busy)
+        handler = mock.Mock(return_value="Done")
+        new_jobs, skipped = start_bulk_action("restart", select_instances(status="RUNNING").order_by("pk"))
+
+        self.assertEqual([x.app_name for x in new_jobs], ["app-0", "app-1", "app-3", "app-4", "app-5"])
+        self.assertEqual(skipped, [busy])
+
+        with mock.patch.dict(jobs.JOB_HANDLERS, { JobActionEnum.RESTART.value: handler, JobActionEnum.RECREATE.value: handler }):
+            jobs.process_jobs()
+
+        self.assertEqual(handler.call_count, 6)
+
+    def test_bulk_action_view(self):
+        self.client.force_login(User.objects.create_superuser("admin"))
+
+        def post(data):
+            return self.client.post("/bulk_instance_action/", data=data, content_type="application/json")
+
+        response = post({ "action": "stop", "location": AppInstanceModel.objects.first().location.pk })
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(response.json()["jobs"]), 6)
+        self.assertEqual(LifecycleJob.objects.filter(action=JobActionEnum.STOP.value).count(), 6)
+
+        self.assertEqual(post({ "action": "stop", "location": "abc" }).status_code, 400)
+        self.assertEqual(post({ "action": "stop", "organization": [1] }).status_code, 400)
+        self.assertEqual(post({ "action": "stop", "app_names": "app-1" }).status_code, 400)
+        self.assertEqual(post({ "action": "stop" }).status_code, 400)
+
+class DockerClientTests(TestCase):
+    def setUp(self):
+        self.addCleanup(reset_docker_client)
+        reset_docker_client()
+
+    def test_health_check_doesnt_block_other_threads(self):
+        old_client, new_client = mock.Mock(), mock.Mock()
+        ping_started, ping_finished = threading.Event(), threading.Event()
+
+        def slow_ping(timeout):
+            ping_started.set()
+            ping_finished.wait(5)
+            return False
+
+        old_client.ping.side_effect = slow_ping
+
+        with mock.patch("main.docker_client._create_client", side_effect=[old_client, new_client]):
+            self.assertIs(get_docker_client(), old_client)
+
+            with mock.patch("main.docker_client._last_health_check", 0.0):
+                checker = ThreadPoolExecutor(max_workers=1).submit(get_docker_client)
+                self.assertTrue(ping_started.wait(5))
+
+                # Other threads get the current client while the ping is running
+                self.assertIs(get_docker_client(), old_client)
+
+                ping_finished.set()
+                self.assertIs(checker.result(5), new_client)
+
+        self.assertEqual(old_client.ping.call_args.kwargs["timeout"], HEALTH_CHECK_TIMEOUT)
+        old_client.close.assert_called_once()
+        self.assertIs(get_docker_client(), new_client)
+
+class ProxyStateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_event_updates_reach_other_processes(self):
+        # The reconciler's update is seen by another process, e.g. a web worker
+        update_proxy_state_from_event({ "Action": "stop", "Actor": { "Attributes": { "name": "amsys-traefik" } } })
+        other_process = subprocess.run([sys.executable, "manage.py", "shell", "-c",
+                                        f"from django.core.cache import cache; print(cache.get('{PROXY_STATE_CACHE_KEY}'))"],
+                                       cwd=settings.BASE_DIR, capture_output=True, text=True)
+        self.assertEqual(other_process.stdout.strip(), "False")
+
+        with mock.patch("main.proxy_state.fetch_proxy_state") as fetch_proxy_state:
+            update_proxy_state_from_event({ "Action": "start" })
+            self.assertTrue(is_proxy_running())
+
+        fetch_proxy_state.assert_not_called()
+
+class InstanceApiTests(TestCase):
+    def setUp(self):
+        # The caches live in memory, so they aren't rolled back between tests
+        token_digest_cache.clear()
+        certificate_cache.clear()
+        create_instances(create_location(), 3)
+        self.instance = AppInstanceModel.objects.get(app_name="app-0")
+        AppInstanceModel.objects.filter(app_name="app-1").update(status=AppStatusEnum.PAUSED.value)
+        AppInstanceModel.objects.filter(app_name="app-2").update(status=AppStatusEnum.STOPPED.value)
+
+    def api_get(self, name, instance=None):
+        instance = instance or self.instance
+        return self.client.get(f"/api/{name}/{instance.pk}/", headers={ "X-API-Token": instance.api_token })
+
+    def test_existing_instances(self):
+        with mock.patch("main.views.get_container_names", return_value={ "app-0", "app-1" }):
+            # Authentication and the instance listing
+            with self.assertNumQueries(2):
+                response = self.api_get("existing_instances")
+
+            # The token digest is cached after the first request
+            with self.assertNumQueries(1):
+                response = self.api_get("existing_instances")
+
+        self.assertEqual([x["name"] for x in response.json()["instances"]], ["app-0", "app-1"])
+
+    def test_invalid_token_is_forbidden(self):
+        response = self.client.get(f"/api/existing_instances/{self.instance.pk}/", headers={ "X-API-Token": "wrong" })
+        self.assertEqual(response.status_code, 403)
+
+        response = self.client.get(f"/api/existing_instances/{self.instance.pk}/")
+        self.assertEqual(response.status_code, 403)
+
+    def test_changed_token_invalidates_cache(self):
+        old_token = self.instance.api_token
+        self.assertEqual(self.api_get("available_destinations").status_code, 200)
+
+        self.instance.api_token = "new-token"
+        self.instance.save()
+
+        response = self.client.get(f"/api/available_destinations/{self.instance.pk}/", headers={ "X-API-Token": old_token })
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.api_get("available_destinations").status_code, 200)
+
+    def test_token_changed_by_another_process_expires(self):
+        old_token = self.instance.api_token
+        self.assertEqual(self.api_get("available_destinations").status_code, 200)
+
+        # update() doesn't send post_save, like a save made by another process
+        AppInstanceModel.objects.filter(pk=self.instance.pk).update(api_token="new-token")
+        self.assertEqual(self.api_get("available_destinations").status_code, 200)
+
+        expired = time.monotonic() + settings.AMSYS_API_AUTH_CACHE_TTL + 1
+
+        with mock.patch("main.caching.time.monotonic", return_value=expired):
+            response = self.client.get(f"/api/available_destinations/{self.instance.pk}/", headers={ "X-API-Token": old_token })
+            self.assertEqual(response.status_code, 403)
+
+    def test_deleted_instance_is_not_found(self):
+        self.assertEqual(self.api_get("instance_info").status_code, 200)
+        digest = token_digest_cache.get(self.instance.pk)
+        AppInstanceModel.objects.filter(pk=self.instance.pk).delete()
+        # The digest is still cached in other processes
+        token_digest_cache.set(self.instance.pk, digest)
+
+        self.assertEqual(self.api_get("instance_info").status_code, 404)
+
+    def test_instance_info(self):
+        response = self.api_get("instance_info")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["owner_org"]["id"], self.instance.location.owner_org.pk)
+
+    def test_unchanged_topology_is_not_modified(self):
+        etag = self.api_get("instance_info")["ETag"]
+        headers = { "X-API-Token": self.instance.api_token, "If-None-Match": etag }
+
+        # Only the topology revision is queried
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/api/instance_info/{self.instance.pk}/", headers=headers)
+
+        self.assertEqual(response.status_code, 304)
+
+        AppConnectionModel.objects.create(instance_from=self.instance, instance_to=AppInstanceModel.objects.get(app_name="app-1"))
+        response = self.client.get(f"/api/instance_info/{self.instance.pk}/", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_status_change_modifies_topology(self):
+        etag = self.api_get("available_destinations")["ETag"]
+        headers = { "X-API-Token": self.instance.api_token, "If-None-Match": etag }
+
+        instance = AppInstanceModel.objects.get(app_name="app-1")
+        instance.status = AppStatusEnum.RUNNING.value
+        save_instance_statuses([instance])
+
+        response = self.client.get(f"/api/available_destinations/{self.instance.pk}/", headers=headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_only_topology_changes_bump_the_revision(self):
+        revision = get_topology_revision()
+
+        # One query to compare the stored fields and one for the save
+        with self.assertNumQueries(2):
+            self.instance.info = "Changed"
+            self.instance.container_image = "changed"
+            self.instance.save()
+
+        with self.assertNumQueries(1):
+            self.instance.save(update_fields=["info"])
+
+        self.instance.status = AppStatusEnum.RUNNING.value
+        self.instance.save(update_fields=["status"])
+        self.assertEqual(get_topology_revision(), revision)
+
+        self.instance.status = AppStatusEnum.PAUSED.value
+        self.instance.save(update_fields=["status"])
+        self.assertEqual(get_topology_revision(), revision + 1)
+
+        self.instance.location = LocationModel.objects.create(location_name="other", owner_org=self.instance.location.owner_org,
+                                                              latitude=1, longitude=1)
+        self.instance.save()
+        self.assertEqual(get_topology_revision(), revision + 3)
+
+    def test_topology_revision_row_is_recreated(self):
+        TopologyRevision.objects.all().delete()
+        bump_topology_revision()
+        bump_topology_revision()
+        self.assertEqual(get_topology_revision(), 2)
+
+    async def test_topology_events_stream_snapshot(self):
+        await sync_to_async(AppConnectionModel.objects.create)(instance_from=self.instance,
+            instance_to=await AppInstanceModel.objects.aget(app_name="app-1"))
+
+        response = await self.async_client.get(f"/api/topology_events/{self.instance.pk}/",
+                                               headers={ "X-API-Token": self.instance.api_token })
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        snapshot = await anext(response.streaming_content)
+        self.assertTrue(snapshot.startswith(b"retry: 1000\nevent: snapshot\n"))
+        self.assertIn(b'"app_name": "app-1", "status": "PAUSED"', snapshot)
+
+    async def test_topology_events_requires_token(self):
+        response = await self.async_client.get(f"/api/topology_events/{self.instance.pk}/", headers={ "X-API-Token": "wrong" })
+        self.assertEqual(response.status_code, 403)
+
+    def test_topology_events_need_asgi(self):
+        response = self.client.get(f"/api/topology_events/{self.instance.pk}/", headers={ "X-API-Token": self.instance.api_token })
+        self.assertEqual(response.status_code, 501)
+
+    @override_settings(AMSYS_TOPOLOGY_POLL_INTERVAL=0)
+    async def test_topology_events_stream_ends_when_token_changes(self):
+        response = await self.async_client.get(f"/api/topology_events/{self.instance.pk}/",
+                                               headers={ "X-API-Token": self.instance.api_token })
+        snapshot = await anext(response.streaming_content)
+        self.assertIn(b"event: snapshot\n", snapshot)
+
+        self.instance.api_token = "new-token"
+        await self.instance.asave()
+
+        with self.assertRaises(StopAsyncIteration):
+            await anext(response.streaming_content)
+
+    @override_settings(AMSYS_TOPOLOGY_POLL_INTERVAL=0.01, AMSYS_TOPOLOGY_STREAM_DURATION=0.1)
+    async def test_topology_events_stream_ends_after_its_duration(self):
+        # Disconnected clients aren't noticed, so every stream has to end by itself
+        response = await self.async_client.get(f"/api/topology_events/{self.instance.pk}/",
+                                               headers={ "X-API-Token": self.instance.api_token })
+        events = [x async for x in response.streaming_content]
+
+        self.assertEqual(len(events), 1)
+        self.assertIn(b"event: snapshot\n", events[0])
+
+    def test_destination_delta(self):
+        old = { 1: { "id": 1, "status": "RUNNING" }, 2: { "id": 2, "status": "RUNNING" } }
+        new = { 1: { "id": 1, "status": "STOPPED" }, 3: { "id": 3, "status": "RUNNING" } }
+
+        delta = diff_destinations(old, new)
+        self.assertEqual(delta["added"], [{ "id": 3, "status": "RUNNING" }])
+        self.assertEqual(delta["removed"], [2])
+        self.assertEqual(delta["changed"], [{ "id": 1, "status": "STOPPED" }])
+
+    def test_ssh_certificate_is_signed_in_process(self):
+        ca_key = ed25519.Ed25519PrivateKey.generate()
+        user_key = ed25519.Ed25519PrivateKey.generate()
+        public_key = user_key.public_key().public_bytes(serialization.Encoding.OpenSSH, serialization.PublicFormat.OpenSSH).decode()
+
+        with mock.patch("main.ssh_certificates._ca_key", ca_key):
+            response = self.client.post(f"/api/get_ssh_certificate/{self.instance.pk}/",
+                                        data={ "public_key": public_key + " user@host" }, content_type="application/json",
+                                        headers={ "X-API-Token": self.instance.api_token })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["certificate"].endswith(" user@host\n"))
+
+        certificate = serialization.load_ssh_public_identity(response.json()["certificate"].encode())
+        certificate.verify_cert_signature()
+        self.assertEqual(certificate.key_id, str(self.instance.pk).encode())
+        self.assertEqual(certificate.valid_principals, [b"remote"])
+        # Valid for five minutes, backdated by one to two minutes like ssh-keygen does
+        self.assertTrue(5 * 60 + 59 <= certificate.valid_before - certificate.valid_after <= 5 * 60 + 118)
+
+    def test_ssh_certificate_validity_matches_ssh_keygen(self):
+        user_key = ed25519.Ed25519PrivateKey.generate().public_key()
+        # Valid-from times OpenSSH 9.2 ssh-keygen -V +5m gave certificates signed at these times
+        cases = { 1792321319: 1792321260, 1792321320: 1792321260, 1792321350: 1792321260 }
+
+        with mock.patch("main.ssh_certificates._ca_key", ed25519.Ed25519PrivateKey.generate()):
+            for now, valid_after in cases.items():
+                certificate, _ = build_certificate(user_key, "1", now)
+                self.assertEqual(serialization.load_ssh_public_identity(certificate.encode()).valid_after, valid_after)
+
+    def test_ssh_certificate_is_reused_until_close_to_expiry(self):
+        user_key = ed25519.Ed25519PrivateKey.generate()
+        public_key = user_key.public_key().public_bytes(serialization.Encoding.OpenSSH, serialization.PublicFormat.OpenSSH).decode()
+        now = time.time()
+
+        with mock.patch("main.ssh_certificates._ca_key", ed25519.Ed25519PrivateKey.generate()):
+            with mock.patch("main.ssh_certificates.time.time", return_value=now):
+                first = sign_public_key(public_key, "1")
+                # Certificates contain a random nonce, so equal certificates come from the cache
+                self.assertEqual(sign_public_key(public_key + " comment", "1"), first.strip() + " comment\n")
+                self.assertNotEqual(sign_public_key(public_key, "2"), first)
+
+            with mock.patch("main.ssh_certificates.time.time", return_value=now + 4.5 * 60):
+                self.assertNotEqual(sign_public_key(public_key, "1"), first)
+
+    def test_invalid_public_key_is_rejected(self):
+        with mock.patch("main.ssh_certificates._ca_key", ed25519.Ed25519PrivateKey.generate()):
+            response = self.client.post(f"/api/get_ssh_certificate/{self.instance.pk}/",
+                                        data={ "public_key": "ssh-ed25519 garbage" }, content_type="application/json",
+                                        headers={ "X-API-Token": self.instance.api_token })
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_wrong_method_is_not_allowed(self):
+        response = self.client.post(f"/api/existing_instances/{self.instance.pk}/", headers={ "X-API-Token": self.instance.api_token })
+        self.assertEqual(response.status_code, 405)
+
+class LookupConstraintTests(TestCase):
+    def setUp(self):
+        self.location = create_location()
+        create_instances(self.location, 2)
+
+    def test_duplicate_app_name_is_rejected_by_form(self):
+        form = forms.AppInstanceForm(data={ "app_name": "app-0", "url_path": "other", "location": self.location.pk })
+        self.assertFalse(form.is_valid())
+        self.assertIn("app_name", form.errors)
+
+    def test_duplicate_url_path_is_rejected_by_database(self):
+        with self.assertRaises(IntegrityError):
+            AppInstanceModel.objects.create(app_name="other", url_path="app-0", location=self.location,
+                                            status=AppStatusEnum.RUNNING.value, created_at=timezone.now(),
+                                            api_token="token", using_compose=False)
+
+    def test_benchmark_rolls_back_generated_rows(self):
+        call_command("benchmark_lookups", instances=20, repeat=2, stdout=io.StringIO())
+        self.assertEqual(AppInstanceModel.objects.count(), 2)
+
+class LookupConstraintMigrationTests(TransactionTestCase):
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([("main", target)])
+        return executor.loader.project_state([("main", target)]).apps
+
+    def tearDown(self):
+        self.migrate(MigrationLoader(connection).graph.leaf_nodes("main")[0][1])
+
+    def test_duplicates_stop_the_migration(self):
+        apps = self.migrate("0027_instance_listing_indexes")
+        Organization = apps.get_model("main", "OrganizationEntity")
+        Location = apps.get_model("main", "LocationModel")
+        Instance = apps.get_model("main", "AppInstanceModel")
+        org = Organization.objects.create(org_name="org", nationality="FI")
+        location = Location.objects.create(location_name="location", owner_org=org, latitude=0, longitude=0)
+
+        for url_path in ["first", "second"]:
+            Instance.objects.create(app_name="dup", url_path=url_path, location=location, status=AppStatusEnum.RUNNING.value,
+                                    created_at=timezone.now(), api_token="token", using_compose=False)
+
+        with self.assertRaisesMessage(RuntimeError, "app_name 'dup' is used by the instances with IDs"):
+            self.migrate("0028_lookup_constraints")
+
+        Instance.objects.filter(url_path="second").update(app_name="unique")
+        self.migrate("0028_lookup_constraints")
+
+class AdvancedSettingsStorageTests(TestCase):
+    def setUp(self):
+        self.instance = create_instances(create_location(), 1)[0]
+
+    def test_settings_are_stored_as_json(self):
+        settings = ImageBasedAppAdvancedSettings()
+        settings.set_env_vars(["KEY"], ["x" * 2000])
+        settings.set_volumes(["data"], ["/data"])
+        set_instance_advanced_settings(self.instance, settings)
+
+        instance = AppInstanceModel.objects.get(pk=self.instance.pk)
+        self.assertEqual(ImageBasedAppAdvancedSettings.from_instance(instance).env_dict, { "KEY": "x" * 2000 })
+        self.assertTrue(AppInstanceModel.objects.filter(instance_volumes__has_key="data").exists())
+
+    def test_form_renders_settings_as_json(self):
+        self.instance.instance_directories = ["data", "logs"]
+        form = forms.AppInstanceForm(instance=self.instance)
+        self.assertIn('value="[&quot;data&quot;, &quot;logs&quot;]"', str(form["instance_directories"]))
+
+class DatabaseProfileTests(TestCase):
+    # Journal and synchronous modes can't be changed inside the test transaction
+    @skipUnless(connection.vendor == "sqlite", "SQLite only")
+    @override_settings(AMSYS_SQLITE_PRAGMAS={ "cache_size": -4000 })
+    def test_pragmas_are_applied(self):
+        apply_sqlite_pragmas(connection)
+
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA cache_size")
+            self.assertEqual(cursor.fetchone()[0], -4000)
+
+    def test_stress_command(self):
+        output = io.StringIO()
+        call_command("stress_sqlite", workers=2, seconds=0.2, stdout=output)
+        self.assertIn("production:", output.getvalue())
+
+@override_settings(AMSYS_INSTANCES_PER_PAGE=20)
+class InstanceListingTests(TestCase):
+    def setUp(self):
+        self.location = create_location()
+        create_instances(self.location, 45)
+        create_instances(self.location, 5, status=AppStatusEnum.STOPPED.value, prefix="stopped-")
+        self.client.force_login(User.objects.create_user("user"))
+
+    def get(self, url, **params):
+        docker_client = mock_docker_client([])
+
+        with mock.patch("main.instance_status.get_docker_client", return_value=docker_client), \
+             mock.patch("main.views.is_proxy_running", return_value=True):
+            response = self.client.get(url, data=params)
+
+        return response, docker_client
+
+    def test_only_the_current_page_is_checked(self):
+        response, docker_client = self.get("/", page=2)
+
+        names = [x["instance"].app_name for x in response.context["instance_statuses"]]
+        self.assertEqual(len(names), 20)
+        self.assertEqual(docker_client.api.containers.call_args.kwargs["filters"], { "name": names })
+
+    def test_filters(self):
+        response, _ = self.get("/instance_list/", status="STOPPED")
+        self.assertEqual(response.json()["count"], 5)
+
+        response, _ = self.get("/instance_list/", name="app-1")
+        self.assertEqual([x["app_name"] for x in response.json()["instances"]], ["app-1"] + [f"app-{i}" for i in range(10, 20)])
+
+        response, _ = self.get("/instance_list/", organization=self.location.owner_org.pk, page=3)
+        self.assertEqual(response.json()["page"], 3)
+        self.assertFalse(response.json()["has_next"])
+
+    def test_invalid_filter(self):
+        response, _ = self.get("/instance_list/", status="SLEEPING")
+        self.assertEqual(response.status_code, 400)
+
+class MapViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user("user"))
+
+    def create_topology(self, location_count, instances_per_location, spacing=1, prefix="app"):
+        org = OrganizationEntity.objects.create(org_name="org", nationality="FI")
+        instances = []
+
+        for i in range(location_count):
+            location = LocationModel.objects.create(location_name=f"location-{i}", owner_org=org, latitude=i * spacing, longitude=i * spacing)
+            instances.extend(create_instances(location, instances_per_location, prefix=f"{prefix}-{i}-"))
+
+        for inst_from, inst_to in zip(instances, instances[1:]):
+            AppConnectionModel.objects.create(instance_from=inst_from, instance_to=inst_to)
+
+    def get_map_data(self, **params):
+        response = self.client.get("/map_data/", data=params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def count_map_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            self.get_map_data(**params)
+
+        return len(queries)
+
+    def test_query_count_does_not_grow(self):
+        self.create_topology(2, 2)
+        small_count = self.count_map_queries()
+        cache.clear()
+        self.create_topology(10, 10, prefix="large")
+        self.assertEqual(self.count_map_queries(), small_count)
+
+    def test_data_is_cached_until_topology_changes(self):
+        self.create_topology(2, 2)
+        uncached_count = self.count_map_queries()
+        self.assertEqual(self.count_map_queries(), uncached_count - 3)
+
+        # The serialized response is cached, nearby viewports share it
+        with mock.patch("main.map_data.get_map_view", return_value={ "clusters": [], "edges": [] }) as get_map_view:
+            self.get_map_data(zoom=10, bbox="1.01,1.01,2.01,2.01")
+            self.get_map_data(zoom=10, bbox="1.02,1.02,2.02,2.02")
+
+        get_map_view.assert_called_once()
+
+        location = LocationModel.objects.first()
+        location.location_name = "renamed"
+        location.save()
+
+        names = [x["location"]["location_name"] for x in self.get_map_data(zoom=15)["clusters"]]
+        self.assertIn("renamed", names)
+
+    def test_connections_are_aggregated_per_location_pair(self):
+        self.create_topology(2, 3, spacing=10)
+        data = self.get_map_data(zoom=15, color_by_status=1)
+
+        # Connections inside a location aren't drawn. The apps are connected in a chain,
+        # so only one connection crosses between the locations.
+        self.assertEqual(data["edges"], [{ "from": [0, 0], "to": [10, 10], "weight": 1, "status": "running" }])
+        self.assertEqual([x["app_count"] for x in data["clusters"]], [3, 3])
+
+    def test_nearby_locations_are_clustered_when_zoomed_out(self):
+        self.create_topology(4, 1, spacing=0.01)
+
+        self.assertEqual(len(self.get_map_data(zoom=15)["clusters"]), 4)
+
+        clusters = self.get_map_data(zoom=2)["clusters"]
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(clusters[0]["location_count"], 4)
+        self.assertIsNone(clusters[0]["location"])
+        self.assertEqual(self.get_map_data(zoom=2)["edges"], [])
+
+    def test_bbox_limits_clusters(self):
+        self.create_topology(3, 1, spacing=10)
+        data = self.get_map_data(zoom=15, bbox="-5,-5,15,15")
+
+        self.assertEqual([x["location"]["location_name"] for x in data["clusters"]], ["location-0", "location-1"])
+        # Edges to locations outside the viewport are kept so lines leave the screen
+        self.assertEqual(len(data["edges"]), 2)
+
+    def test_map_page_loads_data_from_api(self):
+        response = self.client.get("/map/")
+        self.assertContains(response, 'const map_data_url = "/map_data/";')
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get("/map_data/", data={ "zoom": "x" }).status_code, 400)
+        self.assertEqual(self.client.get("/map_data/", data={ "bbox": "1,2,3" }).status_code, 400)
+
+class ViewQueryBoundTests(TestCase):
+    # Query counts must not grow with the number of instances, connections or locations
+    instance_count = 1000
+    location_count = 20
+
+    def setUp(self):
+        token_digest_cache.clear()
+        sync_template_files()
+        org = OrganizationEntity.objects.create(org_name="org", nationality="FI")
+        locations = LocationModel.objects.bulk_create([
+            LocationModel(location_name=f"location-{i}", owner_org=org, latitude=i, longitude=i)
+            for i in range(self.location_count)
+        ])
+        instances = create_instances(locations[0], self.instance_count)
+        self.instance = AppInstanceModel.objects.get(app_name="app-0")
+        AppConnectionModel.objects.bulk_create([
+            AppConnectionModel(instance_from=self.instance, instance_to=x) for x in instances[1:]
+        ])
+        self.client.force_login(User.objects.create_superuser("admin"))
+
+    def assertMaxQueries(self, max_queries, url, headers=None):
+        with mock.patch("main.instance_status.get_docker_client", return_value=mock_docker_client([])), \
+             mock.patch("main.views.get_container_names", return_value=set()), \
+             mock.patch("main.views.is_proxy_running", return_value=True), \
+             CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, headers=headers or {})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), max_queries, f"{url} made {len(queries)} queries")
+
+    def test_dashboard_views(self):
+        # Including the session and user lookups
+        self.assertMaxQueries(11, "/")
+        self.assertMaxQueries(4, "/instance_list/")
+        self.assertMaxQueries(5, "/view_location/location-0/")
+        self.assertMaxQueries(4, "/view_organization/org/")
+        self.assertMaxQueries(6, "/map_data/")
+
+    def test_instance_views(self):
+        self.assertMaxQueries(4, "/view_instance/app-0/")
+        self.assertMaxQueries(9, "/edit_instance/app-0/")
+        self.assertMaxQueries(8, "/create_app_instance/")
+
+    def test_api_views(self):
+        headers = { "X-API-Token": self.instance.api_token }
+
+        self.assertMaxQueries(3, f"/api/available_destinations/{self.instance.pk}/", headers)
+        self.assertMaxQueries(3, f"/api/instance_info/{self.instance.pk}/", headers)
+        self.assertMaxQueries(1, f"/api/existing_instances/{self.instance.pk}/", headers)
+
+class TemplateFileCatalogTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.enterContext(override_settings(INSTANCE_TEMPLATE_FILES_DIR=self.tmp_dir.name))
+
+        for name in ["a.conf", "b.conf"]:
+            self.write_file(name)
+
+        # Subdirectories such as __pycache__ aren't template files
+        os.mkdir(f"{self.tmp_dir.name}/subdirectory")
+        # Recently modified directories are always synced
+        os.utime(self.tmp_dir.name, (time.time() - 60, time.time() - 60))
+
+    def write_file(self, name):
+        with open(f"{self.tmp_dir.name}/{name}", "w") as f:
+            f.write(name)
+
+    def filenames(self):
+        return sorted(TemplateFileModel.objects.values_list("filename", flat=True))
+
+    def test_files_are_synced_in_bulk(self):
+        # Reading the synced mtime, savepoint, delete, select, insert, release and storing
+        # the mtime regardless of the number of files
+        with self.assertNumQueries(7):
+            sync_template_files()
+
+        self.assertEqual(self.filenames(), ["a.conf", "b.conf"])
+
+    def test_unchanged_directory_is_not_synced(self):
+        sync_template_files()
+
+        # Only the synced mtime is read
+        with self.assertNumQueries(1), mock.patch("main.template_files.os.scandir") as scandir:
+            forms.AppInstanceForm()
+
+        scandir.assert_not_called()
+
+    def test_row_changes_invalidate_the_sync_in_every_process(self):
+        sync_template_files()
+        # The admin site can remove rows in another process
+        TemplateFileModel.objects.filter(filename="a.conf").delete()
+        self.assertFalse(TemplateFileSync.objects.exists())
+
+        sync_template_files()
+        self.assertEqual(self.filenames(), ["a.conf", "b.conf"])
+
+    def test_changes_are_synced(self):
+        sync_template_files()
+        template_file = TemplateFileModel.objects.get(filename="a.conf")
+        os.remove(f"{self.tmp_dir.name}/a.conf")
+        self.write_file("c.conf")
+
+        sync_template_files()
+
+        self.assertEqual(self.filenames(), ["b.conf", "c.conf"])
+        self.assertFalse(TemplateFileModel.objects.filter(pk=template_file.pk).exists())
+
+class TemplateStoreTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.enterContext(override_settings(TEMPLATE_STORE_DIR=f"{self.tmp_dir.name}/store"))
+        self.instance_path = f"{self.tmp_dir.name}/instance"
+        os.mkdir(self.instance_path)
+
+        self.source_path = f"{self.tmp_dir.name}/seed.sql"
+        self.write(self.source_path, "create table seed;")
+        self.template_file = TemplateFileModel.objects.create(filename="seed.sql", filepath=self.source_path)
+        self.target_path = f"{self.instance_path}/seed.sql"
+
+    def write(self, path, content):
+        with open(path, "w") as f:
+            f.write(content)
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def provision(self):
+        return provision_template_files([self.template_file], self.instance_path)["seed.sql"]
+
+    def test_content_is_stored_by_hash(self):
+        self.assertIn(self.provision(), ["reflink", "copy"])
+
+        self.template_file.refresh_from_db()
+        self.assertEqual(self.template_file.sha256, hashlib.sha256(b"create table seed;").hexdigest())
+        self.assertEqual(self.read(get_object_path(self.template_file.sha256)), "create table seed;")
+        self.assertEqual(self.read(self.target_path), "create table seed;")
+        self.assertEqual(sorted(os.listdir(self.instance_path)), [".amsys-template-files.json", "seed.sql"])
+
+    def test_unchanged_files_are_skipped(self):
+        self.provision()
+        inode = os.stat(self.target_path).st_ino
+
+        # The source isn't hashed again while its size and modification time are the same
+        with self.assertNumQueries(0):
+            self.assertEqual(self.provision(), "skipped")
+
+        # Same content with a new modification time is hashed again but not copied
+        os.utime(self.source_path, (time.time() + 10, time.time() + 10))
+        self.assertEqual(self.provision(), "skipped")
+        self.assertEqual(os.stat(self.target_path).st_ino, inode)
+
+    def test_changed_files_are_replaced(self):
+        self.provision()
+        self.write(self.source_path, "create table seed (id integer);")
+
+        self.assertIn(self.provision(), ["reflink", "copy"])
+        self.assertEqual(self.read(self.target_path), "create table seed (id integer);")
+
+        # Files modified in the instance directory are restored
+        self.write(self.target_path, "drop table seed;")
+        self.assertIn(self.provision(), ["reflink", "copy"])
+        self.assertEqual(self.read(self.target_path), "create table seed (id integer);")
+
+    def test_instance_files_are_separate_from_the_store(self):
+        self.provision()
+        object_path = get_object_path(self.template_file.sha256)
+        self.assertFalse(os.path.samefile(self.target_path, object_path))
+
+        # Writes through the instance's file don't reach the stored content
+        self.write(self.target_path, "drop table seed;")
+        self.assertEqual(self.read(object_path), "create table seed;")
+
+        # A truncated object is stored again
+        os.chmod(object_path, 0o644)
+        self.write(object_path, "")
+        self.assertIn(self.provision(), ["reflink", "copy"])
+        self.assertEqual(self.read(self.target_path), "create table seed;")
+
+    def test_unreferenced_objects_are_pruned(self):
+        self.provision()
+        old_object_path = get_object_path(self.template_file.sha256)
+        self.write(self.source_path, "create table seed (id integer);")
+
+        # Objects are kept for a while in case another process has just stored them
+        self.provision()
+        self.assertTrue(os.path.exists(old_object_path))
+
+        expired = time.time() - PRUNE_GRACE_PERIOD - 1
+        os.utime(old_object_path, (expired, expired))
+        prune_template_store()
+        self.assertFalse(os.path.exists(old_object_path))
+        self.assertTrue(os.path.exists(get_object_path(self.template_file.sha256)))
+
+        # Objects of deleted template files are pruned too
+        new_object_path = get_object_path(self.template_file.sha256)
+        os.utime(new_object_path, (expired, expired))
+        self.template_file.delete()
+        prune_template_store()
+        self.assertFalse(os.path.exists(new_object_path))
+
+class TrashTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.base_path = self.tmp_dir.name
+        self.trash_path = get_trash_path(self.base_path)
+        self.instance_path = self.create_tree("app")
+
+    def create_tree(self, name):
+        path = f"{self.base_path}/{name}"
+        os.makedirs(f"{path}/uploads/nested")
+        os.symlink(f"{path}/uploads", f"{path}/link")
+
+        for i in range(20):
+            with open(f"{path}/uploads/nested/file-{i}", "w") as f:
+                f.write("data")
+
+        return path
+
+    def trash_entries(self):
+        return [x for x in os.listdir(self.trash_path) if x != ".lock"]
+
+    def test_instance_directory_is_renamed_into_trash(self):
+        with mock.patch("main.trash.start_trash_reaper") as start_reaper:
+            move_to_trash(self.instance_path)
+
+        self.assertFalse(os.path.exists(self.instance_path))
+        self.assertEqual(len(self.trash_entries()), 1)
+        start_reaper.assert_called_once_with(self.base_path)
+
+        self.assertTrue(empty_trash(self.trash_path))
+        self.assertEqual(self.trash_entries(), [])
+
+    def test_half_deleted_trees_are_recovered(self):
+        os.mkdir(self.trash_path)
+        os.rename(self.instance_path, f"{self.trash_path}/app-crashed")
+        shutil.rmtree(f"{self.trash_path}/app-crashed/uploads/nested")
+
+        self.assertTrue(empty_trash(self.trash_path))
+        self.assertEqual(self.trash_entries(), [])
+
+    def test_trash_is_emptied_by_one_process(self):
+        os.mkdir(self.trash_path)
+        os.rename(self.instance_path, f"{self.trash_path}/app")
+
+        with open(f"{self.trash_path}/.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self.assertFalse(empty_trash(self.trash_path))
+
+        self.assertEqual(len(self.trash_entries()), 1)
+
+    def test_undeletable_trees_are_skipped(self):
+        os.mkdir(self.trash_path)
+        os.rename(self.instance_path, f"{self.trash_path}/app-broken")
+        os.rename(self.create_tree("other"), f"{self.trash_path}/other")
+        delete_tree = trash.delete_tree
+
+        def fail_broken_tree(path):
+            if path.endswith("app-broken"):
+                raise PermissionError("Permission denied")
+
+            delete_tree(path)
+
+        with mock.patch("main.trash.delete_tree", side_effect=fail_broken_tree), \
+                mock.patch("builtins.print") as print_warning:
+            self.assertTrue(empty_trash(self.trash_path))
+
+        self.assertEqual(self.trash_entries(), ["app-broken"])
+        self.assertIn("app-broken", print_warning.call_args.args[0])
+
+    def test_gunicorn_workers_start_background_tasks(self):
+        config = runpy.run_path(f"{settings.BASE_DIR}/gunicorn.conf.py")
+
+        with mock.patch("main.startup.start_background_tasks") as start:
+            config["post_worker_init"](mock.Mock())
+
+        start.assert_called_once_with()
+
+    def test_reaper_deletes_in_background(self):
+        move_to_trash(self.instance_path)
+        deadline = time.monotonic() + 5
+
+        while self.trash_entries() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(self.trash_entries(), [])
@@ -0,0 +1,145 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .api_auth import is_valid_api_token
+from .models import TopologyRevision, AppInstanceModel, AppConnectionModel, LocationModel, OrganizationEntity, AppStatusEnum
+
+import asyncio
+import json
+import time
+
+TOPOLOGY_REVISION_PK = 1
+# Instance fields shown in the API responses and the map that use the revision
+TOPOLOGY_INSTANCE_FIELDS = {"app_name", "url_path", "location_id", "status"}
+KEEPALIVE_INTERVAL = 15
+# Milliseconds EventSource clients wait before reconnecting after a stream ends
+RECONNECT_DELAY = 1000
+
+def get_topology_revision() -> int:
+    revision = TopologyRevision.objects.filter(pk=TOPOLOGY_REVISION_PK).values_list("revision", flat=True).first()
+    return revision or 0
+
+def bump_topology_revision():
+    # Incremented in the database so that every process (web workers and the status
+    # reconciler) sees the same revision. The row is created by a migration.
+    updated = TopologyRevision.objects.filter(pk=TOPOLOGY_REVISION_PK).update(revision=F("revision") + 1)
+
+    if updated == 0:
+        # The table was emptied, e.g. by flush. Processes racing here each insert or find
+        # the row and then increment it, so no bump is lost.
+        TopologyRevision.objects.bulk_create([TopologyRevision(pk=TOPOLOGY_REVISION_PK)], ignore_conflicts=True)
+        TopologyRevision.objects.filter(pk=TOPOLOGY_REVISION_PK).update(revision=F("revision") + 1)
+
+def topology_etag(request, id, *args, **kwargs):
+    # Used with django.views.decorators.http.condition. The instance ID is included
+    # because the responses differ per instance.
+    return f"{id}-{get_topology_revision()}"
+
+@receiver(pre_save, sender=AppInstanceModel)
+def check_instance_topology_change(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Instances are saved often, e.g. when their settings or template files change, and
+    # every bump writes the same row. Only saves that change what the topology consists
+    # of bump the revision.
+    if update_fields is not None \
+            and TOPOLOGY_INSTANCE_FIELDS.isdisjoint(sender._meta.get_field(x).attname for x in update_fields):
+        instance._topology_changed = False
+        return
+
+    if instance._state.adding or raw:
+        instance._topology_changed = True
+        return
+
+    stored = AppInstanceModel.objects.filter(pk=instance.pk).values(*TOPOLOGY_INSTANCE_FIELDS).first()
+    instance._topology_changed = stored is None \
+        or any(stored[field] != getattr(instance, field) for field in TOPOLOGY_INSTANCE_FIELDS)
+
+@receiver(post_save, sender=AppInstanceModel)
+def bump_topology_revision_on_instance_change(sender, instance, **kwargs):
+    if getattr(instance, "_topology_changed", True):
+        bump_topology_revision()
+
+@receiver(post_delete, sender=AppInstanceModel)
+@receiver(post_save, sender=AppConnectionModel)
+@receiver(post_delete, sender=AppConnectionModel)
+@receiver(post_save, sender=LocationModel)
+@receiver(post_delete, sender=LocationModel)
+@receiver(post_save, sender=OrganizationEntity)
+@receiver(post_delete, sender=OrganizationEntity)
+def bump_topology_revision_on_change(sender, **kwargs):
+    bump_topology_revision()
+
+def get_instance_destinations(instance_id):
+    # Destinations of an instance keyed by their ID
+    connections = AppConnectionModel.objects.filter(instance_from__pk=instance_id).select_related("instance_to")
+
+    return {
+        c.instance_to.pk: {
+            "id": c.instance_to.pk,
+            "app_name": c.instance_to.app_name,
+            "status": AppStatusEnum(c.instance_to.status).name
+        } for c in connections
+    }
+
+def diff_destinations(old_destinations, new_destinations):
+    added = [d for pk, d in new_destinations.items() if pk not in old_destinations]
+    removed = [pk for pk in old_destinations.keys() if pk not in new_destinations]
+    changed = [d for pk, d in new_destinations.items() if pk in old_destinations and old_destinations[pk] != d]
+
+    return { "added": added, "removed": removed, "changed": changed }
+
+def format_event(event, data, event_id=None):
+    message = f"event: {event}\n"
+
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+
+    return message + f"data: {json.dumps(data)}\n\n"
+
+async def topology_event_stream(instance_id, api_token):
+    # Sends the destinations of the instance once and then only what changed.
+    # The revision is checked every poll interval, which is a single primary key
+    # lookup, so idle streams don't load the connection graph. The stream ends when the
+    # instance is deleted or its token changes, and after AMSYS_TOPOLOGY_STREAM_DURATION.
+    # Django doesn't notice when a streaming client disconnects, so without the time limit
+    # the stream of a client that went away would poll the database until the worker stops.
+    # Clients reconnect and get a new snapshot.
+    get_revision = sync_to_async(get_topology_revision)
+    get_destinations = sync_to_async(get_instance_destinations)
+    # Answered from the token digest cache most of the time
+    is_authorized = sync_to_async(is_valid_api_token)
+
+    revision = await get_revision()
+    destinations = await get_destinations(instance_id)
+    yield f"retry: {RECONNECT_DELAY}\n" \
+        + format_event("snapshot", { "revision": revision, "destinations": list(destinations.values()) }, revision)
+
+    deadline = time.monotonic() + settings.AMSYS_TOPOLOGY_STREAM_DURATION
+    idle_time = 0
+
+    while time.monotonic() < deadline:
+        await asyncio.sleep(settings.AMSYS_TOPOLOGY_POLL_INTERVAL)
+        idle_time += settings.AMSYS_TOPOLOGY_POLL_INTERVAL
+
+        if not await is_authorized(instance_id, api_token):
+            return
+
+        new_revision = await get_revision()
+
+        if new_revision != revision:
+            revision = new_revision
+            new_destinations = await get_destinations(instance_id)
+            delta = diff_destinations(destinations, new_destinations)
+            destinations = new_destinations
+
+            if len(delta["added"]) > 0 or len(delta["removed"]) > 0 or len(delta["changed"]) > 0:
+                delta["revision"] = revision
+                idle_time = 0
+                yield format_event("delta", delta, revision)
+                continue
+
+        # Comment lines keep proxies from closing idle connections
+        if idle_time >= KEEPALIVE_INTERVAL:
+            idle_time = 0
+            yield ": keepalive\n\n"
@@ -0,0 +1,132 @@
+from subprocess import run
+
+import fcntl
+import os
+import threading
+import time
+import traceback
+import uuid
+
+TRASH_DIRNAME = ".amsys-trash"
+LOCK_FILENAME = ".lock"
+# The reaper pauses after deleting this many entries so it doesn't saturate the disk
+DELETE_BATCH_SIZE = 500
+DELETE_BATCH_PAUSE = 0.05
+# Seconds between checks for trash that another process couldn't delete
+REAP_INTERVAL = 60
+
+_trash_paths = set()
+_reaper = None
+_reaper_lock = threading.Lock()
+_wake_reaper = threading.Event()
+
+def get_trash_path(base_path: str) -> str:
+    return f"{base_path}/{TRASH_DIRNAME}"
+
+def move_to_trash(path: str):
+    # Renames the directory into the trash next to it, which is instant regardless of its
+    # size, and leaves deleting it to the reaper
+    base_path = os.path.dirname(os.path.abspath(path))
+    trash_path = get_trash_path(base_path)
+    os.makedirs(trash_path, exist_ok=True)
+    os.rename(path, f"{trash_path}/{os.path.basename(path)}-{uuid.uuid4().hex}")
+
+    start_trash_reaper(base_path)
+
+def start_trash_reaper(base_path: str):
+    # Starts the reaper thread if it isn't running and has it empty the trash under the
+    # given directory. Called on startup to delete trash left behind by a crash.
+    global _reaper
+
+    with _reaper_lock:
+        _trash_paths.add(get_trash_path(base_path))
+
+        if _reaper is None or not _reaper.is_alive():
+            _reaper = threading.Thread(target=run_reaper, name="amsys-trash-reaper", daemon=True)
+            _reaper.start()
+
+    _wake_reaper.set()
+
+def run_reaper():
+    lower_io_priority()
+
+    while True:
+        _wake_reaper.clear()
+
+        with _reaper_lock:
+            trash_paths = list(_trash_paths)
+
+        for trash_path in trash_paths:
+            try:
+                empty_trash(trash_path)
+            except Exception:
+                traceback.print_exc()
+
+        _wake_reaper.wait(REAP_INTERVAL)
+
+def lower_io_priority():
+    # Idle I/O class for the reaper thread only, so deletes wait for the disk to be free
+    # of other work. Skipped if ionice isn't installed.
+    try:
+        run(["ionice", "-c", "3", "-p", str(threading.get_native_id())], capture_output=True)
+    except OSError:
+        pass
+
+def empty_trash(trash_path: str) -> bool:
+    # Returns False if another process is emptying the trash
+    if not os.path.isdir(trash_path):
+        return True
+
+    with open(f"{trash_path}/{LOCK_FILENAME}", "a") as lock_file:
+        # The lock is released when its process exits, so if a process crashes in the middle
+        # of deleting a tree, the next reaper deletes the rest
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+
+        for entry in os.scandir(trash_path):
+            if entry.name == LOCK_FILENAME:
+                continue
+
+            # A tree that can't be deleted, e.g. because of its permissions, doesn't stop the
+            # rest of the trash from being emptied. It's tried again on the next run.
+            try:
+                delete_tree(entry.path)
+            except OSError as e:
+                print(f"Failed to delete {entry.path} from the trash: {e}")
+
+    return True
+
+def delete_tree(path: str):
+    if os.path.islink(path) or not os.path.isdir(path):
+        os.unlink(path)
+        return
+
+    deleted = 0
+
+    # Bottom up so directories are empty when they're removed
+    for root, dirs, files in os.walk(path, topdown=False):
+        for name in files:
+            os.unlink(f"{root}/{name}")
+            deleted = pause_after_batch(deleted + 1)
+
+        for name in dirs:
+            dir_path = f"{root}/{name}"
+
+            # Symbolic links to directories are listed as directories but not followed
+            if os.path.islink(dir_path):
+                os.unlink(dir_path)
+            else:
+                os.rmdir(dir_path)
+
+            deleted = pause_after_batch(deleted + 1)
+
+    os.rmdir(path)
+
+def pause_after_batch(deleted: int) -> int:
+    if deleted < DELETE_BATCH_SIZE:
+        return deleted
+
+    time.sleep(DELETE_BATCH_PAUSE)
+    return 0
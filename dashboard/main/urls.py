@@ -6,6 +6,7 @@ from . import views
 
 urlpatterns = [
     path("", views.index, name="index"),
+    path("instance_list/", views.instance_list, name="instance_list"),
     path("organizations/", views.organizations, name="organizations"),
     path("locations/", views.locations, name="locations"),
     path("presets/", views.presets, name="presets"),
@@ -24,6 +25,8 @@ urlpatterns = [
     path("recreate_instance/<app_name>/", views.recreate_instance, name="recreate_instance"),
     path("restart_instance/<app_name>/", views.restart_instance, name="restart_instance"),
     path("remove_instance/<app_name>/", views.remove_instance, name="remove_instance"),
+    path("bulk_instance_action/", views.bulk_instance_action, name="bulk_instance_action"),
+    path("job_status/<job_id>/", views.job_status, name="job_status"),
     path("remove_location/<location_pk>/", views.remove_location, name="remove_location"),
     path("remove_preset/<preset_pk>/", views.remove_preset, name="remove_preset"),
     path("remove_organization/<organization_pk>/", views.remove_organization, name="remove_organization"),
@@ -31,6 +34,7 @@ urlpatterns = [
     path("view_instance/<app_name>/", views.view_instance, name="view_instance"),
     path("edit_instance/<app_name>/", views.edit_instance, name="edit_instance"),
     path("map/", views.map, name="map"),
+    path("map_data/", views.map_data, name="map_data"),
     path("proxy/", views.proxy, name="proxy"),
     path("start_proxy/", views.start_proxy, name="start_proxy"),
     path("stop_proxy/", views.stop_proxy, name="stop_proxy"),
@@ -40,5 +44,6 @@ urlpatterns = [
     path("api/instance_info/<id>/", views.instance_info, name="instance_info"),
     path("api/get_ssh_certificate/<id>/", views.get_ssh_certificate, name="get_ssh_certificate"),
     path("api/available_destinations/<id>/", views.available_destinations, name="available_destinations"),
+    path("api/topology_events/<id>/", views.topology_events, name="topology_events"),
     path("admin/", admin.site.urls)
 ]
@@ -1,170 +1,56 @@
 from typing import Dict, List, Tuple
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, reverse, get_object_or_404
-from django.http import HttpResponse, HttpResponseRedirect, HttpResponseNotAllowed, HttpResponseForbidden, HttpResponseBadRequest, JsonResponse
-from django.core.files.uploadedfile import UploadedFile
+from django.http import HttpResponse, HttpResponseRedirect, HttpResponseNotAllowed, HttpResponseForbidden, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required, permission_required
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from django.contrib import messages
-from django.forms.models import model_to_dict
+from django.core.handlers.asgi import ASGIRequest
 from django import forms as django_forms
-from .models import AppInstanceModel, AppConnectionModel, AppPresetModel, LocationModel, OrganizationEntity, AppStatusEnum, TemplateFileModel
+from django.db import transaction, IntegrityError
+from .models import AppInstanceModel, AppConnectionModel, AppPresetModel, LocationModel, OrganizationEntity, AppStatusEnum, TemplateFileModel, LifecycleJob, JobActionEnum, JobStatusEnum
 from . import forms
+from .instance_status import get_container_names
+from .instance_listing import get_instance_page, get_filter_query, page_as_dict, INSTANCE_FILTERS
+from .api_auth import instance_api_view, is_valid_api_token
+from .topology import topology_etag, topology_event_stream
+from .map_data import get_map_view_json
+from .ssh_certificates import sign_public_key, CertificateError, CertificateAuthorityError
+from .proxy_state import is_proxy_running, invalidate_proxy_state
+from .template_store import provision_template_files
+from .lifecycle import get_instance_path, ImageBasedAppAdvancedSettings, set_instance_advanced_settings, write_compose_file, \
+    pause_app, stop_app, start_app, remove_app, LifecycleError, ContainerMissingError, ContainerApiError
+from .bulk_actions import BULK_ACTIONS, select_instances, start_bulk_action
+from .jobs import enqueue_job, get_active_job, get_active_jobs, get_abandoned_cutoff, fail_abandoned_jobs, job_as_dict
 
 from subprocess import run
 from datetime import datetime
 from pathlib import Path
 import secrets
-import tempfile
 import json
-import os
-import docker
-import shutil
-
-def get_amsys_path():
-    return Path(__file__).resolve().parent.parent
-
-def get_instance_path(app_name):
-    amsys_path = get_amsys_path()
-    default_instance_base = str(amsys_path.parent)
-    instance_path = os.getenv("AMSYS_INSTANCE_BASE_PATH", default_instance_base) + f"/{app_name}"
-
-    if not os.path.exists(instance_path):
-        os.mkdir(instance_path)
-
-    return instance_path
-
-def is_proxy_running():
-    docker_client = docker.from_env()
-    proxy_containers = docker_client.containers.list(filters={
-        "name": "amsys-traefik"
-    })
-
-    return len(proxy_containers) == 1
-
-def get_instance_statuses(instances=None):
-    docker_client = docker.from_env()
-    instance_statuses = []
-
-    if instances is None:
-        instances = AppInstanceModel.objects.all()
-
-    for inst in instances:
-        containers_raw = []
-
-        if inst.using_compose:
-            containers_raw = docker_client.containers.list(all=True, filters={
-                "label": f"com.docker.compose.project={inst.app_name}"
-            })
-        else:
-            # This will match all containers where their name includes the given string.
-            # For example, if app name is "test", this will return "app_test",
-            # "test_db", and "testing_container" if they exist.
-            containers_raw = docker_client.containers.list(all=True, filters={
-                "name": inst.app_name
-            })
-
-        containers = []
-
-        for c in containers_raw:
-            # if c.name != inst.app_name:
-            if inst.app_name not in c.name:
-                # Skip containers that don't exactly match the app name
-                continue
-            containers.append(c)
-
-        if len(containers) == 0:
-            if inst.status != AppStatusEnum.STOPPED.value and inst.status != AppStatusEnum.REMOVED.value:
-                inst.status = AppStatusEnum.MISSING.value
-                instance_statuses.append({
-                    "instance": inst,
-                    "status": AppStatusEnum(inst.status).name,
-                    "target_containers": [],
-                    "status_message": "Instance corrupted! Containers are missing. Data may be recoverable.",
-                    "is_error": True
-                })
-            else:
-                message = "Containers removed."
-
-                if inst.status == AppStatusEnum.REMOVED.value:
-                    message += " Data removed!"
-
-                instance_statuses.append({
-                    "instance": inst,
-                    "status": AppStatusEnum(inst.status).name,
-                    "target_containers": [],
-                    "status_message": message,
-                    "is_error": True
-                })
-            
-            continue
-
-        stopped_containers = []
-        running_containers = []
-
-        for c in containers:
-            if c.status == "running":
-                running_containers.append(c.name)
-            else:
-                if inst.status != AppStatusEnum.REMOVED.value:
-                    inst.status = AppStatusEnum.PAUSED.value
-
-                stopped_containers.append(c.name)
-
-        if len(stopped_containers) == 0:
-            inst.status = AppStatusEnum.RUNNING.value
-
-            instance_statuses.append({
-                "instance": inst,
-                "status": AppStatusEnum(inst.status).name,
-                "target_containers": running_containers,
-                "status_message": "All containers running",
-                "is_error": False
-            })
-        elif len(running_containers) == 0:
-            instance_statuses.append({
-                "instance": inst,
-                "status": AppStatusEnum(inst.status).name,
-                "target_containers": stopped_containers,
-                "status_message": "Containers are stopped",
-                "is_error": False
-            })
-        elif len(stopped_containers) > 0 and len(running_containers) > 0:
-            # This should only happen when running with compose and not
-            # all containers are working
-            inst.status = AppStatusEnum.ERROR.value
-
-            instance_statuses.append({
-                "instance": inst,
-                "status": AppStatusEnum(inst.status).name,
-                "target_containers": stopped_containers,
-                "status_message": "Some containers are not running!",
-                "is_error": True
-            })
-        else:
-            inst.status = AppStatusEnum.ERROR.value
-
-            instance_statuses.append({
-                "instance": inst,
-                "status": AppStatusEnum(inst.status).name,
-                "target_containers": [],
-                "status_message": "AMSYS error. This should never happen.",
-                "is_error": True
-            })
-
-        inst.save()
-
-    return instance_statuses
 
 @login_required
 def index(request):
-    instance_statuses = get_instance_statuses()
+    try:
+        page, instance_statuses = get_instance_page(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(f"Invalid filter: {e}")
+
     organizations = OrganizationEntity.objects.all()
     locations = LocationModel.objects.all()
 
+    active_jobs = get_active_jobs().order_by("created_at")
+
     context = {
         "organizations": organizations,
         "locations": locations,
         "instance_statuses": instance_statuses,
+        "page": page,
+        "filters": { x: request.GET.get(x, "") for x in INSTANCE_FILTERS },
+        "filter_query": get_filter_query(request.GET),
+        "statuses": [x.name for x in AppStatusEnum],
+        "active_jobs": active_jobs,
         "is_proxy_running": is_proxy_running()
     }
 
@@ -207,7 +93,7 @@ def presets(request):
 @login_required
 def view_organization(request, org_name):
     organization = get_object_or_404(OrganizationEntity, org_name=org_name)
-    locations = LocationModel.objects.filter(owner_org=organization)
+    locations = LocationModel.objects.filter(owner_org=organization).select_related("owner_org")
 
     context = {
         "org": organization,
@@ -220,15 +106,34 @@ def view_organization(request, org_name):
 
     return render(request, "view_organization.html", context)
 
+@login_required
+def instance_list(request):
+    # JSON variant of the instance listing so cards can be loaded a page at a time
+    if (request.method != "GET"):
+        return HttpResponseNotAllowed(["GET"])
+
+    try:
+        page, instance_statuses = get_instance_page(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(f"Invalid filter: {e}")
+
+    return JsonResponse(data=page_as_dict(page, instance_statuses))
+
 @login_required
 def view_location(request, location_name):
-    location = get_object_or_404(LocationModel, location_name=location_name)
+    location = get_object_or_404(LocationModel.objects.select_related("owner_org"), location_name=location_name)
     connected_apps = AppInstanceModel.objects.filter(location=location)
-    instance_statuses = get_instance_statuses(connected_apps)
+
+    try:
+        page, instance_statuses = get_instance_page(request.GET, connected_apps)
+    except ValueError as e:
+        return HttpResponseBadRequest(f"Invalid filter: {e}")
 
     context = {
         "location": location,
         "instance_statuses": instance_statuses,
+        "page": page,
+        "filter_query": get_filter_query(request.GET),
         "is_proxy_running": is_proxy_running()
     }
 
@@ -331,227 +236,23 @@ def remove_location(request, location_pk):
 
     return HttpResponse(status=204)
 
-class ImageBasedAppAdvancedSettings:
-    def __init__(self, env_vars = [], labels = [], volumes = [],
-                 env_dict = {}, labels_dict = {}, volumes_dict = {}) -> None:
-        self.env_vars: List[Tuple[str, str]] = env_vars
-        self.labels: List[Tuple[str, str]] = labels
-        self.volumes: List[Tuple[str, str]] = volumes
-        self.env_dict: Dict = env_dict
-        self.labels_dict: Dict = labels_dict
-        self.volumes_dict: Dict = volumes_dict
-
-    @classmethod
-    def from_instance(cls, instance: AppInstanceModel) -> 'ImageBasedAppAdvancedSettings':
-        env_dict = json.loads(instance.instance_environment_variables)
-        labels_dict = json.loads(instance.instance_labels)
-        volumes_dict = json.loads(instance.instance_volumes)
-        env_vars = [(key, env_dict[key]) for key in env_dict.keys()]
-        labels = [(key, labels_dict[key]) for key in labels_dict.keys()]
-        volumes = [(key, volumes_dict[key]) for key in volumes_dict.keys()]
-
-        return cls(env_vars=env_vars, labels=labels, volumes=volumes, env_dict=env_dict,
-                   labels_dict=labels_dict, volumes_dict=volumes_dict)
-
-    @classmethod
-    def get_base_env(cls, url_path: str, api_token: str, instance_pk: str) -> Dict:
-        return {
-            # TODO: Rename this env var to AMSYS_URL_PATH.
-            # This is what apps use to determine the path where they are hosted.
-            "AMSYS_APP_NAME": url_path,
-            "AMSYS_API_TOKEN": api_token,
-            "AMSYS_APP_ID": instance_pk,
-            # TODO: It would probably make sense to make the port an env var
-            "AMSYS_API_BASE_URL": "http://host.docker.internal:8000/api",
-            "AMSYS_SSH_INSTANCE_KEY": "~/.ssh/instance_key.pub"
-        }
-
-    @classmethod
-    def get_base_labels(cls, app_name: str, url_path: str) -> Dict:
-        return {
-            "traefik.enable": "true",
-            f"traefik.http.routers.{app_name}-router.rule": f"PathPrefix(\"/{url_path}\")",
-            f"traefik.http.services.{app_name}-service.loadbalancer.server.port": "8000",
-            f"traefik.http.middlewares.{app_name}-strip.stripprefix.prefixes": f"/{url_path}",
-            f"traefik.http.routers.{app_name}-router.middlewares": f"{app_name}-strip@docker"
-        }
-
-    @classmethod
-    def get_base_volumes(cls) -> Dict:
-        amsys_path = get_amsys_path()
-
-        return {
-            f"{amsys_path}/ssh/instance_ca.pub": { "bind": "/etc/ssh/instance_ca.pub", "mode": "ro" }
-        }
-
-    def set_env_vars(self, env_keys: List[str], env_vals: List[str]) -> None:
-        self.env_vars = list(zip(env_keys, env_vals))
-        env_dict = {}
-
-        for key, value in self.env_vars:
-            env_dict[key] = value
-
-        self.env_dict = env_dict
-
-    def set_labels(self, label_keys: List[str], label_vals: List[str]) -> None:
-        self.labels = list(zip(label_keys, label_vals))
-        labels_dict = {}
-
-        for key, value in self.labels:
-            labels_dict[key] = value
-
-        self.labels_dict = labels_dict
-
-    def set_volumes(self, volume_keys: List[str], volume_vals: List[str]) -> None:
-        self.volumes = list(zip(volume_keys, volume_vals))
-        volumes_dict = {}
-
-        # for entry in self.volumes:
-        #     volumes_dict[f"{instance_path}/{entry[0]}"] = {
-        #         "bind": entry[1],
-        #         "mode": "rw"
-        #     }
-
-        for key, value in self.volumes:
-            volumes_dict[key] = value
-
-        self.volumes_dict = volumes_dict
-
-    def get_full_env_as_dict(self, url_path: str, api_token: str, instance_pk: str) -> Dict:
-        env = ImageBasedAppAdvancedSettings.get_base_env(url_path, api_token, instance_pk)
-        env.update(self.env_dict)
-        return env
-
-    def get_env_as_json_string(self) -> str:
-        return json.dumps(self.env_dict)
-
-    def get_full_env_as_json_string(self, url_path: str, api_token: str, instance_pk: str) -> str:
-        env = self.get_full_env_as_dict(url_path, api_token, instance_pk)
-        return json.dumps(env)
-
-    def get_full_labels_as_dict(self, app_name: str, url_path: str) -> Dict:
-        labels = ImageBasedAppAdvancedSettings.get_base_labels(app_name, url_path)
-        labels.update(self.labels_dict)
-        return labels
-
-    def get_labels_as_json_string(self):
-        return json.dumps(self.labels_dict)
-
-    def get_full_labels_as_json_string(self, app_name: str, url_path: str) -> str:
-        labels = self.get_full_labels_as_dict(app_name, url_path)
-        return json.dumps(labels)
-
-    def get_full_volumes_as_dict(self, instance_path: str) -> Dict:
-        volumes = ImageBasedAppAdvancedSettings.get_base_volumes()
-        full_volumes_dict = {}
-
-        for key in self.volumes_dict.keys():
-            full_volumes_dict[f"{instance_path}/{key}"] = {
-                "bind": self.volumes_dict[key],
-                "more": "rw"
-            }
-
-        volumes.update(full_volumes_dict)
-
-        return volumes
-
-    def get_volumes_as_json_string(self):
-        return json.dumps(self.volumes_dict)
-
-    def get_full_volumes_as_json_string(self, instance_path: str) -> str:
-        volumes = self.get_full_volumes_as_dict(instance_path)
-        return json.dumps(volumes)
+def add_owner_orgs_to_location_choices(form):
+    # Add owner organization name to the end of location choices. The organizations are
+    # fetched with the locations instead of once per choice.
+    location_field = form.fields["location"]
+    location_field.queryset = location_field.queryset.select_related("owner_org")
+    new_choices = []
 
-# TODO: Rename or actually set all the advanced settings
-def set_instance_advanced_settings(instance: AppInstanceModel, settings: ImageBasedAppAdvancedSettings) -> None:
-    env_json_string = settings.get_env_as_json_string()
-    labels_json_string = settings.get_labels_as_json_string()
-    volumes_json_string = settings.get_volumes_as_json_string()
-
-    instance.instance_environment_variables = env_json_string
-    instance.instance_labels = labels_json_string
-    instance.instance_volumes = volumes_json_string
-    instance.save()
-
-def create_app_from_image(advanced_settings: ImageBasedAppAdvancedSettings, container_image: str,
-                          container_user: str, app_instance: AppInstanceModel, instance_path: str,
-                          template_files: List[TemplateFileModel], preset_name: str | None = None):
-    if container_user == "root" or container_user == "root:root":
-        container_user = ""
-
-    # preset_name = request.POST.get("preset_name", None)
-    set_instance_advanced_settings(app_instance, advanced_settings)
-    docker_client = docker.from_env()
+    for val, name in location_field.choices:
+        if not hasattr(val, "instance") or not isinstance(val.instance, LocationModel):
+            new_choices.append((val, name))
+            continue
 
-    app_name = str(app_instance.app_name)
-    url_path = str(app_instance.url_path)
-    api_token = str(app_instance.api_token)
-    full_env = advanced_settings.get_full_env_as_dict(url_path, api_token, str(app_instance.pk))
-    full_labels = advanced_settings.get_full_labels_as_dict(app_name, url_path)
-    full_volumes = advanced_settings.get_full_volumes_as_dict(instance_path)
+        owner_org = str(val.instance.owner_org)
+        new_name = f"{name} ({owner_org})"
+        new_choices.append((val, new_name))
 
-    try:
-        docker_client.containers.run(
-            image=container_image,
-            environment=full_env,
-            labels=full_labels,
-            volumes=full_volumes,
-            detach=True,
-            network="amsys-net",
-            user=container_user,
-            name=app_name)
-    except docker.errors.ImageNotFound:
-        print(f"Container image '{container_image}' not found.")
-        return False
-    except docker.errors.APIError as e:
-        print("Docker API error:")
-        print(e)
-
-        try:
-            app_container = docker_client.containers.get(app_name)
-            app_container.remove(force=True)
-        except:
-            pass
-
-        return False
-
-    dirs = app_instance.instance_directories
-    labels = advanced_settings.get_labels_as_json_string()
-    volumes = advanced_settings.get_volumes_as_json_string()
-    env = advanced_settings.get_env_as_json_string()
-
-    if preset_name is not None:
-        preset = AppPresetModel(
-            preset_name=preset_name,
-            container_image=container_image,
-            container_user=container_user,
-            instance_directories=dirs,
-            instance_labels=labels,
-            instance_volumes=volumes,
-            instance_environment_variables=env)
-
-        preset.save()
-        preset.template_files.set(template_files)
-        preset.save()
-
-    return True
-
-def create_app_from_compose(compose_file: UploadedFile, instance_path: str, app_name: str):
-    with open(f"{instance_path}/docker-compose.yaml", "wb+") as destination:
-        for chunk in compose_file.chunks():
-            destination.write(chunk)
-
-    # Set the compose project name with -p so it can be used to filter container lists.
-    # This way the compose file can create containers with any name and still the amsys
-    # app can find them.
-    start_compose_result = run(["docker", "compose", "-p", app_name, "up", "-d"], cwd=instance_path, capture_output=True, text=True)
-
-    if start_compose_result.returncode != 0:
-        print(start_compose_result.stdout)
-        print(start_compose_result.stderr)
-        return False
-
-    return True
+    location_field.choices = new_choices
 
 @login_required
 @permission_required("main.add_appinstancemodel")
@@ -587,20 +288,7 @@ def create_app_instance(request, using_compose=False):
         if form is None:
             form = forms.AppInstanceForm(using_compose=using_compose)
 
-        # Add owner organization name to the end of location choices
-        location_choices = list(form.fields["location"].choices)
-        new_choices = []
-
-        for val, name in location_choices:
-            if not hasattr(val, "instance") or not isinstance(val.instance, LocationModel):
-                new_choices.append((val, name))
-                continue
-
-            owner_org = str(val.instance.owner_org)
-            new_name = f"{name} ({owner_org})"
-            new_choices.append((val, new_name))
-
-        form.fields["location"].choices = new_choices
+        add_owner_orgs_to_location_choices(form)
 
         context = {
             "form": form,
@@ -625,26 +313,9 @@ def create_app_instance(request, using_compose=False):
         else:
             return render(request, "create_compose_instance.html", { "form": form })
 
+    # Duplicate app names and URL paths are rejected by the form's unique validation
     app_name = form.cleaned_data["app_name"]
-
-    if len(AppInstanceModel.objects.filter(app_name=app_name)) > 0:
-        messages.error(request, f"App with name '{app_name}' already exists.")
-
-        if not using_compose:
-            return render(request, "create_instance.html", { "form": form })
-        else:
-            return render(request, "create_compose_instance.html", { "form": form })
-
     url_path = form.cleaned_data["url_path"]
-
-    if len(AppInstanceModel.objects.filter(url_path=url_path)) > 0:
-        messages.error(request, f"App with URL path '{url_path}' already exists.")
-
-        if not using_compose:
-            return render(request, "create_instance.html", { "form": form })
-        else:
-            return render(request, "create_compose_instance.html", { "form": form })
-
     location = form.cleaned_data["location"]
     transmit_destinations = form.cleaned_data["transmit_destinations"]
     template_files = form.cleaned_data["template_files"]
@@ -664,39 +335,53 @@ def create_app_instance(request, using_compose=False):
     if (url_path[-1] == "/"):
         url_path = url_path[:-1]
 
+    # The form only checked the URL path as it was entered
+    if AppInstanceModel.objects.filter(url_path=url_path).exists():
+        messages.error(request, f"App with URL path '{url_path}' already exists.")
+
+        if not using_compose:
+            return render(request, "create_instance.html", { "form": form })
+        else:
+            return render(request, "create_compose_instance.html", { "form": form })
+
     datetime_now = datetime.now()
     api_token = secrets.token_urlsafe(16)
 
+    # The creation job marks the instance as running once its containers have started
     app_instance = AppInstanceModel(app_name=app_name, url_path=url_path,
-                                    location=location, status=AppStatusEnum.RUNNING.value,
+                                    location=location, status=AppStatusEnum.STOPPED.value,
                                     created_at=datetime_now, api_token=api_token,
                                     using_compose=using_compose, container_image=container_image,
                                     container_user=container_user)
-    app_instance.save()
+
+    try:
+        # The unique constraints catch instances created at the same time by another request
+        with transaction.atomic():
+            app_instance.save()
+    except IntegrityError:
+        messages.error(request, f"App with name '{app_name}' or URL path '{url_path}' already exists.")
+
+        if not using_compose:
+            return render(request, "create_instance.html", { "form": form })
+        else:
+            return render(request, "create_compose_instance.html", { "form": form })
+
     app_instance.template_files.set(template_files)
 
     instance_path = get_instance_path(app_name)
 
-    for template_file in template_files:
-        shutil.copy(template_file.filepath, f"{instance_path}/{template_file.filename}")
-
     dir_vals = request.POST.getlist("dir_entry[]")
     dir_entries = list(dir_vals)
 
-    app_instance.instance_directories = str(dir_entries).replace("'", "\"")
+    app_instance.instance_directories = dir_entries
     app_instance.save()
 
-    # TODO: make sure the user doesn't create any weird directories outside the instance dir
-    for dir_path in dir_entries:
-        path_in_instance = f"{instance_path}/{dir_path}"
-        if not os.path.exists(path_in_instance):
-            os.makedirs(path_in_instance)
-
-    started_successfully = False
+    payload = {
+        "transmit_destinations": [dest.pk for dest in transmit_destinations]
+    }
 
     if using_compose:
-        compose_file = request.FILES["compose_file"]
-        started_successfully = create_app_from_compose(compose_file, instance_path, app_name)
+        write_compose_file(request.FILES["compose_file"], instance_path)
     else:
         advanced_settings = ImageBasedAppAdvancedSettings()
 
@@ -710,31 +395,17 @@ def create_app_instance(request, using_compose=False):
         advanced_settings.set_env_vars(env_keys, env_vals)
         advanced_settings.set_labels(label_keys, label_vals)
         advanced_settings.set_volumes(volume_keys, volume_vals)
+        set_instance_advanced_settings(app_instance, advanced_settings)
 
-        preset_name = request.POST.get("preset_name", None)
+        payload["preset_name"] = request.POST.get("preset_name", None)
 
-        started_successfully = create_app_from_image(advanced_settings, container_image, container_user, app_instance, instance_path, template_files, preset_name)
-
-    if not started_successfully:
-        messages.error(request, "App didn't start succesfully")
-        print("app startup failed")
-        app_instance.delete()
-
-        if not using_compose:
-            return render(request, "create_instance.html", { "form": form })
-        else:
-            return render(request, "create_compose_instance.html", { "form": form })
+    # Pulling images and starting containers can take minutes, so it's done by a job worker
+    enqueue_job(JobActionEnum.CREATE, app_instance, payload)
 
     if ("preset" in request.session):
         del request.session["preset"]
 
-    # Dashboard will always know which instances can transmit to which.
-    # Instances should always ask what they can do before trying to do things.
-    for dest in transmit_destinations:
-        connection = AppConnectionModel(instance_from=app_instance, instance_to=dest)
-        connection.save()
-
-    messages.success(request, "App started successfully")
+    messages.info(request, f"Creating app '{app_name}'. This page updates when it's ready.")
     return HttpResponseRedirect(reverse("index"))
 
 @login_required
@@ -768,266 +439,155 @@ def remove_preset(request, preset_pk):
 @permission_required("main.change_appinstancemodel")
 def pause_instance(request, app_name, should_kill=False):
     instance = get_object_or_404(AppInstanceModel, app_name=app_name)
-    docker_client = docker.from_env()
 
-    instance_path = get_instance_path(app_name)
+    return run_instance_operation(request, instance, lambda: pause_app(instance, should_kill))
 
-    if (instance.using_compose):
-        command = None
+@login_required
+@permission_required("main.change_appinstancemodel")
+def stop_instance(request, app_name):
+    instance = get_object_or_404(AppInstanceModel, app_name=app_name)
 
-        if should_kill:
-            command = ["docker", "compose", "-p", app_name, "kill"]
-        else:
-            command = ["docker", "compose", "-p", app_name, "stop"]
+    return run_instance_operation(request, instance, lambda: stop_app(instance))
 
-        stop_compose_result = run(command, cwd=instance_path, capture_output=True, text=True)
+@login_required
+@permission_required("main.change_appinstancemodel")
+def start_instance(request, app_name):
+    instance = get_object_or_404(AppInstanceModel, app_name=app_name)
 
-        if stop_compose_result.returncode != 0:
-            messages.error(request, f"App failed to pause. Error code {stop_compose_result.returncode}")
-            print(stop_compose_result.stdout)
-            print(stop_compose_result.stderr)
-            return HttpResponseRedirect(reverse("index"))
-    else:
-        try:
-            app_container = docker_client.containers.get(app_name)
+    return run_instance_operation(request, instance, lambda: start_app(instance))
 
-            if should_kill:
-                app_container.kill()
-            else:
-                app_container.stop()
-        except docker.errors.NotFound:
-            messages.error(request, "App container not found! Some data may be lost.")
-            instance.status = AppStatusEnum.MISSING.value
-            instance.save()
+def run_instance_operation(request, instance, operation):
+    # Operations run right away, so they must not overlap a queued or running job such as
+    # a restart of the same instance
+    active_job = get_active_job(instance)
+
+    if active_job is not None:
+        messages.error(request, f"App '{instance.app_name}' already has an unfinished {active_job.action} job.")
+        return HttpResponse(status=409)
 
-            return HttpResponse(status=204)
-        except docker.errors.APIError:
-            messages.error(request, "Container API error. Try again later.")
-            return HttpResponse(status=500)
+    try:
+        warning = operation()
+    except ContainerMissingError as e:
+        messages.error(request, str(e))
+        return HttpResponse(status=204)
+    except ContainerApiError as e:
+        messages.error(request, str(e))
+        return HttpResponse(status=500)
+    except LifecycleError as e:
+        messages.error(request, str(e))
+        return HttpResponseRedirect(reverse("index"))
 
-    instance.status = AppStatusEnum.PAUSED.value
-    instance.save()
+    if warning:
+        messages.error(request, warning)
 
     return HttpResponse(status=204)
 
 @login_required
 @permission_required("main.change_appinstancemodel")
-def stop_instance(request, app_name):
+def restart_instance(request, app_name):
     instance = get_object_or_404(AppInstanceModel, app_name=app_name)
-    docker_client = docker.from_env()
 
-    instance_path = get_instance_path(app_name)
-
-    if (instance.using_compose):
-        command = None
-
-        command = ["docker", "compose", "-p", app_name, "stop"]
-        stop_compose_result = run(command, cwd=instance_path, capture_output=True, text=True)
-
-        if stop_compose_result.returncode != 0:
-            messages.error(request, f"App failed to stop. Error code {stop_compose_result.returncode}")
-            print(stop_compose_result.stdout)
-            print(stop_compose_result.stderr)
-            return HttpResponseRedirect(reverse("index"))
-    else:
-        try:
-            app_container = docker_client.containers.get(app_name)
-            app_container.stop()
-            app_container.remove(v=True, force=True)
-        except docker.errors.NotFound:
-            messages.error(request, "App container not found! Some data may be lost.")
-            instance.status = AppStatusEnum.MISSING.value
-            instance.save()
-
-            return HttpResponse(status=204)
-        except docker.errors.APIError:
-            messages.error(request, "Container API error. Try again later.")
-            return HttpResponse(status=500)
-
-    instance.status = AppStatusEnum.STOPPED.value
-    instance.save()
-
-    return HttpResponse(status=204)
+    return start_lifecycle_job(JobActionEnum.RESTART, instance)
 
 @login_required
 @permission_required("main.change_appinstancemodel")
-def start_instance(request, app_name):
+def recreate_instance(request, app_name):
     instance = get_object_or_404(AppInstanceModel, app_name=app_name)
-    docker_client = docker.from_env()
 
-    instance_path = get_instance_path(app_name)
+    return start_lifecycle_job(JobActionEnum.RECREATE, instance)
 
-    if (instance.using_compose):
-        start_compose_result = run(["docker", "compose", "-p", app_name, "start"], cwd=instance_path, capture_output=True, text=True)
+def start_lifecycle_job(action, instance):
+    active_job = get_active_job(instance)
 
-        if start_compose_result.returncode != 0:
-            messages.error(request, f"Failed to start instance. Error code {start_compose_result.returncode}")
-            print(start_compose_result.stdout)
-            print(start_compose_result.stderr)
-            return HttpResponseRedirect(reverse("index"))
-    else:
-        try:
-            app_container = docker_client.containers.get(app_name)
-            app_container.start()
-        except docker.errors.NotFound:
-            messages.error(request, "App container not found! Some data may be lost.")
-            instance.status = AppStatusEnum.MISSING.value
-            instance.save()
+    if active_job is not None:
+        data = job_as_dict(active_job)
+        data["error"] = f"App '{instance.app_name}' already has an unfinished {active_job.action} job."
 
-            return HttpResponse(status=204)
-        except docker.errors.APIError:
-            messages.error(request, "Container API error. Try again later.")
-            return HttpResponse(status=500)
+        return JsonResponse(data=data, status=409)
 
-    instance.status = AppStatusEnum.RUNNING.value
-    instance.save()
+    job = enqueue_job(action, instance)
 
-    return HttpResponse(status=204)
+    return JsonResponse(data=job_as_dict(job), status=202)
 
 @login_required
 @permission_required("main.change_appinstancemodel")
-def restart_instance(request, app_name):
-    instance = get_object_or_404(AppInstanceModel, app_name=app_name)
-    docker_client = docker.from_env()
-    instance_path = get_instance_path(app_name)
+def bulk_instance_action(request):
+    if (request.method != "POST"):
+        return HttpResponseNotAllowed(["POST"])
 
-    if (instance.using_compose):
-        run(["docker", "compose", "-p", app_name, "kill"], cwd=instance_path)
-        # We don't care about the result. If removal was successful, good. If there was
-        # nothing to remove, also good. In the case this throws some other error, the handling
-        # can be added then.
-    else:
-        try:
-            app_container = docker_client.containers.get(app_name)
-            app_container.remove(v=True, force=True)
-        except docker.errors.NotFound:
-            pass
-        except docker.errors.APIError:
-            messages.error(request, "Container API error. Try again later or contact an administrator.")
-            return HttpResponse(status=500)
-
-    if (instance.using_compose):
-        # TODO: implement
-        messages.error(request, "Restarting compose files is not implemented")
-        return HttpResponseRedirect(reverse("index"))
-    else:
-        advanced_settings = ImageBasedAppAdvancedSettings.from_instance(instance=instance)
-        started_successfully = create_app_from_image(advanced_settings, instance.container_image,
-                              instance.container_user, instance, instance_path, instance.template_files.all())
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return HttpResponseBadRequest("Malformatted JSON data.")
 
-    if not started_successfully:
-        messages.error(request, "App failed to restart!")
-        print("app restart failed")
-        instance.status = AppStatusEnum.ERROR.value
-        instance.save()
+    action = data.get("action")
 
-        return HttpResponseRedirect(reverse("index"))
+    if action not in BULK_ACTIONS:
+        return HttpResponseBadRequest(f"Unknown action. Use one of: {', '.join(BULK_ACTIONS.keys())}")
 
-    messages.success(request, "App restarted successfully")
-    return HttpResponseRedirect(reverse("index"))
+    for key in ["location", "organization"]:
+        value = data.get(key)
 
-@login_required
-@permission_required("main.change_appinstancemodel")
-def recreate_instance(request, app_name):
-    instance = get_object_or_404(AppInstanceModel, app_name=app_name)
-    docker_client = docker.from_env()
-    instance_path = get_instance_path(app_name)
+        # bool is a subclass of int
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+            return HttpResponseBadRequest(f"The {key} must be given as an ID.")
 
-    if (instance.using_compose):
-        remove_compose_result = run(["docker", "compose", "-p", app_name, "kill"], cwd=instance_path, capture_output=True, text=True)
+    status = data.get("status")
 
-        if remove_compose_result.returncode != 0:
-            messages.error(request, f"Failed to recreate instance. Error code {remove_compose_result.returncode}")
-            print(remove_compose_result.stdout)
-            print(remove_compose_result.stderr)
-            return HttpResponseRedirect(reverse("index"))
-    else:
-        try:
-            app_container = docker_client.containers.get(app_name)
-            app_container.remove(v=True, force=True)
-        except docker.errors.NotFound:
-            messages.error(request, "App container not found! Some data may be lost.")
-        except docker.errors.APIError:
-            messages.error(request, "Container API error. Try again later or contact an administrator.")
-            return HttpResponse(status=500)
+    if status is not None and status not in AppStatusEnum.__members__:
+        return HttpResponseBadRequest("Unknown status.")
 
-    # TODO: Ensure the app name can't change the instance path to something weird
-    shutil.rmtree(instance_path)
+    app_names = data.get("app_names")
 
-    instance.status = AppStatusEnum.REMOVED.value
-    instance.save()
+    if app_names is not None and (not isinstance(app_names, list) or not all(isinstance(x, str) for x in app_names)):
+        return HttpResponseBadRequest("App names must be given as a list.")
 
-    os.makedirs(instance_path)
+    instances = select_instances(location=data.get("location"), organization=data.get("organization"),
+                                 status=status, app_names=app_names)
 
-    for template_file in instance.template_files.all():
-        shutil.copy(template_file.filepath, f"{instance_path}/{template_file.filename}")
+    if instances is None:
+        return HttpResponseBadRequest("Select instances by location, organization, status or app names.")
 
-    dir_entries = json.loads(instance.instance_directories)
+    # Operating on many instances can take longer than a request may, so the client
+    # follows the jobs instead
+    jobs, skipped = start_bulk_action(action, instances)
 
-    for dir_path in dir_entries:
-        path_in_instance = f"{instance_path}/{dir_path}"
-        if not os.path.exists(path_in_instance):
-            os.makedirs(path_in_instance)
+    data = {
+        "action": action,
+        "jobs": [job_as_dict(job) for job in jobs],
+        "skipped": [
+            { "app_name": instance.app_name, "message": "The app already has an unfinished job." }
+            for instance in skipped
+        ]
+    }
 
-    started_successfully = False
-    
-    if (instance.using_compose):
-        compose_file = request.FILES["compose_file"]
-        started_successfully = create_app_from_compose(compose_file, instance_path, instance.app_name)
-    else:
-        advanced_settings = ImageBasedAppAdvancedSettings.from_instance(instance=instance)
-        started_successfully = create_app_from_image(advanced_settings, instance.container_image,
-                              instance.container_user, instance, instance_path, instance.template_files.all())
+    return JsonResponse(data=data, status=202)
 
-    if not started_successfully:
-        messages.error(request, "App recreation unsuccessful!")
-        print("app recreation failed")
-        instance.status = AppStatusEnum.ERROR.value
-        instance.save()
+@login_required
+def job_status(request, job_id):
+    if (request.method != "GET"):
+        return HttpResponseNotAllowed(["GET"])
 
-        return HttpResponseRedirect(reverse("index"))
+    job = get_object_or_404(LifecycleJob, pk=job_id)
 
-    messages.success(request, "App recreated successfully")
-    return HttpResponseRedirect(reverse("index"))
+    # Pollers of an abandoned job see it fail instead of waiting forever
+    if job.status == JobStatusEnum.RUNNING.value and job.started_at < get_abandoned_cutoff():
+        fail_abandoned_jobs(LifecycleJob.objects.filter(pk=job.pk))
+        job.refresh_from_db()
+
+    return JsonResponse(data=job_as_dict(job))
 
 @login_required
 @permission_required("main.delete_appinstancemodel")
 def remove_instance(request, app_name):
     instance = get_object_or_404(AppInstanceModel, app_name=app_name)
-    docker_client = docker.from_env()
-
-    instance_path = get_instance_path(app_name)
 
-    if (instance.using_compose):
-        remove_compose_result = run(["docker", "compose", "-p", app_name, "down"], cwd=instance_path, capture_output=True, text=True)
-
-        if remove_compose_result.returncode != 0:
-            messages.error(request, f"Failed to remove instance. Error code {remove_compose_result.returncode}")
-            print(remove_compose_result.stdout)
-            print(remove_compose_result.stderr)
-            return HttpResponseRedirect(reverse("index"))
-    else:
-        try:
-            app_container = docker_client.containers.get(app_name)
-            app_container.remove(v=True, force=True)
-        except docker.errors.NotFound:
-            messages.error(request, "App container not found! Removing data.")
-        except docker.errors.APIError:
-            messages.error(request, "Container API error. Try again later.")
-            return HttpResponse(status=500)
-
-    # TODO: Ensure the app name can't change the instance path to something weird
-    shutil.rmtree(instance_path)
-
-    instance.status = AppStatusEnum.REMOVED.value
-    instance.save()
-
-    return HttpResponse(status=204)
+    return run_instance_operation(request, instance, lambda: remove_app(instance))
 
 @login_required
 def view_instance(request, app_name):
-    instance = get_object_or_404(AppInstanceModel, app_name=app_name)
-    available_transmit_destinations = AppConnectionModel.objects.filter(instance_from=instance)
+    instance = get_object_or_404(AppInstanceModel.objects.select_related("location__owner_org"), app_name=app_name)
+    available_transmit_destinations = AppConnectionModel.objects.filter(instance_from=instance).select_related("instance_to")
 
     context = {
         "instance": instance,
@@ -1046,7 +606,7 @@ def normalize_empty_field_value(value):
 @permission_required("main.change_appinstancemodel")
 def edit_instance(request, app_name):
     instance = get_object_or_404(AppInstanceModel, app_name=app_name)
-    defined_connections = AppConnectionModel.objects.filter(instance_from=instance)
+    defined_connections = AppConnectionModel.objects.filter(instance_from=instance).select_related("instance_to")
     defined_destinations = [conn.instance_to for conn in defined_connections]
     form = None
 
@@ -1059,20 +619,7 @@ def edit_instance(request, app_name):
             # "compose_file": instance.compose_file
         })
 
-        # Add owner organization name to the end of location choices
-        location_choices = list(form.fields["location"].choices)
-        new_choices = []
-
-        for val, name in location_choices:
-            if not hasattr(val, "instance") or not isinstance(val.instance, LocationModel):
-                new_choices.append((val, name))
-                continue
-
-            owner_org = str(val.instance.owner_org)
-            new_name = f"{name} ({owner_org})"
-            new_choices.append((val, new_name))
-
-        form.fields["location"].choices = new_choices
+        add_owner_orgs_to_location_choices(form)
 
         context = {
             "instance": instance,
@@ -1095,8 +642,7 @@ def edit_instance(request, app_name):
             volume_keys = request.POST.getlist("volume_entry_key[]")
             volume_vals = request.POST.getlist("volume_entry_val[]")
 
-            dir_entries = list(dir_vals)
-            new_dirs = str(dir_entries).replace("'", "\"")
+            new_dirs = list(dir_vals)
 
             advanced_settings.set_env_vars(env_keys, env_vals)
             advanced_settings.set_labels(label_keys, label_vals)
@@ -1130,8 +676,8 @@ def edit_instance(request, app_name):
             instance.template_files.set(template_files)
             instance.save()
 
-            for template_file in template_files:
-                shutil.copy(template_file.filepath, f"{instance_path}/{template_file.filename}")
+            # Only new and changed template files are written
+            provision_template_files(template_files, instance_path)
 
             transmit_destinations = form.cleaned_data["transmit_destinations"]
 
@@ -1185,77 +731,38 @@ def forget_instance(request, app_name):
 
 @login_required
 def map(request):
-    instances = AppInstanceModel.objects.all()
-    location_entries = list(LocationModel.objects.values())
-
-    for index in range(len(location_entries)):
-        location_entries[index].update({ "apps": [] })
-
-    for inst in instances:
-        location_dict = model_to_dict(inst.location)
-        inst_dict = model_to_dict(inst, fields=["app_name", "url_path", "status"])
-        inst_dict["status"] = str(AppStatusEnum(inst_dict["status"]).name)
-
-        for entry in location_entries:
-            if location_dict["id"] == entry["id"]:
-                apps = entry["apps"]
-                apps.append(inst_dict)
-                entry["apps"] = apps
-                break
-
-    locations_data = json.dumps(location_entries, default=str)
-
-    connections = AppConnectionModel.objects.all()
-    connection_pair_coordinates = []
-
-    for connection in connections:
-        instance_from = connection.instance_from
-        instance_to = connection.instance_to
-        location_from = instance_from.location
-        location_to = instance_to.location
-
-        if location_from is location_to:
-            continue
-
-        from_coordinates = [location_from.latitude, location_from.longitude]
-        to_coordinates = [location_to.latitude, location_to.longitude]
-        pair = [from_coordinates, to_coordinates]
-        connection_pair_coordinates.append(pair)
-
-    connections_data = json.dumps(connection_pair_coordinates, default=str)
-
-    context = {
-        "locations": locations_data,
-        "connections": connections_data
-    }
-
     if "preset" in request.session:
         del request.session["preset"]
 
-    return render(request, "map.html", context)
+    return render(request, "map.html")
 
 @login_required
-def proxy(request):
-    proxy_fetch_result = run(["docker", "container", "ls", "--format='{{json .Names}}'"], capture_output=True, text=True)
+def map_data(request):
+    if (request.method != "GET"):
+        return HttpResponseNotAllowed(["GET"])
 
-    if (proxy_fetch_result.returncode != 0):
-        messages.error(request, "Failed to fetch proxy status.")
+    try:
+        zoom = int(request.GET.get("zoom", "4"))
+        bbox = request.GET.get("bbox")
 
-        context = {
-            "is_proxy_running": False
-        }
+        # west,south,east,north like Leaflet's LatLngBounds.toBBoxString()
+        if bbox:
+            bbox = [float(x) for x in bbox.split(",")]
 
-        return render(request, "proxy.html", context)
+            if len(bbox) != 4:
+                raise ValueError("bbox must have four values")
+    except ValueError as e:
+        return HttpResponseBadRequest(f"Invalid map parameters: {e}")
 
-    proxy_fetch_string = proxy_fetch_result.stdout
-    proxy_fetch_string = proxy_fetch_string.replace("\"", "")
-    proxy_fetch_string = proxy_fetch_string.replace("\'", "")
-    running_containers = proxy_fetch_string.split("\n")
+    zoom = max(0, min(zoom, 19))
+    color_by_status = request.GET.get("color_by_status") in ["1", "true"]
 
-    is_proxy_running = "amsys-traefik" in running_containers
+    return HttpResponse(get_map_view_json(zoom, bbox or None, color_by_status), content_type="application/json")
 
+@login_required
+def proxy(request):
     context = {
-        "is_proxy_running": is_proxy_running
+        "is_proxy_running": is_proxy_running()
     }
 
     if "preset" in request.session:
@@ -1267,6 +774,7 @@ def proxy(request):
 @permission_required("main.change_appinstancemodel")
 def start_proxy(request):
     start_result = run(["./scripts/start-proxy.sh"], capture_output=True, text=True)
+    invalidate_proxy_state()
 
     print(start_result.stdout)
     if (start_result.returncode != 0):
@@ -1279,6 +787,7 @@ def start_proxy(request):
 @permission_required("main.change_appinstancemodel")
 def stop_proxy(request):
     stop_result = run(["./scripts/stop-proxy.sh"], capture_output=True, text=True)
+    invalidate_proxy_state()
 
     if (stop_result.returncode != 0):
         messages.error(request, f"Proxy failed to stop. Error code {stop_result.returncode}")
@@ -1288,46 +797,25 @@ def stop_proxy(request):
     return HttpResponse(status=204)
 
 # Web API for instances to use
+@instance_api_view("GET")
 def existing_instances(request, id):
-    if (request.method != "GET"):
-        return HttpResponseNotAllowed(["GET"])
-
-    request_api_token = request.headers.get("X-API-Token")
-
-    if not request_api_token:
-        return HttpResponseForbidden()
-
-    request_instance_queryset = AppInstanceModel.objects.filter(pk=id)
-
-    if len(request_instance_queryset) != 1:
-        return HttpResponseForbidden()
-
-    request_instance = request_instance_queryset[0]
-
-    if not request_instance:
-        return HttpResponseForbidden()
-
-    if request_instance.api_token != request_api_token:
-        return HttpResponseForbidden()
+    all_instances = AppInstanceModel.objects.values_list("pk", "app_name", "status")
+    running_instances = []
+    stopped_but_existing = []
+    existing_containers = None
 
-    running_instances = AppInstanceModel.objects.filter(is_running=True)
-    stopped_instances = AppInstanceModel.objects.filter(is_running=False)
+    for pk, app_name, status in all_instances:
+        if status == AppStatusEnum.RUNNING.value:
+            running_instances.append({ "id": pk, "name": app_name })
+            continue
 
-    name_fetch_result = run(["docker", "container", "ls", "-a", "--format='{{json .Names}}'"], capture_output=True, text=True)
-    existing_containers_string = name_fetch_result.stdout
-    existing_containers_string = existing_containers_string.replace("\"", "")
-    existing_containers_string = existing_containers_string.replace("\'", "")
-    existing_containers = existing_containers_string.split("\n")
+        if existing_containers is None:
+            existing_containers = get_container_names()
 
-    stopped_but_existing = []
+        if app_name in existing_containers:
+            stopped_but_existing.append({ "id": pk, "name": app_name })
 
-    for instance in stopped_instances:
-        if instance.app_name in existing_containers:
-            stopped_but_existing.append({ "id": instance.pk, "name": instance.app_name })
-        else:
-            pass
-
-    instances = [{ "id": x.pk, "name": x.app_name } for x in running_instances]
+    instances = running_instances
     instances.extend(stopped_but_existing)
 
     data = {
@@ -1336,29 +824,10 @@ def existing_instances(request, id):
 
     return JsonResponse(data=data)
 
+@instance_api_view("GET")
+@condition(etag_func=topology_etag)
 def available_destinations(request, id):
-    if (request.method != "GET"):
-        return HttpResponseNotAllowed(["GET"])
-
-    request_api_token = request.headers.get("X-API-Token")
-
-    if not request_api_token:
-        return HttpResponseForbidden()
-
-    request_instance_queryset = AppInstanceModel.objects.filter(pk=id)
-
-    if len(request_instance_queryset) != 1:
-        return HttpResponseForbidden()
-
-    request_instance = request_instance_queryset[0]
-
-    if not request_instance:
-        return HttpResponseForbidden()
-
-    if request_instance.api_token != request_api_token:
-        return HttpResponseForbidden()
-
-    destinations_raw = AppConnectionModel.objects.filter(instance_from=request_instance)
+    destinations_raw = AppConnectionModel.objects.filter(instance_from__pk=id).select_related("instance_to")
     destinations_available = destinations_raw.filter(instance_to__status=AppStatusEnum.RUNNING.value)
     destinations = [{ "id": x.instance_to.pk, "app_name": x.instance_to.app_name } for x in destinations_available]
 
@@ -1368,68 +837,53 @@ def available_destinations(request, id):
 
     return JsonResponse(data=data)
 
+@instance_api_view("GET")
+@condition(etag_func=topology_etag)
 def instance_info(request, id):
-    if (request.method != "GET"):
-        return HttpResponseNotAllowed(["GET"])
-
-    request_api_token = request.headers.get("X-API-Token")
-
-    if not request_api_token:
-        return HttpResponseForbidden()
-
-    request_instance_queryset = AppInstanceModel.objects.filter(pk=id)
-
-    if len(request_instance_queryset) != 1:
-        return HttpResponseForbidden()
-
-    request_instance = request_instance_queryset[0]
-
-    if not request_instance:
-        return HttpResponseForbidden()
-
-    if request_instance.api_token != request_api_token:
-        return HttpResponseForbidden()
-
-    destinations_raw = AppConnectionModel.objects.filter(instance_from=request_instance)
+    # The instance may have been deleted after its token digest was cached
+    request_instance = get_object_or_404(AppInstanceModel.objects.select_related("location__owner_org"), pk=id)
+    owner_org = request_instance.location.owner_org
+    destinations_raw = AppConnectionModel.objects.filter(instance_from=request_instance).select_related("instance_to")
     destinations = [{ "id": x.instance_to.pk, "app_name": x.instance_to.app_name } for x in destinations_raw]
 
     data = {
         "id": request_instance.pk,
         "app_name": request_instance.app_name,
         "url_path": request_instance.url_path,
-        "app_title": request_instance.app_title,
         "owner_org": {
-            "id": request_instance.owner_org.pk,
-            "org_name": request_instance.owner_org.org_name
+            "id": owner_org.pk,
+            "org_name": owner_org.org_name
         },
         "transmit_destinations": destinations
     }
 
     return JsonResponse(data=data)
 
-@csrf_exempt
-def get_ssh_certificate(request, id):
-    if (request.method != "POST"):
-        return HttpResponseNotAllowed(["POST"])
-
-    request_api_token = request.headers.get("X-API-Token")
-
-    if not request_api_token:
-        return HttpResponseForbidden()
+async def topology_events(request, id):
+    # Server-Sent Events stream of destination changes. Only served through the ASGI
+    # application. Under WSGI, Django reads the whole stream before sending anything,
+    # so the request would never get a response.
+    if (request.method != "GET"):
+        return HttpResponseNotAllowed(["GET"])
 
-    request_instance_queryset = AppInstanceModel.objects.filter(pk=id)
+    api_token = request.headers.get("X-API-Token")
 
-    if len(request_instance_queryset) != 1:
+    if not await sync_to_async(is_valid_api_token)(id, api_token):
         return HttpResponseForbidden()
 
-    request_instance = request_instance_queryset[0]
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse("Event streams need the ASGI server. Poll available_destinations instead.", status=501)
 
-    if not request_instance:
-        return HttpResponseForbidden()
+    response = StreamingHttpResponse(topology_event_stream(int(id), api_token), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stops proxies like nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
 
-    if request_instance.api_token != request_api_token:
-        return HttpResponseForbidden()
+    return response
 
+@csrf_exempt
+@instance_api_view("POST")
+def get_ssh_certificate(request, id):
     try:
         data = json.loads(request.body)
     except json.JSONDecodeError:
@@ -1439,29 +893,14 @@ def get_ssh_certificate(request, id):
     if not public_key or len(public_key) == 0:
         return HttpResponseForbidden()
 
-    with tempfile.NamedTemporaryFile(mode='w+', delete=True) as pk_file:
-        pk_file.write(public_key)
-        pk_file.flush()
-
-        instance_ca_path = "./ssh/instance_ca"
-
-        run([
-            "ssh-keygen",
-            "-s", instance_ca_path,
-            "-I", id,
-            "-n", "remote",
-            "-V", "+5m",
-            pk_file.name
-        ], check=True)
-
-        cert_name = pk_file.name + "-cert.pub"
-        cert = ""
-
-        with open(cert_name, "r") as cert_file:
-            cert = cert_file.read()
-
-        if os.path.exists(cert_name):
-            os.remove(cert_name)
+    try:
+        cert = sign_public_key(public_key, str(id))
+    except CertificateAuthorityError as e:
+        print(f"Failed to sign SSH certificate for instance {id}: {e}")
+        return HttpResponse(status=500)
+    except CertificateError as e:
+        print(f"Failed to sign SSH certificate for instance {id}: {e}")
+        return HttpResponseBadRequest(str(e))
 
     data = { "certificate": cert }
 
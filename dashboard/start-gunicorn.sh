@@ -0,0 +1,4 @@
+#!/bin/bash
+
+# Serves the ASGI application so instances can keep event streams open, see gunicorn.conf.py
+gunicorn -c gunicorn.conf.py
@@ -1,3 +1,51 @@
+// Polls a lifecycle job until it finishes and then calls on_finished with the job data
+function poll_job(job_id, on_finished, progress_element) {
+    fetch(`/job_status/${job_id}/`)
+    .then(response => response.json())
+    .then(job => {
+        if (job["finished"]) {
+            on_finished(job);
+            return;
+        }
+
+        if (progress_element && job["progress"]) {
+            progress_element.innerText = job["progress"];
+        }
+
+        setTimeout(() => poll_job(job_id, on_finished, progress_element), 1000);
+    });
+}
+
+// Starts a lifecycle job with the given URL and follows it until it's done
+function run_instance_job(url, status_span) {
+    fetch(url)
+    .then(response => {
+        // Only the job responses are JSON, error pages like 403 and 500 are HTML
+        if (!(response.headers.get("Content-Type") || "").startsWith("application/json")) {
+            throw new Error(`Failed to start the operation (${response.status}).`);
+        }
+
+        return response.json().then(job => ({ ok: response.ok, job: job }));
+    })
+    .then(({ ok, job }) => {
+        if (!ok) {
+            alert(job["error"] ? job["error"] : "Failed to start the operation.");
+        }
+
+        poll_job(job["id"], finished_job => {
+            if (finished_job["status"] == "FAILED") {
+                alert(finished_job["message"]);
+            }
+
+            window.location = "/";
+        }, status_span);
+    })
+    .catch(error => {
+        alert(error.message);
+        window.location = "/";
+    });
+}
+
 function call_stop_instance(app_name) {
     if (!confirm(`Are you sure you want to stop instance "${app_name}"? Mounted data will be preserved.`)) {
         return;
@@ -111,10 +159,7 @@ function call_recreate_instance(app_name) {
         recreate_button.disabled = true;
     }
 
-    fetch(`/recreate_instance/${app_name}`)
-    .then(response => {
-        window.location = "/";
-    });
+    run_instance_job(`/recreate_instance/${app_name}/`, status_span);
 }
 
 function call_restart_instance(app_name) {
@@ -130,10 +175,7 @@ function call_restart_instance(app_name) {
         restart_button.disabled = true;
     }
 
-    fetch(`/restart_instance/${app_name}`)
-    .then(response => {
-        window.location = "/";
-    });
+    run_instance_job(`/restart_instance/${app_name}/`, status_span);
 }
 
 function call_remove_instance(app_name) {
@@ -157,3 +199,48 @@ function call_forget_instance(app_name) {
         window.location = "/";
     });
 }
+
+// Runs an action for every instance matching the selector, e.g. { location: 1 }
+function call_bulk_instance_action(action, selector) {
+    if (!confirm(`Are you sure you want to ${action} all matching instances?`)) {
+        return;
+    }
+
+    let csrf_token = document.querySelector("[name=csrfmiddlewaretoken]").value;
+
+    fetch("/bulk_instance_action/", {
+        method: "POST",
+        headers: { "Content-Type": "application/json", "X-CSRFToken": csrf_token },
+        body: JSON.stringify(Object.assign({ action: action }, selector))
+    })
+    .then(response => {
+        if (!response.ok) {
+            return response.text().then(error => { throw new Error(error); });
+        }
+
+        return response.json();
+    })
+    .then(data => {
+        // Each instance has its own job, the summary is shown once all of them have finished
+        let finished_jobs = data["jobs"].map(job => new Promise(resolve => poll_job(job["id"], resolve)));
+
+        return Promise.all(finished_jobs).then(jobs => ({ jobs: jobs, skipped: data["skipped"] }));
+    })
+    .then(({ jobs, skipped }) => {
+        let failures = jobs
+            .filter(job => job["status"] == "FAILED")
+            .map(job => `${job["app_name"]}: ${job["message"]}`)
+            .concat(skipped.map(result => `${result["app_name"]}: ${result["message"]}`));
+
+        let succeeded = jobs.length - jobs.filter(job => job["status"] == "FAILED").length;
+        let summary = `${succeeded} succeeded, ${failures.length} failed.`;
+
+        if (failures.length > 0) {
+            summary += "\n\n" + failures.join("\n");
+        }
+
+        alert(summary);
+        window.location.reload();
+    })
+    .catch(error => alert(error.message));
+}
@@ -5,11 +5,13 @@ L.tileLayer('https://tile.openstreetmap.org/{z}/{x}/{y}.png', {
     attribution: '&copy; <a href="http://www.openstreetmap.org/copyright">OpenStreetMap</a>'
 }).addTo(map);
 
-// Assume the template defines locations and connections
-locations.forEach(location => {
+const map_layer = L.layerGroup().addTo(map);
+const edge_colors = { "running": "green", "partial": "orange", "down": "red" };
+
+function get_location_popup(location) {
     let name = location["location_name"];
-    let lat = parseFloat(location["latitude"]);
-    let lng = parseFloat(location["longitude"]);
+    let lat = location["latitude"];
+    let lng = location["longitude"];
     let info = location["info"];
     let code = location["code"];
     let status = location["status"];
@@ -28,11 +30,46 @@ locations.forEach(location => {
         apps_string = "No apps in this location."
     }
 
-    L.marker([lat, lng]).addTo(map)
-        .bindPopup(`<strong>${name}</strong>${code_string}<br>Status: ${status}<br>${lat}, ${lng}<br>${info_string}${apps_string}`);
-});
+    return `<strong>${name}</strong>${code_string}<br>Status: ${status}<br>${lat}, ${lng}<br>${info_string}${apps_string}`;
+}
+
+// Assume the template defines map_data_url
+function load_map_data() {
+    let params = new URLSearchParams({
+        zoom: map.getZoom(),
+        bbox: map.getBounds().toBBoxString(),
+        color_by_status: 1
+    });
+
+    fetch(`${map_data_url}?${params}`)
+        .then(response => response.json())
+        .then(data => {
+            map_layer.clearLayers();
+
+            data["edges"].forEach(edge => {
+                // Connections between the same clusters are drawn as one line that gets thicker
+                let weight = 2 + Math.log2(edge["weight"]);
+                L.polyline([edge["from"], edge["to"]], { color: edge_colors[edge["status"]], weight: weight })
+                    .bindTooltip(`${edge["weight"]} connection(s)`)
+                    .addTo(map_layer);
+            });
+
+            data["clusters"].forEach(cluster => {
+                let lat_lng = [cluster["latitude"], cluster["longitude"]];
+
+                if (cluster["location"]) {
+                    L.marker(lat_lng).addTo(map_layer)
+                        .bindPopup(get_location_popup(cluster["location"]));
+                    return;
+                }
+
+                L.circleMarker(lat_lng, { radius: 10 + Math.log2(cluster["location_count"]) * 3 })
+                    .bindTooltip(`${cluster["location_count"]} locations, ${cluster["app_count"]} apps`)
+                    .on("click", () => map.setView(lat_lng, map.getZoom() + 2))
+                    .addTo(map_layer);
+            });
+        });
+}
 
-connections.forEach(connection => {
-    var polyLine = L.polyline(connection, { color: "red" });
-    polyLine.addTo(map);
-});
+map.on("moveend", load_map_data);
+load_map_data();